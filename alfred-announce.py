@@ -26,9 +26,29 @@ Hinweis(e):
   - Konfigurationsverzeichnis: /etc/alfred
     /etc/alfred/statics.json
 
-TODO
-  - Items aus Redis holen
-  - Ausgabe von "batctl if" auswerten
+Items können statt einer Funktion ('exec') eine Redis-Quelle ('redis')
+haben, siehe ffpi.redisstore. So werden Werte angezeigt, die andere
+Programme ermitteln (z.B. die Tunnel von fastd2redis.py). Alle fälligen
+Redis-Items eines Durchlaufs werden zusammen mit einer Pipeline geholt.
+Redis wird nur mit -r <host>:<port> verwendet, sonst entfallen diese
+Items.
+
+Ein Prozeß kann mehrere Sites (Communities) bedienen, jede mit eigenem
+batman-Interface, eigener fastd-Instanz und eigenem alfred-Socket:
+  -s <sitecode>:<meshif>[:<fastd-instanz>[:<alfred-socket>]]
+Items, die vom Mesh abhängen (Tabelle site_item), werden je Site
+ermittelt, alle anderen (Speicher, Last, CPU, ...) nur einmal und für
+alle Sites verwendet. Jede Site bekommt ihre eigenen Nutzdaten, die
+statischen Daten aus /etc/alfred/statics.json werden dazu mit denen aus
+/etc/alfred/statics-<sitecode>.json überlagert, falls vorhanden.
+
+Im Daemon-Modus beantwortet der Prozeß auch passive Zabbix-Checks aus
+dem Item-Zwischenspeicher (siehe ffpi.zabbix), über TCP (zabbix_listen)
+und den Unix-Socket zabbix_socket (für zabbix/ffpi-get). Schlüssel:
+  <item>[<sitecode>,<pfad>]   z.B. statistics.leases,
+                              statistics.peers[ffpi],
+                              statistics.traffic[ffpi,rx.bytes]
+Bei nur einer Site kann der Sitecode entfallen.
 
 Änderungsprotokoll
 ==================
@@ -41,31 +61,56 @@ Version  Datum       Änderung(en)                                           von
 0.4      2017-02-10  Communityunabhängig durch sitecode als Einstellung     tho
 0.5      2022-10-05  Umbau auf python3 für Einsatz unter Debian 11          tho
 0.6      2023-01-02  -m bei batctl deprecated: durch meshif ersetzt         tho
+0.7      2026-10-16  Daemon-Modus mit Item-Intervallen und Zwischenspeicher
+0.8      2026-10-17  Übertragung direkt über den Unix-Socket von alfred
+0.9      2026-10-17  Items parallel ermitteln, Timeout je Item
+0.10     2026-10-17  Metriken für Prometheus und Zabbix, Profiling (-p)
+0.11     2026-10-17  Rechnereigenschaften ohne externe Programme ermitteln
+0.12     2026-10-17  Verkehrszähler per ioctl, mit Raten
+0.13     2026-10-17  batman-adv über Netlink statt batctl abfragen
+0.14     2026-10-17  fastd-Status stückweise einlesen (ffpi.fastd)
+0.15     2026-10-17  Items aus Redis holen
+0.16     2026-10-17  Mehrere Sites (meshif, fastd-Instanz) in einem Prozeß
+0.17     2026-10-17  Zabbix-Agent im Daemon, Item für Zustand des Exit-VPN
+0.18     2026-10-17  Alle Exit-VPNs parallel im Hintergrund prüfen
+0.19     2026-10-17  Redis nur noch auf Wunsch (-r)
 
 """
 
 import os
 import sys
-import glob
 import platform
 import getopt
 import signal
-import daemon
 from collections import defaultdict
 from collections.abc import Mapping
 import json
+import copy
 import subprocess
 import socket
-import zlib
 import time
+import queue
 import logging
-import re
-import datetime
 import functools
+import concurrent.futures
+
+from ffpi.leases import LeaseTracker
+from ffpi.alfred import AlfredClient, PayloadCache
+from ffpi.metrics import Metrics
+from ffpi.util import write_atomic
+from ffpi.hostfacts import HostFacts
+from ffpi.traffic import TrafficSampler
+from ffpi.batadv import Batadv
+from ffpi.fastd import query_all, instance_socket
+from ffpi.redisstore import RedisStore
+from ffpi.zabbix import AgentServer
+from ffpi.exitvpn import ExitProber, TARGETS, autostart, openvpn_running
+
+log = logging.getLogger()
 
 __author__ = "Thomas Hooge"
 __copyright__ = "Public Domain"
-__version__ = "0.6"
+__version__ = "0.19"
 __email__ = "thomas@hoogi.de"
 __status__ = "Development"
 
@@ -74,10 +119,32 @@ cfg = {
     'loglevel': 2,
     'pidfile': '/var/run/alfred-announced.pid',
     'daemon': False,
+    'interval': 60,
+    'statics': '/etc/alfred/statics.json',
     'user': '',
     'group': 'zabbix',
     'interface': 'bat0',
-    'sitecode': 'ffpi'
+    'alfred_socket': '/var/run/alfred.sock',
+    'compresslevel': 6,
+    'refresh': 300,
+    'workers': 4,
+    'timeout': 10,
+    'metrics_prometheus': '/var/lib/prometheus/node-exporter/alfred-announce.prom',
+    'metrics_zabbix': '/var/run/alfred-announced.metrics',
+    'profile': None,
+    'factsfile': '/var/cache/ffpi/hostfacts.json',
+    'traffic_interval': 5,
+    'traffic_samples': 12,
+    # (host, port) des Redis-Clusters, None: keine Redis-Items
+    'redis': None,
+    'redis_ttl': 600,
+    'zabbix_listen': ('127.0.0.1', 10070),
+    'zabbix_socket': '/var/run/ffpi/zabbix.sock',
+    'exitvpn_targets': TARGETS,
+    'exitvpn_interval': 10,
+    'sitecode': 'ffpi',
+    # Liste von Site-Objekten, ohne -s nur sitecode/interface von oben
+    'sites': []
 }
 
 # Definition der auszulesenden Meßwerte
@@ -91,11 +158,42 @@ cfg = {
 #     - Traffic
 #
 
-def call(cmdnargs):
-    output =  subprocess.check_output(cmdnargs)
+def call(cmdnargs, timeout=None):
+    # Ohne Angabe gilt das Standard-Timeout für Items, damit ein
+    # hängendes Programm keinen Worker dauerhaft blockiert
+    if timeout is None:
+        timeout = cfg['timeout']
+    output =  subprocess.check_output(cmdnargs, timeout=timeout)
     lines = [line.decode("utf-8") for line in output.splitlines()]
     return lines
 
+class Site(object):
+    """
+    Ein Mesh dieses Rechners mit den zugehörigen Zugriffsobjekten:
+    batman-adv über Netlink (siehe ffpi.batadv) und Verkehrszähler des
+    Mesh-Interfaces (siehe ffpi.traffic).
+    """
+
+    def __init__(self, sitecode, interface, instance=None, alfred_socket=None):
+        self.sitecode = sitecode
+        self.interface = interface
+        self.instance = instance or sitecode
+        self.alfred_socket = alfred_socket or cfg['alfred_socket']
+        self.batadv = Batadv(interface)
+        self.traffic = TrafficSampler(interface, cfg['traffic_samples'])
+
+    @classmethod
+    def parse(cls, spec):
+        # <sitecode>:<meshif>[:<fastd-instanz>[:<alfred-socket>]]
+        parts = spec.split(':', 3)
+        if len(parts) < 2 or not all(parts[:2]):
+            raise ValueError("invalid site {!r}".format(spec))
+        return cls(*[part or None for part in parts])
+
+# Selten veränderliche Werte, zwischengespeichert über Programmaufrufe
+# hinweg (siehe ffpi.hostfacts)
+facts = HostFacts(cfg['factsfile'])
+
 def fn_dummy():
     return 'n/a'
 
@@ -107,17 +205,16 @@ def fn_node_hostname():
 def fn_node_vpn():
     return True
 
-def fn_node_net_mac():
-     return open('/sys/class/net/{0}/address'.format(cfg['interface'])).read().strip()
+def fn_node_net_mac(site):
+     return open('/sys/class/net/{0}/address'.format(site.interface)).read().strip()
 
-def fn_node_net_mesh_ifaces():
+def fn_node_net_mesh_ifaces(site):
     # TODO!
     # Eigentlich:
     # "network": { "mesh": { "bat0": { "interfaces": { "tunnel": [ ...
     # Die Stelle mit "bat0" müßte dynamisch aufgrund der Interfaces
     # zusammengebaut werden
-    return [open('/sys/class/net/' + iface + '/address').read().strip()
-            for iface in map(lambda line: line.split(':')[0], call(['batctl', 'meshif', cfg['interface'], 'if']))]
+    return [hardif.address for hardif in site.batadv.hardifs()]
 
 def fn_exitvpn_provider():
     """ 
@@ -128,14 +225,10 @@ def fn_exitvpn_provider():
     Fehlerfall 'n/a' zurückgeliefert. Das kommt z.B. vor, wenn 
     gar kein  OpenVPN installiert ist.
     """
-    try:
-        for line in open('/etc/default/openvpn'):
-            if line.startswith('AUTOSTART='):
-                k, v = line.split("=")
-                return v.strip('"\n')
-    except IOError:
-        pass
-    return 'n/a'
+    names = autostart()
+    if names is None:
+        return 'n/a'
+    return ' '.join(names)
 
 def fn_exitvpn_country():
     """
@@ -150,39 +243,52 @@ def fn_exitvpn_country():
             return v.strip('\n')
     return '??'
 
+# Exit-VPNs, im Daemon-Modus regelmäßig im Hintergrund geprüft
+# (siehe ffpi.exitvpn)
+exitvpn = ExitProber(targets=cfg['exitvpn_targets'])
+
+def fn_exitvpn_state():
+    """
+    Funktioniert das Exit-VPN? (vormals zabbix/exitvpn.state)
+    1: OpenVPN läuft, es wird auf das Interface eines Exits maskiert
+       und der Exit ist nach den letzten Prüfungen funktionsfähig
+    0: sonst
+    """
+    if not exitvpn.running:
+        # state und status teilen sich eine Prüfrunde
+        exitvpn.probe(max_age=30)
+    e = exitvpn.active()
+    if e is None or not openvpn_running():
+        return 0
+    return 1 if exitvpn.healthy(e.name) else 0
+
+def fn_exitvpn_status():
+    # Laufzeit und Verlust aller Exits sowie der beste Exit
+    if not exitvpn.running:
+        exitvpn.probe(max_age=30)
+    best = exitvpn.best()
+    return {'exits': exitvpn.status(), 'best': best.name if best else None}
+
 def fn_batman_version():
     return open('/sys/module/batman_adv/version').read().strip()
 
 def fn_fastd_enabled():
-    """
-    Prüfe, ob das init-script existiert und in rc.d aktiviert ist
-    - aktuellen Runlevel ermitteln
-    - suche einen passenden Link im RC-Verzeichnis
-    - prüfe, ob das Script tatsächlich existiert
-    """
-    runlevel = int(call(['runlevel'])[0].split(' ')[1])
-    #fname = glob.glob("/etc/rc%d.d/S??fastd" % runlevel)
-    fname = glob.glob("/etc/rc{:02d}.d/S??fastd".format(runlevel))
-    if not fname:
-        return False
-    return os.path.isfile(fname[0])
+    # Prüfe, ob das init-script existiert und in rc.d aktiviert ist
+    return facts.fastd_enabled()
 
 def fn_fastd_version():
-    return call(['fastd', '-v'])[0].split(' ')[1]
+    return facts.fastd_version()
 
-def fn_fastd_port():
-    for line in open('/etc/fastd/{0}/fastd.conf'.format(cfg['sitecode'])):
+def fn_fastd_port(site):
+    for line in open('/etc/fastd/{0}/fastd.conf'.format(site.instance)):
         if line.startswith('bind'):
             return line.split(":")[1].rstrip(";\n")
 
 def fn_firmware_base():
-    return call(['lsb_release','-is'])[0]
+    return facts.firmware_base()
 
 def fn_firmware_release():
-    if fn_firmware_base() == 'Debian':
-        return call(['cat','/etc/debian_version'])[0]
-    else:
-        return call(['lsb_release','-rs'])[0]
+    return facts.firmware_release()
 
 def fn_idletime():
     return float(open('/proc/uptime').read().split(' ')[1])
@@ -201,88 +307,63 @@ def fn_memory():
 def fn_processes():
     return dict(zip(('running', 'total'), map(int, open('/proc/loadavg').read().split(' ')[3].split('/'))))
 
-def fn_traffic():
-    # Ausgabe von ethtool auswerten für bat0
-    traffic = {'tx': {}, 'rx': {}, 'forward': {}, 'mgmt_tx': {} , 'mgmt_rx': {}}
-    for data in [line.strip() for line in call(['ethtool', '-S', 'bat0'])[1:]]: 
-        key, value = data.split(':')
-        if key.split('_')[0] in ['tx', 'rx', 'mgmt', 'forward']:
-            if not (key.endswith('_bytes') or key.endswith('_dropped')):
-                key += '_packets'
-            ix1, ix2 = key.rsplit('_', 1)
-            traffic[ix1][ix2] = int(value)
-    return traffic
+def fn_traffic(site):
+    # Zähler des Mesh-Interfaces, im Daemon-Modus mit Raten aus dem
+    # Ringpuffer
+    if not site.traffic.running:
+        site.traffic.sample()
+    return site.traffic.traffic()
 
 def fn_uptime():
     return float(open('/proc/uptime').read().split(' ')[0])
 
 def fn_hardware_model():
-    cpuinfo = call(['cat', '/proc/cpuinfo'])
-    for line in cpuinfo:
-        try:
-            key, value = line.split(':')
-        except:
-            continue
-        if key.strip() == "model name":
-            return ' '.join(value.split())
-    return ''
+    return facts.cpu_model()
 
 def fn_hardware_nproc():
-    return call(['nproc'])[0]
-
-def fn_fastd_peers():
-    # TODO fastd-Konfiguration auslesen /etc/fastd/<sitecode>/fastd.conf
-    # 1. fastd über Socket abfragen
-    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-    try:
-        client.connect('/var/run/fastd/{0}.sock'.format(cfg['sitecode']))
-    except socket.error:
-        return None
-    data = json.loads(client.makefile('r').read())
-    client.close()
-    # 2. Gateways ermitteln (MACs)
-    # deprecated
-    #with open('/sys/kernel/debug/batman_adv/{0}/gateways'.format(cfg['interface'])) as f:
-    #    lines = f.readlines()
-    lines = call(['batctl', 'meshif', cfg['interface'], 'gwl'])
-    gw_macs = set([gw[3:20] for gw in lines[1:]])
-    # 3. Ergebnis ermitteln
-    npeers = 0
-    for peer in data['peers'].values():
+    return facts.nproc()
+
+def fn_fastd_peers(site):
+    # 1. Gateways ermitteln (MACs)
+    gw_macs = site.batadv.gateway_macs()
+    # 2. fastd über Socket abfragen, die Peers werden beim Einlesen
+    #    gezählt und nicht aufbewahrt
+    npeers = [0]
+    def count(instance, key, peer):
         if peer['connection']:
             if not set(peer['connection']['mac_addresses']) & gw_macs:
-                npeers += 1
-    return npeers
+                npeers[0] += 1
+    instance = site.instance
+    result = query_all({instance: instance_socket(instance)}, cfg['timeout'], count)[0]
+    if result.error:
+        return None
+    return npeers[0]
+
+def fn_mesh_originators(site):
+    return site.batadv.originator_stats()
+
+def fn_mesh_neighbours(site):
+    return site.batadv.neighbour_stats()
+
+# Im Daemon-Modus werden nur neu angehängte Lease-Blöcke gelesen
+lease_tracker = LeaseTracker()
 
 def fn_dhcpd_leases():
-    regex_leaseblock = re.compile(r"lease (?P<ip>\d+\.\d+\.\d+\.\d+) {(?P<config>[\s\S]+?)\n}")
-    regex_properties = re.compile(r"\s+(?P<key>\S+) (?P<value>[\s\S]+?);")
-    leases = 0
-    with open("/var/lib/dhcp/dhcpd.leases") as lease_file:
-        macs = set()
-        for match in regex_leaseblock.finditer(lease_file.read()):
-             block = match.groupdict()
-             properties = {key: value for (key, value) in regex_properties.findall(block['config'])}
-             if properties['binding'].split(' ')[1] == 'active' and properties['ends'] != 'never':
-                 dt_ends = datetime.datetime.strptime(properties['ends'][2:], "%Y/%m/%d %H:%M:%S")
-                 if dt_ends > datetime.datetime.utcnow() and properties['hardware'].startswith('ethernet'):
-                     macs.add(properties['hardware'][9:])
-        leases = len(macs)
-    return leases
+    lease_tracker.update()
+    return lease_tracker.count()
 
 # Hinweis: Die durch Punkte getrennten Teilschlüssel müssen gültige 
 # PHP-Variablennamen sein.
+# Items für den ganzen Rechner
 item = {
     'node.hostname': { 'interval': 3600, 'exec': fn_node_hostname },
     'node.vpn': { 'interval': 3600, 'exec': fn_node_vpn },
-    'node.network.mac': { 'interval': 3600, 'exec': fn_node_net_mac },
-    'node.network.mesh_interfaces': { 'interval': 3600, 'exec': fn_node_net_mesh_ifaces },
     'node.network.exitvpn.provider': { 'interval': 3600, 'exec': fn_exitvpn_provider },
     'node.network.exitvpn.country': { 'interval': 3600, 'exec': fn_exitvpn_country },
+    'node.network.exitvpn.state': { 'interval': 60, 'exec': fn_exitvpn_state },
     'node.software.batman_adv.version': { 'interval': 3600, 'exec': fn_batman_version },
     'node.software.fastd.version': { 'interval': 3600, 'exec': fn_fastd_version },
     'node.software.fastd.enabled': { 'interval': 60, 'exec': fn_fastd_enabled },
-    'node.software.fastd.port': { 'interval': 3600, 'exec': fn_fastd_port },
     'node.software.firmware.base': { 'interval': 3600, 'exec': fn_firmware_base },
     'node.software.firmware.release': { 'interval': 3600, 'exec': fn_firmware_release },
     'node.hardware.model': { 'interval': 3600, 'exec': fn_hardware_model },
@@ -291,20 +372,258 @@ item = {
     'statistics.loadavg': { 'interval': 60, 'exec': fn_loadavg },
     'statistics.memory': { 'interval': 60, 'exec': fn_memory },
     'statistics.processes': { 'interval': 60, 'exec': fn_processes },
-    'statistics.traffic': { 'interval': 60, 'exec': fn_traffic },
     'statistics.uptime': { 'interval': 60, 'exec': fn_uptime },
-    'statistics.peers': { 'interval': 60, 'exec': fn_fastd_peers },
     'statistics.leases': { 'interval': 60, 'exec': fn_dhcpd_leases },
+    'statistics.tunnels': { 'interval': 60, 'redis': ('scard', 'fastd:gate:{node_id}') },
+    'statistics.exitvpn': { 'interval': 60, 'exec': fn_exitvpn_status },
 }
 
-# Die Meßwerte nach Intervall gruppieren
-#items_by_interval = defaultdict(list)
-#for k, v  in item.iteritems():
-#    items_by_interval[v['interval']].append(k) 
-#print(items_by_interval)
+# Items je Site, die Funktionen bekommen das Site-Objekt übergeben
+site_item = {
+    'node.network.mac': { 'interval': 3600, 'exec': fn_node_net_mac },
+    'node.network.mesh_interfaces': { 'interval': 3600, 'exec': fn_node_net_mesh_ifaces },
+    'node.software.fastd.port': { 'interval': 3600, 'exec': fn_fastd_port },
+    'statistics.traffic': { 'interval': 60, 'exec': fn_traffic },
+    'statistics.peers': { 'interval': 60, 'exec': fn_fastd_peers },
+    'statistics.mesh.originators': { 'interval': 300, 'exec': fn_mesh_originators },
+    'statistics.mesh.neighbours': { 'interval': 300, 'exec': fn_mesh_neighbours },
+}
+
+def build_items(items, site_items, sites):
+    """
+    Gemeinsame Item-Tabelle für den ItemCache: Site-Items bekommen den
+    Schlüssel <item>@<sitecode>, damit alle Items eines Durchlaufs
+    zusammen im Thread-Pool laufen.
+    """
+    table = dict(items)
+    for site in sites:
+        for k, spec in site_items.items():
+            spec = dict(spec, exec=functools.partial(spec['exec'], site))
+            table['{}@{}'.format(k, site.sitecode)] = spec
+    return table
+
+def site_values(result, sitecode):
+    """
+    Werte für eine Site: gemeinsame Items plus die der Site, ohne den
+    Zusatz @<sitecode>
+    """
+    values = {}
+    for k, v in result.items():
+        name, sep, code = k.partition('@')
+        if not sep:
+            values[k] = v
+        elif code == sitecode:
+            values[name] = v
+    return values
+
+class ItemCache(object):
+    """
+    Zwischenspeicher mit je einem Wert pro Item.
+    Die zugehörige Funktion wird erst dann wieder ausgeführt, wenn das
+    Intervall des Items abgelaufen ist.
+
+    Die fälligen Items werden parallel in einem Thread-Pool ermittelt.
+    Jedes Item hat ein eigenes Timeout (Schlüssel 'timeout' in der
+    Item-Tabelle, sonst das Standard-Timeout). Schlägt ein Item fehl
+    oder wird es nicht rechtzeitig fertig, bleibt der letzte gültige
+    Wert erhalten und das Item wird als veraltet (stale) markiert.
+
+    Items mit einer Redis-Quelle werden vorab gemeinsam über den
+    RedisStore geholt.
+
+    Werte, Zustand und Metriken werden nur im aufrufenden Thread
+    geändert. Verspätete Ergebnisse aus dem Pool landen in einer
+    Warteschlange und werden zu Beginn von update() übernommen.
+    """
+
+    def __init__(self, items, workers=4, timeout=10, metrics=None, store=None):
+        self.items = items
+        self.store = store
+        self.timeout = timeout
+        self.metrics = metrics
+        self.value = {}
+        self.expires = {}
+        self.stale = set()
+        self.running = {}
+        self.late = queue.SimpleQueue()
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def invalidate(self):
+        # Beim nächsten Aufruf von update() alles neu ermitteln
+        self.expires.clear()
+
+    def due(self, now):
+        return [k for k in self.items if self.expires.get(k, 0) <= now]
+
+    def _timeout(self, k):
+        return self.items[k].get('timeout', self.timeout)
+
+    def _run(self, k):
+        # Liefert (Wert, Fehler, Dauer); ausgewertet wird in update()
+        t0 = time.monotonic()
+        try:
+            return self.items[k]['exec'](), None, time.monotonic() - t0
+        except Exception as err:
+            return None, err, time.monotonic() - t0
+
+    def _result(self, k, now, value, err, duration):
+        if err is None:
+            self._success(k, value, duration)
+        else:
+            log.error("Item {} failed: {!r}".format(k, err))
+            self._failed(k, "failed", duration)
+            self.expires[k] = now
+
+    def _success(self, k, value, duration=None):
+        self.value[k] = value
+        self.stale.discard(k)
+        if self.metrics:
+            if duration is None:
+                self.metrics.set_stale(k, False)
+            else:
+                self.metrics.item(k, duration, True)
+
+    def _failed(self, k, reason, duration=None):
+        # Mit duration wird ein fehlgeschlagener Durchlauf gezählt,
+        # sonst nur der Zustand gesetzt
+        self.stale.add(k)
+        if self.metrics:
+            if duration is None:
+                self.metrics.set_stale(k, True)
+            else:
+                self.metrics.item(k, duration, False)
+        if k in self.value:
+            log.warning("Item {} {}, using last value".format(k, reason))
+        else:
+            log.warning("Item {} {}, no value available".format(k, reason))
+
+    def _late(self, k, future):
+        # Läuft im Thread des Pools, deshalb hier nur vormerken
+        value, err, duration = future.result()
+        self.late.put((k, value, err))
+
+    def collect_late(self):
+        """
+        Verspätete Ergebnisse übernehmen. Der Durchlauf ist mit dem
+        Timeout schon gezählt.
+        """
+        while True:
+            try:
+                k, value, err = self.late.get_nowait()
+            except queue.Empty:
+                return
+            del self.running[k]
+            if err is None:
+                self._success(k, value)
+
+    def _update_redis(self, keys, now):
+        sources = {k: self.items[k]['redis'] for k in keys}
+        for k in keys:
+            self.expires[k] = now + self.items[k]['interval']
+        t0 = time.monotonic()
+        values = {}
+        if self.store is not None:
+            try:
+                values = self.store.fetch(sources)
+            except Exception as err:
+                log.error("Redis items failed: {!r}".format(err))
+        duration = time.monotonic() - t0
+        if self.metrics:
+            self.metrics.add('redis', duration)
+        for k in keys:
+            if k in values:
+                self._success(k, values[k])
+            else:
+                self._failed(k, "not available from redis")
+                self.expires[k] = now
+
+    def update(self, now=None, inline=False):
+        """
+        Fällige Items ermitteln. Mit inline=True werden die Items
+        nacheinander im aufrufenden Thread ausgeführt, ohne Timeout
+        (für das Profiling).
+        """
+        if now is None:
+            now = time.monotonic()
+        self.collect_late()
+        due = self.due(now)
+        redis_keys = [k for k in due if 'redis' in self.items[k]]
+        if redis_keys:
+            self._update_redis(redis_keys, now)
+            due = [k for k in due if 'redis' not in self.items[k]]
+        if inline:
+            for k in due:
+                self.expires[k] = now + self.items[k]['interval']
+                self._result(k, now, *self._run(k))
+            return self.value
+        start = time.monotonic()
+        pending = {}
+        for k in due:
+            if k in self.running:
+                # Hängt noch vom letzten Mal, nicht erneut starten
+                self._failed(k, "still running")
+                continue
+            future = self.pool.submit(self._run, k)
+            self.running[k] = future
+            pending[future] = k
+            self.expires[k] = now + self.items[k]['interval']
+        while pending:
+            t = time.monotonic()
+            for future, k in list(pending.items()):
+                if future.done():
+                    del pending[future]
+                    del self.running[k]
+                    self._result(k, now, *future.result())
+                elif start + self._timeout(k) <= t:
+                    del pending[future]
+                    self._failed(k, "timed out", t - start)
+                    self.expires[k] = now
+                    # Erst danach, ein inzwischen fertiges Ergebnis
+                    # wird sofort übernommen
+                    future.add_done_callback(functools.partial(self._late, k))
+            if pending:
+                deadline = min(start + self._timeout(k) for k in pending.values())
+                concurrent.futures.wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                                        return_when=concurrent.futures.FIRST_COMPLETED)
+        return self.value
+
+class Statics(object):
+    """
+    Statische Daten aus /etc/alfred/statics.json
+    Die Datei wird nur dann neu gelesen, wenn sich ihre mtime geändert
+    hat oder das Neuladen erzwungen wird (SIGHUP).
+    """
+
+    @staticmethod
+    def site_filename(filename, sitecode):
+        # /etc/alfred/statics.json -> /etc/alfred/statics-ffpi.json
+        base, ext = os.path.splitext(filename)
+        return "{}-{}{}".format(base, sitecode, ext)
 
-#for i in items_by_interval:
-#    print(i)
+    def __init__(self, filename):
+        self.filename = filename
+        self.mtime = None
+        self.data = {}
+
+    def load(self, force=False):
+        try:
+            mtime = os.stat(self.filename).st_mtime
+        except OSError:
+            self.mtime = None
+            self.data = {}
+            return self.data
+        if force or mtime != self.mtime:
+            self.mtime = mtime
+            try:
+                with open(self.filename, 'r') as fh:
+                    self.data = json.load(fh)
+            except IOError:
+                self.data = {}
+            except ValueError:
+                self.data = {}
+                log.error("Syntax error in statics file, import failed")
+            log.info("Statische Daten aus {} geladen".format(self.filename))
+        return self.data
 
 # Datenstruktur zum Übertragen an Alfred.
 # Wir nehmen die optimale Variante, ggf. ist das *nicht*
@@ -342,12 +661,209 @@ def set_loglevel(nr):
         level = logging.INFO
     return level
 
+class Announcer(object):
+    """
+    Ein Durchlauf besteht aus Sammeln der fälligen Items, Aufbereiten
+    und Übertragen an alfred sowie Schreiben der Metriken.
+    Gesammelt wird einmal für alle Sites, aufbereitet und übertragen
+    je Site an deren alfred-Socket.
+    """
+
+    def __init__(self, items, site_items, sites):
+        self.sites = sites
+        self.metrics = Metrics()
+        self.alfred = {}
+        self.payloads = {}
+        self.site_statics = {}
+        self.statics = Statics(cfg['statics'])
+        for site in sites:
+            self.alfred[site.sitecode] = AlfredClient(site.alfred_socket)
+            self.payloads[site.sitecode] = PayloadCache(cfg['compresslevel'], cfg['refresh'], self.metrics)
+            self.site_statics[site.sitecode] = Statics(Statics.site_filename(cfg['statics'], site.sitecode))
+        table = build_items(items, site_items, sites)
+        store = None
+        if cfg['redis']:
+            node = self.statics.load().get('node', {})
+            node_id = node.get('node_id') if isinstance(node, Mapping) else None
+            store = RedisStore(*cfg['redis'], ttl=cfg['redis_ttl'],
+                               keyargs={'node_id': node_id or socket.gethostname()})
+        else:
+            # Ohne Redis gibt es die Items nicht, statt sie bei jedem
+            # Durchlauf als fehlgeschlagen zu melden
+            table = {k: spec for k, spec in table.items() if 'redis' not in spec}
+        self.cache = ItemCache(table, cfg['workers'], cfg['timeout'], self.metrics, store)
+        self.reload = False
+        self.profile = cfg['profile']
+
+    def statics_for(self, site):
+        # Gemeinsame statische Daten, überlagert mit denen der Site
+        data = self.statics.load(force=self.reload)
+        extra = self.site_statics[site.sitecode].load(force=self.reload)
+        if not extra:
+            return data
+        data = copy.deepcopy(data)
+        merge_dict(data, extra)
+        return data
+
+    def announce_site(self, site, values, now=None):
+        # Daten für Alfred aufbereiten, wir verwenden gzip
+        data = dot_to_json(values)
+
+        # Zumischen der statischen Daten
+        merge_dict(data, self.statics_for(site))
+
+        # Aufteilen in die jew. Datentypen, unveränderte Knoteninfos
+        # werden nur gelegentlich erneut übertragen
+        payloads = self.payloads[site.sitecode]
+        send = {}
+        for datatype, key in ((158, 'node'), (159, 'statistics')):
+            blob = payloads.get(datatype, data[key], now)
+            if blob is not None:
+                send[datatype] = blob
+
+        # Knoteninfos und Statistik übertragen
+        with self.metrics.stage('send'):
+            errors = self.alfred[site.sitecode].push_many(send)
+        for datatype, err in errors.items():
+            payloads.invalidate(datatype)
+            log.error("{}: {}".format(site.sitecode, err))
+
+    def announce(self, result, now=None):
+        for site in self.sites:
+            self.announce_site(site, site_values(result, site.sitecode), now)
+        self.reload = False
+
+    def lookup(self, name, params):
+        """
+        Wert für den Zabbix-Agenten: name ist der Item-Schlüssel,
+        params ggf. Sitecode und Pfad innerhalb eines Dictionaries
+        """
+        if name == 'agent.ping':
+            return 1
+        if name == 'agent.version':
+            return __version__
+        values = self.cache.value
+        sitecode = params[0] if params else ''
+        if sitecode:
+            key = '{}@{}'.format(name, sitecode)
+        elif name not in values and len(self.sites) == 1:
+            key = '{}@{}'.format(name, self.sites[0].sitecode)
+        else:
+            key = name
+        value = values[key]
+        if len(params) > 1 and params[1]:
+            for part in params[1].split('.'):
+                value = value[part]
+        return value
+
+    def write_metrics(self):
+        for filename, text in ((cfg['metrics_prometheus'], self.metrics.prometheus),
+                               (cfg['metrics_zabbix'], self.metrics.zabbix)):
+            if not filename:
+                continue
+            try:
+                write_atomic(filename, text())
+            except OSError as err:
+                log.debug("Cannot write metrics to {}: {}".format(filename, err))
+
+    def _cycle(self, now, inline=False):
+        self.metrics.begin_cycle()
+        with self.metrics.stage('collect'):
+            result = self.cache.update(now, inline)
+        with self.metrics.stage('announce'):
+            self.announce(result, now)
+        self.write_metrics()
+
+    def _profiled_cycle(self, now):
+        # Einmaliges Profiling, die Items laufen dazu im Hauptthread
+        import cProfile
+        import tracemalloc
+        tracemalloc.start()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            self._cycle(now, inline=True)
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            profiler.dump_stats(os.path.join(self.profile, 'alfred-announce.prof'))
+            snapshot.dump(os.path.join(self.profile, 'alfred-announce.tracemalloc'))
+            log.info("Profile written to {}".format(self.profile))
+            self.profile = None
+
+    def cycle(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        if self.profile:
+            self._profiled_cycle(now)
+        else:
+            self._cycle(now)
+
+    def run_daemon(self):
+        """
+        Dauerbetrieb: In jedem Durchlauf werden nur die fälligen Items
+        ermittelt, übertragen wird aber immer alles, damit Alfred die
+        Daten nicht vergißt.
+        SIGHUP lädt die statischen Daten neu, SIGUSR1 erstellt beim
+        nächsten Durchlauf ein Profil, falls ein Verzeichnis dafür
+        angegeben ist.
+        """
+        import daemon
+
+        def on_sighup(signum, frame):
+            self.reload = True
+
+        def on_sigusr1(signum, frame):
+            self.profile = cfg['profile']
+
+        context = daemon.DaemonContext(
+            files_preserve=[h.stream for h in log.handlers if hasattr(h, 'stream')],
+            signal_map={signal.SIGTERM: 'terminate', signal.SIGHUP: on_sighup,
+                        signal.SIGUSR1: on_sigusr1}
+        )
+        with context:
+            with open(cfg['pidfile'], 'w') as fh:
+                fh.write("{}\n".format(os.getpid()))
+            for site in self.sites:
+                site.traffic.start(cfg['traffic_interval'])
+            exitvpn.start(cfg['exitvpn_interval'])
+            agent = AgentServer(self.lookup, cfg['zabbix_listen'], cfg['zabbix_socket'], cfg['group'])
+            try:
+                agent.start()
+            except OSError as err:
+                log.error("Zabbix agent not started: {}".format(err))
+            try:
+                next_run = time.monotonic()
+                while True:
+                    t0 = time.monotonic()
+                    try:
+                        self.cycle(t0)
+                    except Exception:
+                        log.exception("Fehler im Durchlauf")
+                    log.debug("Benötigte Zeit: {:.3f} Sekunden".format(time.monotonic() - t0))
+                    next_run += cfg['interval']
+                    delay = next_run - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        # Durchlauf hat zu lange gedauert, nicht nachholen
+                        next_run = time.monotonic()
+            finally:
+                agent.stop()
+                os.unlink(cfg['pidfile'])
+
 def usage():
     print("Alfred Announce Daemon for Gateways")
     print("Version {}".format(__version__))
     print()
     print("Optionen")
     print("  -d Programm als Daemon laufen lassen")
+    print("  -i Übertragungsintervall im Daemon-Modus in Sekunden (Standard: {})".format(cfg['interval']))
+    print("  -p <dir> Profil (cProfile, tracemalloc) eines Durchlaufs in <dir> ablegen")
+    print("  -r <host>:<port> Items aus dem Redis-Cluster holen (z.B. 127.0.0.1:7000)")
+    print("  -s <sitecode>:<meshif>[:<fastd-instanz>[:<alfred-socket>]]")
+    print("     Site bedienen, mehrfach möglich (Standard: {}:{})".format(cfg['sitecode'], cfg['interface']))
     print()
 
 if __name__ == "__main__":
@@ -357,7 +873,7 @@ if __name__ == "__main__":
 
     # Kommandozeilenoptionen verarbeiten
     try:
-        opts, args = getopt.gnu_getopt(sys.argv[1:], "dh", ["daemon", "help"])
+        opts, args = getopt.gnu_getopt(sys.argv[1:], "dhi:p:r:s:", ["daemon", "help", "interval=", "profile=", "redis=", "site="])
     except getopt.GetoptError as err:
         print(str(err))
         sys.exit(2)   
@@ -365,9 +881,26 @@ if __name__ == "__main__":
         if opt in ("-h", "--help"):
             usage()
             sys.exit(1)
-        elif opt in ("-d", "daemon"):
-            daemon = true
-            break
+        elif opt in ("-d", "--daemon"):
+            cfg['daemon'] = True
+        elif opt in ("-i", "--interval"):
+            cfg['interval'] = int(arg)
+        elif opt in ("-p", "--profile"):
+            cfg['profile'] = arg
+        elif opt in ("-r", "--redis"):
+            host, sep, port = arg.rpartition(':')
+            if not sep or not port.isdigit():
+                print("Invalid redis address: {}".format(arg))
+                sys.exit(2)
+            cfg['redis'] = (host or '127.0.0.1', int(port))
+        elif opt in ("-s", "--site"):
+            try:
+                cfg['sites'].append(Site.parse(arg))
+            except ValueError as err:
+                print(str(err))
+                sys.exit(2)
+    if not cfg['sites']:
+        cfg['sites'].append(Site(cfg['sitecode'], cfg['interface']))
 
     # Protokollierung anschalten
     logging.basicConfig(level=logging.ERROR,
@@ -383,44 +916,22 @@ if __name__ == "__main__":
     else:
         log.disabled = True
 
-    # Zugeordnete Funktionen je Item ausführen
-    result = {}
-    for k, v in item.items():
-        result[k] = v['exec']()  
+    announcer = Announcer(item, site_item, cfg['sites'])
 
-    # Daten für Alfred aufbereiten, wir verwenden gzip
-    data = dot_to_json(result)
+    if cfg['daemon']:
+        announcer.run_daemon()
+        sys.exit(0)
 
-    # Zumischen der statischen Daten
-    try:
-        with open('/etc/alfred/statics.json', 'r') as fh:
-            statics = json.load(fh)
-    except IOError:
-        statics = {}
-    except ValueError:
-        statics = {}
-        print("Syntax error in statics file, import failed")
-    merge_dict(data, statics)
-
-    # Aufteilen in die jew. Datentypen
-    nodeinfo = data['node']
-    statistics = data['statistics']
-    
-    cnodeinfo = zlib.compress(bytes(json.dumps(nodeinfo), 'UTF-8'))
-    cstatistics = zlib.compress(bytes(json.dumps(statistics), 'UTF-8'))
-
-    # Knoteninfos übertragen
-    alfred = subprocess.Popen(['alfred', '-s', '158'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    streamdata = alfred.communicate(cnodeinfo)[0]
-    if alfred.returncode != 0:
-        print("Communication error with alfred: {}".format(streamdata))
-
-    # Statistik übertragen
-    alfred = subprocess.Popen(['alfred', '-s', '159'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    streamdata = alfred.communicate(cstatistics)[0]
-    if alfred.returncode != 0:
-        print("Communication error with alfred: {}".format(streamdata))
+    # Zugeordnete Funktionen je Item ausführen und übertragen
+    announcer.cycle()
 
     # Zeitmessung beenden
     tn = time.time()
     log.info("Benötigte Zeit: {:.2f} Minuten" .format((tn-t0)/60))
+
+    # Hängende Items nicht abwarten: die Threads des Pools würden beim
+    # Beenden des Interpreters eingesammelt
+    announcer.cache.collect_late()
+    if announcer.cache.running:
+        logging.shutdown()
+        os._exit(0)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Nodeinfo und Statistik aller Knoten im Mesh aus alfred einsammeln
+
+Gegenstück zu alfred-announce.py: die Datentypen 158 (nodeinfo) und
+159 (statistics) aller Knoten werden abgefragt und zu einem Stand
+zusammengeführt, der als kompaktes JSON für die Karte geschrieben wird
+(siehe ffpi.meshinfo). Neu entpackt und zerlegt werden nur die Knoten,
+deren Daten sich geändert haben.
+
+Ohne -w wird einmal abgefragt (z.B. per cron), mit -w in festen
+Abständen. Ausgegeben werden die Kennzahlen über das ganze Mesh, mit
+-j als JSON.
+
+Änderungsprotokoll
+==================
+
+Version  Datum       Änderung(en)                                           von
+-------- ----------- ------------------------------------------------------ ----
+0.1      2026-10-17  Erste Version
+
+"""
+
+import sys
+import json
+import time
+import getopt
+
+from ffpi.alfred import AlfredClient, AlfredError, ALFRED_SOCK
+from ffpi.meshinfo import MeshSnapshot, CACHEFILE, fetch
+
+__author__ = "Thomas Hooge"
+__copyright__ = "Public Domain"
+__version__ = "0.1"
+__email__ = "thomas@hoogi.de"
+__status__ = "Development"
+
+cfg = {
+    'socket': ALFRED_SOCK,
+    'output': '/var/www/html/meshinfo.json',
+    'cachefile': CACHEFILE,
+    'workers': None,
+    'interval': None,
+}
+
+def print_aggregates(aggregates, as_json=False):
+    if as_json:
+        print(json.dumps(aggregates, separators=(',', ':')))
+        return
+    print("%d nodes, %d clients" % (aggregates['nodes'], aggregates['clients']))
+    for mac, gw in sorted(aggregates['gateways'].items(), key=lambda g: str(g[1]['hostname'])):
+        print("Gateway %s (%s): %s peers" % (gw['hostname'], mac, gw['peers']))
+    for title, key in (("Firmware", 'firmware'), ("batman-adv", 'batman_adv')):
+        print("%s:" % title)
+        for version, count in sorted(aggregates[key].items(), key=lambda v: -v[1]):
+            print("  %5d  %s" % (count, version))
+
+def run_once(client, mesh, quiet=False, as_json=False):
+    try:
+        records = fetch(client)
+    except AlfredError as err:
+        print(err, file=sys.stderr)
+        return False
+    mesh.update(records)
+    if cfg['output']:
+        mesh.write(cfg['output'])
+    if cfg['cachefile']:
+        mesh.save(cfg['cachefile'])
+    if not quiet:
+        print_aggregates(mesh.aggregates(), as_json)
+        sys.stdout.flush()
+    return True
+
+def usage():
+    print("Collect nodeinfo and statistics of all mesh nodes from alfred")
+    print("Version {}".format(__version__))
+    print()
+    print("Options")
+    print(" -h               show this help")
+    print(" -j               JSON output")
+    print(" -q               no output")
+    print(" -s <socket>      alfred socket (default {})".format(cfg['socket']))
+    print(" -o <file>        snapshot for the map (default {})".format(cfg['output']))
+    print(" -c <file>        cache file (default {})".format(cfg['cachefile']))
+    print(" -P <workers>     processes for decompression (default: number of CPUs)")
+    print(" -w <seconds>     repeat at this interval")
+    print()
+
+if __name__ == '__main__':
+    as_json = False
+    quiet = False
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hjqs:o:c:P:w:",
+            ["help", "json", "quiet", "socket=", "output=", "cache=", "workers=", "watch="])
+    except getopt.GetoptError as err:
+        print(str(err))
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(1)
+        elif opt in ("-j", "--json"):
+            as_json = True
+        elif opt in ("-q", "--quiet"):
+            quiet = True
+        elif opt in ("-s", "--socket"):
+            cfg['socket'] = arg
+        elif opt in ("-o", "--output"):
+            cfg['output'] = arg
+        elif opt in ("-c", "--cache"):
+            cfg['cachefile'] = arg
+        elif opt in ("-P", "--workers"):
+            cfg['workers'] = int(arg)
+        elif opt in ("-w", "--watch"):
+            cfg['interval'] = float(arg)
+
+    client = AlfredClient(cfg['socket'])
+    mesh = MeshSnapshot(cfg['workers'])
+    if cfg['cachefile']:
+        mesh.load(cfg['cachefile'])
+    try:
+        if cfg['interval'] is None:
+            sys.exit(0 if run_once(client, mesh, quiet, as_json) else 1)
+        while True:
+            t0 = time.monotonic()
+            run_once(client, mesh, quiet, as_json)
+            time.sleep(max(cfg['interval'] - (time.monotonic() - t0), 0))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mesh.close()
@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Laufzeitmessungen für die ffpi-Werkzeuge
+
+Aufruf: bench.py [-j] [-n <durchläufe>] [-r <wiederholungen>]
+                 [-S <größen>] [-d <verzeichnis>] [name ...]
+
+Ohne Namen werden alle Messungen ausgeführt. Mit -j wird je Messung
+eine Zeile JSON ausgegeben, damit Ergebnisse verschiedener Versionen
+maschinell verglichen werden können.
+
+Es gibt zwei Arten von Messungen:
+  benchmark  Vergleich zweier Verfahren im selben Prozeß (-n Durchläufe)
+  scenario   Ein Programmteil gegen künstliche Testdaten (siehe
+             fixtures.py) in verschiedenen Größen (-S). Jede
+             Kombination aus Größe und Bezeichnung läuft in einem
+             eigenen Interpreter, damit der höchste Speicherbedarf
+             (peak RSS) nicht von anderen Messungen beeinflußt wird;
+             angegeben wird auch der Zuwachs während der Messung.
+             Gemessen werden der erste Aufruf (kalte Zwischenspeicher)
+             und der Mittelwert über -r weitere Aufrufe sowie die
+             Anzahl der dabei gestarteten Programme.
+
+Die Testdaten werden in einem temporären Verzeichnis erzeugt, mit -d
+in einem festen, wo sie für spätere Läufe erhalten bleiben.
+"""
+
+import os
+import sys
+import json
+import time
+import getopt
+import zlib
+import shutil
+import platform
+import resource
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from ffpi.alfred import AlfredClient, PayloadCache
+from ffpi.leases import count_dhcp_leases, LeaseTracker
+from ffpi.hostfacts import HostFacts
+from ffpi.traffic import TrafficSampler
+from ffpi.meshinfo import MeshSnapshot, fetch
+
+from fixtures import (fake_batadv, FakeEthtoolBackend, FakeFastd, FakeAlfred,
+                      FakeTree, RedisServer, load_script, write_leases)
+
+benchmarks = {}
+
+def benchmark(name):
+    def register(fn):
+        benchmarks[name] = fn
+        return fn
+    return register
+
+def sample_nodeinfo():
+    return {
+        'hostname': 'gate01', 'vpn': True,
+        'network': {'mac': '02:00:0a:89:00:01',
+                    'mesh_interfaces': ['02:00:0a:89:00:02', '02:00:0a:89:00:03'],
+                    'exitvpn': {'provider': 'mullvad', 'country': 'SE'}},
+        'software': {'batman_adv': {'version': '2023.3'},
+                     'fastd': {'version': 'v22', 'enabled': True, 'port': '10000'},
+                     'firmware': {'base': 'Debian', 'release': '12.7'}},
+        'hardware': {'model': 'Intel(R) Xeon(R) CPU E5-2620 v4 @ 2.10GHz', 'nproc': '4'},
+        'location': {'latitude': 53.66, 'longitude': 9.79},
+        'owner': {'contact': 'info@pinneberg.freifunk.net'},
+        'node_id': '02000a890001'
+    }
+
+def sample_statistics(i):
+    return {
+        'idletime': 1234567.8 + i, 'loadavg': 0.1 * (i % 7), 'uptime': 765432.1 + i * 60,
+        'memory': {'total': 4045032, 'free': 1234567 - i, 'buffers': 23456, 'cached': 345678},
+        'processes': {'running': 1 + i % 3, 'total': 150},
+        'traffic': {k: {'bytes': 10**9 + i * 12345, 'packets': 10**6 + i * 123, 'dropped': i}
+                    for k in ('tx', 'rx', 'forward', 'mgmt_tx', 'mgmt_rx')},
+        'peers': 300 + i % 11, 'leases': 900 + i % 17
+    }
+
+@benchmark('payload')
+def bench_payload(n):
+    """
+    Serialisieren und Komprimieren je Durchlauf (einmal je Minute):
+    bisheriges Verfahren gegenüber dem PayloadCache
+    """
+    nodeinfo = sample_nodeinfo()
+    stats = [sample_statistics(i) for i in range(n)]
+
+    t0 = time.process_time()
+    old_bytes = 0
+    for i in range(n):
+        for data in (nodeinfo, stats[i]):
+            old_bytes += len(zlib.compress(bytes(json.dumps(data), 'UTF-8')))
+    old_cpu = time.process_time() - t0
+
+    cache = PayloadCache()
+    t0 = time.process_time()
+    new_bytes = 0
+    for i in range(n):
+        for datatype, data in ((158, nodeinfo), (159, stats[i])):
+            blob = cache.get(datatype, data, i * 60)
+            if blob is not None:
+                new_bytes += len(blob)
+    new_cpu = time.process_time() - t0
+
+    return {
+        'cycles': n,
+        'old_bytes_per_cycle': old_bytes / n,
+        'new_bytes_per_cycle': new_bytes / n,
+        'old_cpu_us_per_cycle': old_cpu / n * 1e6,
+        'new_cpu_us_per_cycle': new_cpu / n * 1e6,
+        'compressions': cache.stats['compressed'],
+        'skipped': cache.stats['skipped']
+    }
+
+def measure(fn, repeat=1):
+    """
+    Laufzeit (Wanduhr und CPU) und höchster zusätzlicher
+    Speicherbedarf eines Aufrufs
+    """
+    t0, c0 = time.perf_counter(), time.process_time()
+    for i in range(repeat):
+        result = fn()
+    t1, c1 = time.perf_counter(), time.process_time()
+    # Speicher in einem eigenen Durchgang, tracemalloc bremst stark
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, (t1 - t0) / repeat, (c1 - c0) / repeat, peak
+
+@benchmark('originators')
+def bench_originators(n):
+    """
+    Kennzahlen der Originator-Tabelle (10000 Originatoren, je 3 Nachbarn):
+    Auswertung im Durchgang gegenüber dem Einlesen als Liste
+    """
+    bd = fake_batadv(originators=10000)
+    bd.originator_stats()
+    repeat = max(1, n // 1000)
+    stats, wall, cpu, peak = measure(bd.originator_stats, repeat)
+    records, lwall, lcpu, lpeak = measure(lambda: list(bd.originators()), repeat)
+    return {
+        'originators': stats['count'],
+        'records': len(records),
+        'stream_wall_ms': wall * 1e3,
+        'stream_cpu_ms': cpu * 1e3,
+        'stream_peak_kb': peak / 1024,
+        'list_wall_ms': lwall * 1e3,
+        'list_peak_kb': lpeak / 1024
+    }
+
+scenarios = {}
+
+def scenario(name, sizes):
+    """
+    fn(size, env) bereitet die Testdaten vor und liefert ein
+    Dictionary Bezeichnung -> aufzurufende Funktion
+    """
+    def register(fn):
+        scenarios[name] = (fn, sizes)
+        return fn
+    return register
+
+class Skip(Exception):
+    """
+    Messung ist hier nicht möglich (z.B. fehlendes Programm)
+    """
+
+class Environment(object):
+    """
+    Testdaten einer Messung im Arbeitsverzeichnis. Lease-Dateien werden
+    von allen Prozessen eines Laufs gemeinsam genutzt, alles übrige
+    gehört dem Prozeß und wird mit close() entfernt bzw. beendet.
+    """
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.stack = contextlib.ExitStack()
+
+    def private(self, name):
+        path = os.path.join(self.workdir, '{}-{}'.format(name, os.getpid()))
+        self.stack.callback(shutil.rmtree, path, True)
+        return path
+
+    def enter(self, context):
+        return self.stack.enter_context(context)
+
+    def start(self, server):
+        server.start()
+        self.stack.callback(server.stop)
+        return server
+
+    def leases(self, blocks):
+        filename = os.path.join(self.workdir, 'dhcpd-{}.leases'.format(blocks))
+        if not os.path.exists(filename):
+            tmpname = '{}.{}'.format(filename, os.getpid())
+            write_leases(tmpname, blocks)
+            os.rename(tmpname, filename)
+        return filename
+
+    def fastd(self, peers, instance='ffpi'):
+        sockdir = self.private('fastd')
+        os.makedirs(sockdir)
+        server = self.start(FakeFastd(os.path.join(sockdir, instance + '.sock'), peers))
+        return {instance: server.sockpath}
+
+    def tree(self, fastd=None, leases=0):
+        tree = FakeTree(self.private('root')).build(fastd=fastd)
+        if leases:
+            os.symlink(self.leases(leases), tree.root + '/var/lib/dhcp/dhcpd.leases')
+        return tree
+
+    def close(self):
+        self.stack.close()
+
+class SubprocessCounter(object):
+    """
+    Zählt die über das Modul subprocess gestarteten Programme
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    @contextlib.contextmanager
+    def active(self):
+        counter = self
+        popen = subprocess.Popen
+        class CountingPopen(popen):
+            def __init__(self, *args, **kwargs):
+                counter.count += 1
+                super().__init__(*args, **kwargs)
+        subprocess.Popen = CountingPopen
+        try:
+            yield self
+        finally:
+            subprocess.Popen = popen
+
+def maxrss():
+    """
+    Höchster Speicherbedarf des Prozesses in KiB. ru_maxrss wird über
+    fork und exec vererbt und zeigte im Kindprozeß den Wert von bench.py
+    selbst, VmHWM gilt dagegen nur für das aktuelle Programm.
+    """
+    try:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def invoke(fn):
+    try:
+        fn()
+    except (Exception, SystemExit) as err:
+        return "{}: {}".format(type(err).__name__, err)
+    return None
+
+def run_scenario(name, size, label, repeat, workdir):
+    """
+    Eine Messung im aktuellen Prozeß. Ohne label werden nur die
+    verfügbaren Bezeichnungen geliefert.
+    """
+    setup, sizes = scenarios[name]
+    env = Environment(workdir)
+    result = {'name': name, 'size': size, 'label': label}
+    try:
+        try:
+            calls = setup(size, env)
+        except Skip as err:
+            return dict(result, skipped=str(err))
+        if label is None:
+            return dict(result, labels=sorted(calls))
+        fn = calls[label]
+        counter = SubprocessCounter()
+        rss_base = maxrss()
+        with counter.active():
+            t0 = time.perf_counter()
+            error = invoke(fn)
+            first = time.perf_counter() - t0
+            first_procs = counter.count
+            t0, c0 = time.perf_counter(), time.process_time()
+            for i in range(repeat):
+                error = invoke(fn) or error
+            t1, c1 = time.perf_counter(), time.process_time()
+        rss_peak = maxrss()
+        result.update({
+            'first_ms': first * 1e3,
+            'wall_ms': (t1 - t0) / max(repeat, 1) * 1e3,
+            'cpu_ms': (c1 - c0) / max(repeat, 1) * 1e3,
+            'rss_base_kb': rss_base,
+            'rss_peak_kb': rss_peak,
+            'rss_delta_kb': rss_peak - rss_base,
+            'subprocesses': first_procs,
+            'subprocesses_repeat': (counter.count - first_procs) / max(repeat, 1),
+            'repeat': repeat,
+            'python': platform.python_version(),
+        })
+        if error:
+            result['error'] = error
+        return result
+    finally:
+        env.close()
+
+def run_isolated(name, size, label, repeat, workdir):
+    # Messung in einem neuen Interpreter, Ergebnis ist die letzte
+    # Zeile der Ausgabe
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', '-r', str(repeat),
+           '-d', workdir, name, str(size)] + ([label] if label else [])
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        return {'name': name, 'size': size, 'label': label,
+                'error': "benchmark process failed ({})".format(proc.returncode)}
+    return json.loads(lines[-1])
+
+@scenario('leases', (1000, 10000, 100000, 500000))
+def scenario_leases(size, env):
+    """
+    Aktive DHCP-Leases zählen
+    count_dhcp_leases() wie in dhcpd-leases.py und LeaseTracker wie in
+    alfred-announce.py
+    """
+    filename = env.leases(size)
+    tracker = LeaseTracker(filename)
+    def track():
+        tracker.update()
+        return tracker.count()
+    return {'count_dhcp_leases': lambda: count_dhcp_leases(filename),
+            'tracker': track}
+
+@scenario('fastd-status', (10, 100, 1000, 5000))
+def scenario_fastd_status(size, env):
+    """
+    main() von fastd-status.py gegen einen künstlichen fastd-Socket
+    """
+    instances = env.fastd(size)
+    env.enter(env.tree(fastd=instances).active())
+    module = load_script('fastd-status.py', 'fastd_status')
+    module.Batadv = lambda meshif: fake_batadv(originators=0)
+    def main(*argv):
+        def call():
+            sys.argv = ['fastd-status.py'] + list(argv)
+            with open(os.devnull, 'w') as fh, contextlib.redirect_stdout(fh):
+                module.main()
+        return call
+    return {'text': main(), 'json': main('-j')}
+
+@scenario('collectors', (10, 100, 1000, 5000))
+def scenario_collectors(size, env):
+    """
+    Items (fn_*) von alfred-announce.py
+    Jeweils size fastd-Peers und Originatoren sowie zehnmal so viele
+    Lease-Blöcke
+    """
+    instances = env.fastd(size)
+    tree = env.tree(fastd=instances, leases=size * 10)
+    env.enter(tree.active())
+    module = load_script('alfred-announce.py', 'alfred_announce')
+    module.facts = HostFacts(os.path.join(tree.root, 'hostfacts.json'))
+    site = module.Site('ffpi', 'lo', 'ffpi')
+    site.batadv = fake_batadv(originators=size)
+    site.traffic = TrafficSampler('lo', backend=FakeEthtoolBackend('lo'))
+    table = module.build_items(module.item, module.site_item, [site])
+    return {k: spec['exec'] for k, spec in table.items() if 'exec' in spec}
+
+@scenario('fastd2redis', (10, 100, 1000, 5000))
+def scenario_fastd2redis(size, env):
+    """
+    main() von fastd2redis.py gegen einen lokalen redis-server
+    """
+    reason = RedisServer.available()
+    if reason:
+        raise Skip(reason)
+    from redis.cluster import RedisCluster, ClusterNode
+    server = env.start(RedisServer(env.private('redis')))
+    instances = env.fastd(size)
+    env.enter(env.tree(fastd=instances).active())
+    rc = RedisCluster(startup_nodes=[ClusterNode('127.0.0.1', server.port)], decode_responses=True)
+    module = load_script('fastd2redis.py', 'fastd2redis')
+    statefile = os.path.join(env.private('state'), 'fastd2redis.json')
+    return {'main': lambda: module.main(rc, statefile, instances)}
+
+@scenario('alfred-mesh', (10, 100, 1000, 5000))
+def scenario_alfred_mesh(size, env):
+    """
+    Abfrage und Auswertung aller Knoten aus alfred (alfred-mesh.py)
+    Der erste Aufruf zerlegt alle Knoten, bei den folgenden hat sich
+    jeweils die Statistik eines Zehntels geändert. "inline" ohne,
+    "pool" mit Prozeß-Pool.
+    """
+    workdir = env.private('alfred')
+    os.makedirs(workdir)
+    server = env.start(FakeAlfred(os.path.join(workdir, 'alfred.sock'), size))
+    client = AlfredClient(server.sockpath)
+    output = os.path.join(workdir, 'meshinfo.json')
+    def collect(workers, threshold):
+        mesh = MeshSnapshot(workers, threshold)
+        env.stack.callback(mesh.close)
+        def call():
+            mesh.update(fetch(client))
+            mesh.write(output)
+        return call
+    return {'inline': collect(1, 0), 'pool': collect(None, 0)}
+
+def print_result(result):
+    if 'skipped' in result:
+        print("{:12s} {:>7} skipped: {}".format(result['name'], result['size'], result['skipped']))
+        return
+    line = "{:12s} {:>7} {:36s}".format(result['name'], result['size'], result['label'] or '')
+    if 'first_ms' in result:
+        line += " first {:9.2f} ms  mean {:9.2f} ms  rss {:7d} KiB (+{:d})  procs {}".format(
+            result['first_ms'], result['wall_ms'], result['rss_peak_kb'], result['rss_delta_kb'],
+            result['subprocesses'])
+    if 'error' in result:
+        line += "  ({})".format(result['error'])
+    print(line)
+
+def usage():
+    print("Benchmarks for ffpi tools")
+    print()
+    print("Usage: bench.py [-j] [-n <cycles>] [-r <repeat>] [-S <sizes>] [-d <dir>] [name ...]")
+    print()
+    print("Options")
+    print(" -j               JSON output, one line per measurement")
+    print(" -n <cycles>      cycles for benchmarks (default 1000)")
+    print(" -r <repeat>      repeated calls per scenario (default 5)")
+    print(" -S <sizes>       comma separated fixture sizes for scenarios")
+    print(" -d <dir>         keep fixtures in this directory (default: temporary)")
+    print()
+    print("Available benchmarks:")
+    for name, fn in sorted(benchmarks.items()):
+        print("  {:12s} {}".format(name, fn.__doc__.strip().splitlines()[0]))
+    print()
+    print("Available scenarios (sizes):")
+    for name, (fn, sizes) in sorted(scenarios.items()):
+        print("  {:12s} {} ({})".format(name, fn.__doc__.strip().splitlines()[0],
+                                        ', '.join(map(str, sizes))))
+    print()
+
+if __name__ == '__main__':
+    as_json = False
+    cycles = 1000
+    repeat = 5
+    sizes = None
+    workdir = None
+    child = False
+    try:
+        opts, args = getopt.gnu_getopt(sys.argv[1:], "hjn:r:S:d:",
+            ["help", "json", "repeat=", "sizes=", "dir=", "child"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(1)
+        elif opt in ("-j", "--json"):
+            as_json = True
+        elif opt == "-n":
+            cycles = int(arg)
+        elif opt in ("-r", "--repeat"):
+            repeat = int(arg)
+        elif opt in ("-S", "--sizes"):
+            sizes = [int(size) for size in arg.split(',')]
+        elif opt in ("-d", "--dir"):
+            workdir = arg
+        elif opt == "--child":
+            child = True
+
+    if child:
+        # Aufruf durch run_isolated(): name größe [bezeichnung]
+        result = run_scenario(args[0], int(args[1]), args[2] if len(args) > 2 else None,
+                              repeat, workdir)
+        print(json.dumps(result, separators=(',', ':')))
+        sys.exit(0)
+
+    for name in args:
+        if name not in benchmarks and name not in scenarios:
+            print("Unknown benchmark: {}".format(name), file=sys.stderr)
+            sys.exit(2)
+    names = args or sorted(benchmarks) + sorted(scenarios)
+
+    keep = workdir is not None
+    if not keep:
+        workdir = tempfile.mkdtemp(prefix='ffpi-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        for name in names:
+            if name in benchmarks:
+                result = benchmarks[name](cycles)
+                if as_json:
+                    print(json.dumps(dict(result, name=name), separators=(',', ':')))
+                else:
+                    print(name)
+                    for key, value in result.items():
+                        print("  {:24s} {:>12.1f}".format(key, value))
+                continue
+            for size in sizes or scenarios[name][1]:
+                listing = run_isolated(name, size, None, repeat, workdir)
+                results = [listing] if 'labels' not in listing else \
+                    [run_isolated(name, size, label, repeat, workdir) for label in listing['labels']]
+                for result in results:
+                    if as_json:
+                        print(json.dumps(result, separators=(',', ':')))
+                    else:
+                        print_result(result)
+                    sys.stdout.flush()
+    finally:
+        if not keep:
+            shutil.rmtree(workdir, True)
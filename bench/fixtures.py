@@ -0,0 +1,626 @@
+# -*- coding: utf-8 -*-
+
+"""
+Künstliche Testdaten für die Laufzeitmessungen
+
+Alle Daten werden aus einem festen Startwert für den Zufallsgenerator
+erzeugt und sind damit bei jedem Lauf gleich (bis auf die Zeitpunkte
+in der Lease-Datei, die relativ zur Erzeugung liegen).
+
+  FakeBatadvSocket    batman-adv über Netlink (statt batctl gwl/if/o/n)
+  FakeEthtoolBackend  Zähler per ETHTOOL_GSTATS (statt ethtool -S)
+  FakeFastd           Status-Socket von fastd in einem eigenen Prozeß
+  FakeAlfred          Unix-Socket von alfred (Abfragen), ebenso
+  FakeTree            /proc, /sys und /etc in einem Verzeichnis
+  write_leases        dhcpd.leases mit beliebig vielen Blöcken
+  FakeCluster         Pipelines von RedisCluster, zeichnet nur auf
+  RedisServer         lokaler redis-server als Ein-Knoten-Cluster
+  load_script         Programm aus dem Hauptverzeichnis als Modul laden
+"""
+
+import os
+import glob
+import json
+import time
+import errno
+import shutil
+import socket
+import zlib
+import struct
+import random
+import builtins
+import contextlib
+import subprocess
+import socketserver
+import multiprocessing
+import importlib.util
+import importlib.machinery
+
+from ffpi import batadv, alfred
+from ffpi.traffic import (EthtoolBackend, ETHTOOL_GDRVINFO, ETHTOOL_GSTRINGS,
+                          ETHTOOL_GSTATS, ETH_GSTRING_LEN, _DRVINFO_NSTATS)
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def load_script(filename, name):
+    # Die Programme haben Bindestriche im Namen (und teils keine
+    # Endung), import geht nicht
+    loader = importlib.machinery.SourceFileLoader(name, os.path.join(ROOT, filename))
+    spec = importlib.util.spec_from_loader(name, loader)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def gateway_mac(n):
+    return struct.pack('!HI', 0x0200, 0xff000000 + n)
+
+class FakeBatadvSocket(object):
+    """
+    Ersatz für den Netlink-Socket: beantwortet die Abfrage der
+    Familien-ID sowie Dumps der Hard-Interfaces, Originatoren und
+    Nachbarn. Die Antworten werden wie vom Kernel in Stücken von
+    höchstens bufsize Bytes geliefert. Sie werden beim ersten Mal
+    erzeugt und in cache aufbewahrt, damit bei Messungen nur die
+    Auswertung zählt.
+    """
+    FAMILY = 0x20
+
+    def __init__(self, originators=10000, neighbours_per_orig=3, hardifs=4, gateways=4,
+                 bufsize=32768, seed=1, cache=None):
+        self.originators = originators
+        self.gateways = gateways
+        self.neighbours_per_orig = neighbours_per_orig
+        self.hardifs = hardifs
+        self.bufsize = bufsize
+        self.seed = seed
+        self.cache = {} if cache is None else cache
+        self.pending = iter(())
+
+    def close(self):
+        pass
+
+    def _message(self, mtype, flags, seq, cmd, attrs):
+        body = batadv._genlmsghdr.pack(cmd, 1, 0) + attrs
+        return batadv._nlmsghdr.pack(batadv._nlmsghdr.size + len(body), mtype, flags, seq, 0) + body
+
+    def _done(self, seq):
+        return batadv._nlmsghdr.pack(20, batadv.NLMSG_DONE, 2, seq, 0) + b'\0' * 4
+
+    def _records(self, cmd):
+        rnd = random.Random(self.seed)
+        pack = batadv.pack_attr
+        if cmd == batadv.BATADV_CMD_GET_HARDIF:
+            for i in range(self.hardifs):
+                yield (pack(batadv.BATADV_ATTR_HARD_IFINDEX, struct.pack('=I', 10 + i))
+                       + pack(batadv.BATADV_ATTR_HARD_IFNAME, 'mesh-vpn{}\0'.format(i).encode())
+                       + pack(batadv.BATADV_ATTR_HARD_ADDRESS, bytes([2, 0, 0, 0, 1, i]))
+                       + pack(batadv.BATADV_ATTR_ACTIVE, b''))
+        elif cmd == batadv.BATADV_CMD_GET_ORIGINATORS:
+            for o in range(self.originators):
+                orig = struct.pack('!HI', 0x0200, o)
+                for n in range(self.neighbours_per_orig):
+                    yield (pack(batadv.BATADV_ATTR_ORIG_ADDRESS, orig)
+                           + pack(batadv.BATADV_ATTR_NEIGH_ADDRESS, struct.pack('!HI', 0x0600, n))
+                           + pack(batadv.BATADV_ATTR_HARD_IFINDEX, struct.pack('=I', 10 + rnd.randrange(self.hardifs)))
+                           + pack(batadv.BATADV_ATTR_LAST_SEEN_MSECS, struct.pack('=I', rnd.randrange(5000)))
+                           + pack(batadv.BATADV_ATTR_TQ, bytes([rnd.randrange(256)]))
+                           + (pack(batadv.BATADV_ATTR_FLAG_BEST, b'') if n == 0 else b''))
+        elif cmd == batadv.BATADV_CMD_GET_GATEWAYS:
+            # Die Gateways haben dieselben MACs wie die ersten Peers
+            # von FakeFastd
+            for g in range(self.gateways):
+                yield (pack(batadv.BATADV_ATTR_ORIG_ADDRESS, gateway_mac(g))
+                       + pack(batadv.BATADV_ATTR_TQ, bytes([rnd.randrange(256)]))
+                       + pack(batadv.BATADV_ATTR_ROUTER, struct.pack('!HI', 0x0600, g))
+                       + pack(batadv.BATADV_ATTR_HARD_IFNAME, 'mesh-vpn{}\0'.format(g % self.hardifs).encode())
+                       + pack(batadv.BATADV_ATTR_BANDWIDTH_DOWN, struct.pack('=I', 1000))
+                       + pack(batadv.BATADV_ATTR_BANDWIDTH_UP, struct.pack('=I', 1000))
+                       + (pack(batadv.BATADV_ATTR_FLAG_BEST, b'') if g == 0 else b''))
+        elif cmd == batadv.BATADV_CMD_GET_NEIGHBORS:
+            for n in range(self.originators // 10):
+                yield (pack(batadv.BATADV_ATTR_NEIGH_ADDRESS, struct.pack('!HI', 0x0600, n))
+                       + pack(batadv.BATADV_ATTR_HARD_IFINDEX, struct.pack('=I', 10 + rnd.randrange(self.hardifs)))
+                       + pack(batadv.BATADV_ATTR_LAST_SEEN_MSECS, struct.pack('=I', rnd.randrange(5000))))
+
+    def _dump(self, cmd, seq):
+        buf = b''
+        for attrs in self._records(cmd):
+            msg = self._message(self.FAMILY, 2, seq, cmd, attrs)
+            if len(buf) + len(msg) > self.bufsize:
+                yield buf
+                buf = b''
+            buf += msg
+        if buf:
+            yield buf
+        yield self._done(seq)
+
+    def send(self, data):
+        length, mtype, flags, seq, pid = batadv._nlmsghdr.unpack_from(data)
+        cmd = data[batadv._nlmsghdr.size]
+        if mtype == batadv.GENL_ID_CTRL:
+            attrs = batadv.pack_attr(batadv.CTRL_ATTR_FAMILY_ID, struct.pack('=H', self.FAMILY))
+            self.pending = iter([self._message(mtype, 0, seq, 1, attrs)])
+        else:
+            if (cmd, seq) not in self.cache:
+                self.cache[cmd, seq] = list(self._dump(cmd, seq))
+            self.pending = iter(self.cache[cmd, seq])
+
+    def recv(self, bufsize):
+        return next(self.pending)
+
+def fake_batadv(**kwargs):
+    # Batadv für das Interface lo, damit if_nametoindex funktioniert
+    cache = {}
+    return batadv.Batadv('lo', connect=lambda: batadv.Netlink(FakeBatadvSocket(cache=cache, **kwargs)))
+
+# Zähler von batman-adv, wie sie "ethtool -S bat0" anzeigt
+BATADV_COUNTERS = (
+    'tx', 'tx_bytes', 'tx_dropped', 'rx', 'rx_bytes', 'forward', 'forward_bytes',
+    'mgmt_tx', 'mgmt_tx_bytes', 'mgmt_rx', 'mgmt_rx_bytes', 'frag_tx', 'frag_tx_bytes',
+    'frag_rx', 'frag_rx_bytes', 'frag_fwd', 'frag_fwd_bytes', 'tt_request_tx',
+    'tt_request_rx', 'tt_response_tx', 'tt_response_rx', 'tt_roam_adv_tx',
+    'tt_roam_adv_rx', 'dat_get_tx', 'dat_get_rx', 'dat_put_tx', 'dat_put_rx',
+    'dat_cached_reply_tx', 'nc_code', 'nc_code_bytes', 'nc_recode', 'nc_recode_bytes',
+    'nc_buffer', 'nc_decode', 'nc_decode_bytes', 'nc_decode_failed', 'nc_sniffed',
+)
+
+class FakeEthtoolBackend(EthtoolBackend):
+    """
+    Ersatz für das ioctl SIOCETHTOOL: füllt die Puffer so, wie es der
+    Kernel für ein batman-adv-Interface tut, also immer mit der
+    aktuellen Anzahl Zähler (counters läßt sich ändern). Die Zähler
+    wachsen bei jedem Abruf.
+    """
+
+    def __init__(self, interface='bat0', counters=BATADV_COUNTERS):
+        super().__init__(interface)
+        self.counters = counters
+        self.calls = 0
+
+    def _ioctl(self, buf):
+        cmd = struct.unpack_from('I', buf)[0]
+        n = len(self.counters)
+        if cmd == ETHTOOL_GDRVINFO:
+            struct.pack_into('I', buf, _DRVINFO_NSTATS, n)
+        elif cmd == ETHTOOL_GSTRINGS:
+            struct.pack_into('I', buf, 8, n)
+            for i, name in enumerate(self.counters):
+                struct.pack_into('{}s'.format(ETH_GSTRING_LEN), buf, 12 + i * ETH_GSTRING_LEN, name.encode('ascii'))
+        elif cmd == ETHTOOL_GSTATS:
+            self.calls += 1
+            struct.pack_into('I', buf, 4, n)
+            struct.pack_into('{}Q'.format(n), buf, 8, *((i + 1) * 1000 * self.calls for i in range(n)))
+        else:
+            raise OSError(errno.EOPNOTSUPP, "unsupported ethtool command")
+
+def mac_string(raw):
+    return ':'.join('{:02x}'.format(b) for b in raw)
+
+def fastd_status(peers, gateways=4, connected=0.9, seed=1):
+    """
+    Status-Dokument von fastd mit peers Peers, davon etwa der Anteil
+    connected verbunden. Die ersten gateways Peers sind Gateways (ihre
+    MACs liefert auch FakeBatadvSocket).
+    """
+    rnd = random.Random(seed)
+    doc = {
+        'uptime': 1234567890,
+        'interface': 'ffpi-mesh-vpn',
+        'statistics': {'rx': {'packets': 123456789, 'bytes': 98765432100},
+                       'rx_reordered': {'packets': 1234, 'bytes': 567890},
+                       'tx': {'packets': 123456789, 'bytes': 98765432100},
+                       'tx_dropped': {'packets': 12, 'bytes': 3456},
+                       'tx_error': {'packets': 0, 'bytes': 0}},
+        'peers': {}
+    }
+    for n in range(peers):
+        key = '{:064x}'.format(rnd.getrandbits(256))
+        peer = {
+            'name': 'ffpi-node-{:05d}'.format(n),
+            'address': '[2001:db8::{:x}]:{}'.format(n + 1, 10000 + rnd.randrange(50000)),
+            'interface': 'ffpi-mesh-vpn',
+            'connection': None
+        }
+        if n < gateways:
+            macs = [mac_string(gateway_mac(n))]
+        elif rnd.random() < connected:
+            macs = [mac_string(struct.pack('!HI', 0x0200 + n % 256, rnd.getrandbits(32)))
+                    for i in range(1 + (n % 3 == 0))]
+        else:
+            macs = None
+        if macs is not None:
+            peer['connection'] = {
+                'established': rnd.randrange(10**9),
+                'method': 'salsa2012+umac',
+                'statistics': {k: {'packets': rnd.randrange(10**6), 'bytes': rnd.randrange(10**9)}
+                               for k in ('rx', 'rx_reordered', 'tx', 'tx_dropped', 'tx_error')},
+                'mac_addresses': macs
+            }
+        doc['peers'][key] = peer
+    return json.dumps(doc, indent=4)
+
+class _StatusHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.sendall(self.server.document)
+
+class _StatusServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def _serve_status(sockpath, peers, gateways, seed):
+    # Erst die Daten erzeugen, der Socket zeigt die Bereitschaft an
+    document = fastd_status(peers, gateways, seed=seed).encode('utf-8')
+    server = _StatusServer(sockpath, _StatusHandler)
+    server.document = document
+    server.serve_forever()
+
+class FakeFastd(object):
+    """
+    Status-Socket von fastd. Der Server läuft in einem eigenen Prozeß,
+    damit er weder Speicher noch Rechenzeit des gemessenen Prozesses
+    belegt. Jede Verbindung bekommt das vollständige Dokument, danach
+    wird sie geschlossen (wie bei fastd).
+    """
+
+    def __init__(self, sockpath, peers=1000, gateways=4, seed=1):
+        self.sockpath = sockpath
+        self.peers = peers
+        self.gateways = gateways
+        self.seed = seed
+        self.process = None
+
+    def _target(self):
+        return _serve_status, (self.sockpath, self.peers, self.gateways, self.seed)
+
+    def start(self, timeout=30):
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.sockpath)
+        ctx = multiprocessing.get_context('fork')
+        target, args = self._target()
+        self.process = ctx.Process(target=target, args=args, daemon=True)
+        self.process.start()
+        deadline = time.monotonic() + timeout
+        while not os.path.exists(self.sockpath):
+            if time.monotonic() > deadline or not self.process.is_alive():
+                raise RuntimeError("{} did not start".format(type(self).__name__))
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.sockpath)
+
+def alfred_node(n, rnd, generation=0):
+    """
+    nodeinfo und statistics eines Knotens wie von alfred-announce.py
+    bzw. Gluon, jeder 50. Knoten ist ein Gateway
+    """
+    gateway = n % 50 == 0
+    mac = '02:00:{:02x}:{:02x}:{:02x}:{:02x}'.format(n >> 24 & 0xff, n >> 16 & 0xff, n >> 8 & 0xff, n & 0xff)
+    nodeinfo = {
+        'node_id': mac.replace(':', ''),
+        'hostname': 'ffpi-{}-{:05d}'.format('gw' if gateway else 'node', n),
+        'network': {'mac': mac, 'mesh_interfaces': [mac]},
+        'software': {'batman_adv': {'version': rnd.choice(('2019.2', '2021.4', '2023.3'))},
+                     'firmware': {'base': 'Debian' if gateway else 'gluon-v2023.1',
+                                  'release': '12.7' if gateway else rnd.choice(('1.4.2', '1.5.0'))}},
+        'hardware': {'model': 'TP-Link TL-WR841N/ND v9', 'nproc': 1},
+        'location': {'latitude': 53.6 + rnd.random() / 10, 'longitude': 9.7 + rnd.random() / 10},
+        'owner': {'contact': 'node{}@example.org'.format(n)},
+    }
+    if gateway:
+        nodeinfo['vpn'] = True
+    statistics = {
+        'node_id': nodeinfo['node_id'],
+        'uptime': 765432.1 + generation * 60, 'idletime': 123456.7 + generation * 55,
+        'loadavg': rnd.random(), 'memory': {'total': 28372, 'free': 11400 + rnd.randrange(1000)},
+        'clients': {'total': rnd.randrange(20), 'wifi': rnd.randrange(20)},
+        'traffic': {k: {'bytes': rnd.randrange(10**9), 'packets': rnd.randrange(10**6)}
+                    for k in ('tx', 'rx', 'forward', 'mgmt_tx', 'mgmt_rx')},
+    }
+    if gateway:
+        statistics.update(peers=rnd.randrange(500), leases=rnd.randrange(1000))
+    return mac, nodeinfo, statistics
+
+def _compress(data):
+    return zlib.compress(json.dumps(data, separators=(',', ':'), sort_keys=True).encode('utf-8'))
+
+class _AlfredHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        header = self.request.recv(alfred._tlv.size + alfred._request.size)
+        rtype, version, length = alfred._tlv.unpack_from(header)
+        datatype, txid = alfred._request.unpack_from(header, alfred._tlv.size)
+        if rtype != alfred.ALFRED_REQUEST:
+            self.request.sendall(alfred._tlv.pack(alfred.ALFRED_STATUS_ERROR, 0, alfred._tx.size)
+                                 + alfred._tx.pack(txid, errno.EINVAL))
+            return
+        self.request.sendall(b''.join(self.server.reply(datatype, txid)))
+
+class _AlfredServer(socketserver.UnixStreamServer):
+    """
+    Antwortet wie alfred mit Push-Paketen, die möglichst viele
+    Datenblöcke enthalten. Bei jeder Abfrage der Statistik ändern
+    sich die Daten eines Zehntels der Knoten.
+    """
+
+    def setup_data(self, nodes, seed, blobs):
+        self.nodes = nodes
+        self.seed = seed
+        self.generation = 0
+        self.blobs = blobs
+
+    def reply(self, datatype, txid):
+        blobs = self.blobs.get(datatype, {})
+        if datatype == 159:
+            self.generation += 1
+            for n in range(self.generation % 10, self.nodes, 10):
+                mac, nodeinfo, statistics = alfred_node(n, random.Random(self.seed + n), self.generation)
+                blobs[mac] = _compress(statistics)
+        packet = b''
+        seqno = 0
+        for mac, blob in blobs.items():
+            block = alfred._data.pack(bytes.fromhex(mac.replace(':', '')), datatype, 0, len(blob)) + blob
+            if packet and len(packet) + len(block) > alfred.MAX_PAYLOAD - alfred._tx.size:
+                yield self._packet(txid, seqno, packet)
+                packet = b''
+                seqno += 1
+            packet += block
+        if packet:
+            yield self._packet(txid, seqno, packet)
+
+    def _packet(self, txid, seqno, data):
+        return (alfred._tlv.pack(alfred.ALFRED_PUSH_DATA, 0, alfred._tx.size + len(data))
+                + alfred._tx.pack(txid, seqno) + data)
+
+def _serve_alfred(sockpath, nodes, seed):
+    blobs = {158: {}, 159: {}}
+    for n in range(nodes):
+        mac, nodeinfo, statistics = alfred_node(n, random.Random(seed + n))
+        blobs[158][mac] = _compress(nodeinfo)
+        blobs[159][mac] = _compress(statistics)
+    server = _AlfredServer(sockpath, _AlfredHandler)
+    server.setup_data(nodes, seed, blobs)
+    server.serve_forever()
+
+class FakeAlfred(FakeFastd):
+    """
+    Unix-Socket von alfred mit nodeinfo (158) und statistics (159) von
+    nodes Knoten, Server in einem eigenen Prozeß wie bei FakeFastd
+    """
+
+    def __init__(self, sockpath, nodes=1000, seed=1):
+        super().__init__(sockpath, seed=seed)
+        self.nodes = nodes
+
+    def _target(self):
+        return _serve_alfred, (self.sockpath, self.nodes, self.seed)
+
+def lease_time(t):
+    # Format von dhcpd: Wochentag Datum Uhrzeit in UTC
+    return time.strftime('%w %Y/%m/%d %H:%M:%S', time.gmtime(t))
+
+def write_leases(filename, blocks, now=None, span=86400, duration=3600, seed=1):
+    """
+    Lease-Datei mit blocks Blöcken, wie dhcpd sie fortschreibt: die
+    Blöcke sind zeitlich geordnet über span Sekunden vor now verteilt,
+    Adressen wiederholen sich (Verlängerungen). Aktiv sind damit etwa
+    die Leases der letzten duration Sekunden.
+    """
+    if now is None:
+        now = time.time()
+    rnd = random.Random(seed)
+    pool = max(blocks // 4, 1)
+    start = int(now) - span
+    with open(filename, 'w') as fh:
+        fh.write("# The format of this file is documented in the dhcpd.leases(5) manual page.\n"
+                 "# This lease file was written by isc-dhcp-4.4.3-P1\n\n"
+                 "# authoring-byte-order entry is generated, DO NOT DELETE\n"
+                 "authoring-byte-order little-endian;\n\n")
+        for n in range(blocks):
+            client = rnd.randrange(pool)
+            starts = start + n * span // blocks
+            state = 'active' if rnd.random() < 0.9 else 'free'
+            ends = starts + duration if state == 'active' else starts
+            mac = '02:{:02x}:{:02x}:{:02x}:{:02x}:{:02x}'.format(
+                client >> 24 & 0xff, client >> 16 & 0xff, client >> 8 & 0xff, client & 0xff, n % 7)
+            fh.write("lease 10.137.{}.{} {{\n"
+                     "  starts {};\n"
+                     "  ends {};\n"
+                     "  cltt {};\n"
+                     "  binding state {};\n"
+                     "  next binding state free;\n"
+                     "  rewind binding state free;\n"
+                     "  hardware ethernet {};\n"
+                     "  uid \"\\001{}\";\n"
+                     "  client-hostname \"client-{}\";\n"
+                     "}}\n".format(client >> 8 & 0xff, client & 0xff, lease_time(starts),
+                                   lease_time(ends), lease_time(starts), state, mac,
+                                   mac.replace(':', ''), client))
+    return filename
+
+class FakeTree(object):
+    """
+    Verzeichnisbaum mit den Dateien unter /proc, /sys, /etc und
+    /var/lib/dhcp, die von den Items gelesen werden. Innerhalb von
+    active() werden Zugriffe auf diese Pfade (open, os.stat,
+    os.listdir, os.path.exists/isdir/isfile und glob.glob) in den Baum
+    umgeleitet, alle anderen Pfade bleiben unverändert.
+    """
+    PREFIXES = ('/proc/', '/sys/', '/etc/', '/var/lib/dhcp/')
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, name):
+        if isinstance(name, str) and name.startswith(self.PREFIXES):
+            return self.root + name
+        return name
+
+    def write(self, name, content):
+        filename = self.root + name
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'w') as fh:
+            fh.write(content)
+        return filename
+
+    def build(self, interfaces=('lo', 'bat0', 'eth0'), fastd=None, nodeid='02000a890001'):
+        """
+        fastd: Dictionary Instanz -> Status-Socket
+        """
+        w = self.write
+        w('/proc/uptime', '765432.10 2345678.90\n')
+        w('/proc/loadavg', '0.15 0.20 0.18 2/187 12345\n')
+        w('/proc/meminfo', ''.join('{}:{:>16} kB\n'.format(k, v) for k, v in (
+            ('MemTotal', 4045032), ('MemFree', 1234567), ('MemAvailable', 3012345),
+            ('Buffers', 23456), ('Cached', 345678), ('SwapCached', 0),
+            ('Active', 456789), ('Inactive', 234567), ('SwapTotal', 1048572),
+            ('SwapFree', 1048572), ('Dirty', 12), ('Slab', 45678))))
+        w('/proc/cpuinfo', ''.join(
+            'processor\t: {}\nvendor_id\t: GenuineIntel\ncpu family\t: 6\n'
+            'model name\t: Intel(R) Xeon(R) CPU E5-2620 v4 @ 2.10GHz\n'
+            'cpu MHz\t\t: 2100.000\ncache size\t: 20480 KB\n\n'.format(i) for i in range(4)))
+        w('/proc/sys/kernel/random/boot_id', '3b1f6a52-6f0e-4a4e-9d43-8c0f1d2e3a4b\n')
+        w('/sys/module/batman_adv/version', '2023.3\n')
+        for n, iface in enumerate(interfaces):
+            w('/sys/class/net/{}/address'.format(iface), '02:00:0a:89:00:{:02x}\n'.format(n))
+            for counter in ('rx_bytes', 'tx_bytes', 'rx_packets', 'tx_packets', 'rx_dropped', 'tx_dropped'):
+                w('/sys/class/net/{}/statistics/{}'.format(iface, counter), '{}\n'.format(10**9 * (n + 1)))
+        w('/etc/os-release', 'PRETTY_NAME="Debian GNU/Linux 12 (bookworm)"\nNAME="Debian GNU/Linux"\n'
+          'VERSION_ID="12"\nVERSION="12 (bookworm)"\nID=debian\n')
+        w('/etc/debian_version', '12.7\n')
+        w('/etc/default/openvpn', '#AUTOSTART="all"\nAUTOSTART="mullvad"\n')
+        w('/etc/openvpn/mullvad.conf', '## ExitCountry = SE\nclient\ndev tun-mullvad\n')
+        w('/etc/openvpn/ovpn.conf', '## ExitCountry = NL\nclient\ndev tun-ovpn\n')
+        w('/etc/alfred/statics.json', json.dumps({'node': {'node_id': nodeid}}))
+        os.makedirs(self.root + '/etc/systemd/system/multi-user.target.wants', exist_ok=True)
+        w('/etc/systemd/system/multi-user.target.wants/fastd@ffpi.service', '')
+        for instance, sockpath in (fastd or {}).items():
+            w('/etc/fastd/{}/fastd.conf'.format(instance),
+              'log level warn;\ninterface "{0}-mesh-vpn";\nbind 0.0.0.0:10000;\n'
+              'method "salsa2012+umac";\nmtu 1406;\nsecret "0000";\n'
+              'status socket "{1}";\ninclude peers from "peers";\n'.format(instance, sockpath))
+        os.makedirs(self.root + '/var/lib/dhcp', exist_ok=True)
+        return self
+
+    @contextlib.contextmanager
+    def active(self):
+        path = self.path
+        root = self.root
+        saved = (builtins.open, os.stat, os.listdir, os.path.exists, os.path.isdir,
+                 os.path.isfile, glob.glob)
+        o_open, o_stat, o_listdir, o_exists, o_isdir, o_isfile, o_glob = saved
+
+        def redirect_glob(pattern, *args, **kwargs):
+            if isinstance(pattern, str) and pattern.startswith(self.PREFIXES):
+                return [name[len(root):] for name in o_glob(root + pattern, *args, **kwargs)]
+            return o_glob(pattern, *args, **kwargs)
+
+        builtins.open = lambda file, *args, **kwargs: o_open(path(file), *args, **kwargs)
+        os.stat = lambda p, *args, **kwargs: o_stat(path(p), *args, **kwargs)
+        os.listdir = lambda p='.': o_listdir(path(p))
+        os.path.exists = lambda p: o_exists(path(p))
+        os.path.isdir = lambda p: o_isdir(path(p))
+        os.path.isfile = lambda p: o_isfile(path(p))
+        glob.glob = redirect_glob
+        try:
+            yield self
+        finally:
+            (builtins.open, os.stat, os.listdir, os.path.exists, os.path.isdir,
+             os.path.isfile, glob.glob) = saved
+
+class FakePipeline(object):
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        if self.cluster.errors:
+            raise self.cluster.errors.pop(0)
+        self.cluster.pipelines.append(self.commands)
+        return [None] * len(self.commands)
+
+class FakeCluster(object):
+    """
+    Ersatz für RedisCluster, der die Befehle jeder ausgeführten Pipeline
+    in pipelines aufzeichnet. Ausnahmen in errors werden nacheinander
+    statt der nächsten Ausführungen geworfen.
+    """
+
+    def __init__(self):
+        self.pipelines = []
+        self.errors = []
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class RedisServer(object):
+    """
+    redis-server im Cluster-Modus mit nur einem Knoten, der alle Slots
+    hält. Damit kann RedisCluster wie auf den Gateways verwendet
+    werden. Benötigt das Programm redis-server und das Modul redis.
+    """
+
+    def __init__(self, workdir, port=None):
+        self.workdir = workdir
+        self.port = port or free_port()
+        self.process = None
+
+    @staticmethod
+    def available():
+        # Liefert den Grund, falls der Server nicht nutzbar ist
+        if not shutil.which('redis-server'):
+            return "redis-server not found"
+        try:
+            import redis
+        except ImportError:
+            return "python module redis not installed"
+        return None
+
+    def start(self, timeout=10):
+        import redis
+        os.makedirs(self.workdir, exist_ok=True)
+        self.process = subprocess.Popen(
+            ['redis-server', '--port', str(self.port), '--bind', '127.0.0.1',
+             '--cluster-enabled', 'yes', '--cluster-config-file', 'nodes-{}.conf'.format(self.port),
+             '--save', '', '--appendonly', 'no', '--dir', self.workdir],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        client = redis.Redis('127.0.0.1', self.port)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                client.ping()
+                break
+            except redis.exceptions.ConnectionError:
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise
+                time.sleep(0.05)
+        try:
+            client.execute_command('CLUSTER', 'ADDSLOTSRANGE', 0, 16383)
+        except redis.exceptions.ResponseError:
+            # vor Redis 7
+            client.execute_command('CLUSTER', 'ADDSLOTS', *range(16384))
+        while client.cluster('INFO').get('cluster_state') != 'ok':
+            if time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError("redis cluster not ready")
+            time.sleep(0.05)
+        client.close()
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
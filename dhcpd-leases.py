@@ -6,6 +6,10 @@ Zähle aktive DHCP-Leases
 Vergleiche dazu:
   dhcp-lease-list --lease /var/lib/dhcp/dhcpd.leases
 
+Mit -w wird gewartet, bis keine aktiven Leases mehr vorhanden sind
+(z.B. beim Abschalten eines Gateways durch ffgate-down). Die Lease-Datei
+wird dabei per inotify beobachtet und nur inkrementell gelesen.
+
 Änderungsprotokoll
 ==================
 
@@ -14,35 +18,68 @@ Version  Datum       Änderung(en)                                           von
 1.0      ?
 1.1      2017-01-29                                                         tho
 2.0      2023-12-06  Umstellung auf Python 3                                tho
+2.1      2026-10-16  Auswertung nach ffpi.leases ausgelagert
+2.2      2026-10-17  Warten auf das Auslaufen der Leases (-w)
 
 """
 
+import os
 import sys
+import time
 import getopt
-import re
-import datetime
+
+from ffpi.leases import count_dhcp_leases, LeaseTracker
+from ffpi.inotify import Inotify, IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE
 
 __author__ = "Thomas Hooge"
 __copyright__ = "Public Domain"
-__version__ = "2.0"
+__version__ = "2.2"
 __email__ = "thomas@hoogi.de"
 __status__ = "Development"
 
-def count_dhcp_leases():
-    regex_leaseblock = re.compile(r"lease (?P<ip>\d+\.\d+\.\d+\.\d+) {(?P<config>[\s\S]+?)\n}")
-    regex_properties = re.compile(r"\s+(?P<key>\S+) (?P<value>[\s\S]+?);")
-    leases = 0
-    with open("/var/lib/dhcp/dhcpd.leases") as lease_file:
-        macs = set()
-        for match in regex_leaseblock.finditer(lease_file.read()):
-             block = match.groupdict()
-             properties = {key: value for (key, value) in regex_properties.findall(block['config'])}
-             if properties['binding'].split(' ')[1] == 'active' and properties['ends'] != 'never':
-                 dt_ends = datetime.datetime.strptime(properties['ends'][2:], "%Y/%m/%d %H:%M:%S")
-                 if dt_ends > datetime.datetime.utcnow() and properties['hardware'].startswith('ethernet'):
-                     macs.add(properties['hardware'][9:])
-        leases = len(macs)
-    return leases
+def format_time(t):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t))
+
+def drain(verbose=True, poll=30):
+    """
+    Warten bis alle Leases abgelaufen sind.
+    Geweckt wird bei Änderungen an der Lease-Datei oder wenn der
+    nächste Lease abläuft, spätestens aber nach poll Sekunden.
+    """
+    tracker = LeaseTracker()
+    tracker.update()
+    dirname, basename = os.path.split(tracker.filename)
+    try:
+        watcher = Inotify()
+        watcher.add_watch(dirname, IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+    except OSError:
+        watcher = None
+    last = None
+    while True:
+        now = time.time()
+        active = tracker.active_leases(now)
+        count = tracker.count(now)
+        if count != last:
+            if verbose:
+                print("%d unique active leases" % count)
+                for lease in active:
+                    print("  %-15s %s ends %s" % (lease.ip, lease.mac, format_time(lease.ends)))
+                if active:
+                    print("Last lease expires at %s" % format_time(active[-1].ends))
+            else:
+                print(count)
+            sys.stdout.flush()
+            last = count
+        if count == 0:
+            break
+        timeout = min(max(active[0].ends - now, 0) + 0.1, poll)
+        if watcher:
+            watcher.read(timeout)
+        else:
+            time.sleep(timeout)
+        tracker.update()
+    if watcher:
+        watcher.close()
 
 def usage():
     print("DHCP leases counter")
@@ -51,14 +88,16 @@ def usage():
     print("Options")
     print(" -h  show this help")
     print(" -n  numeric output only")
+    print(" -w  wait until all leases have expired")
     print()
 
 if __name__ == "__main__":
 
     verbose = True
+    wait = False
 
     try:
-        opts, args = getopt.gnu_getopt(sys.argv[1:], "nh", ["help"])
+        opts, args = getopt.gnu_getopt(sys.argv[1:], "nhw", ["help", "wait"])
     except getopt.GetoptError as err:
         print(str(err))
         sys.exit(2)
@@ -66,9 +105,14 @@ if __name__ == "__main__":
         if opt in ("-h", "--help"):
             usage()
             sys.exit(1)
-        elif opt in ("-n"):
+        elif opt == "-n":
             verbose = False
-            break
+        elif opt in ("-w", "--wait"):
+            wait = True
+
+    if wait:
+        drain(verbose)
+        sys.exit(0)
 
     if verbose:
         print("%d unique active leases" % count_dhcp_leases())
@@ -7,10 +7,13 @@ Voraussetzung ist natürlich, daß dieser über die fastd-Konfiguration
 eingeschaltet ist.
 Programm von Freifunk Pinneberg / Havelock
 
-TODO Mehr automatisieren
-- pidof fastd liefert Liste mit laufenden Prozessen (Trennung mit Leerzeichen)
-- /proc/<pid>/cmdline liefert Kommando mit Konfigurationsdatei
-- dann Konfigurationsdatei auswerten
+Die Instanzen und ihre Sockets werden aus /etc/fastd/*/fastd.conf
+ermittelt und gleichzeitig abgefragt.
+
+Mit -w wird regelmäßig abgefragt und nur ausgegeben, welche Peers sich
+verbunden oder getrennt haben bzw. deren MAC-Adresse sich geändert hat.
+Mit -j erfolgt die Ausgabe als JSON (im Watch-Modus eine Zeile je
+Ereignis).
 
 Änderungsprotokoll
 ==================
@@ -20,61 +23,176 @@ Version  Datum       Änderung(en)                                           von
 0.1      2015-09-27  Änderungsprotokoll eingebaut                           tho
 0.2      2023-01-08  Umstellung auf Python 3                                tho
 0.3      2023-12-06  Zugriff auf debugfs für GW-Interfaces entfernt         tho
+0.4      2026-10-17  Gateways über Netlink statt batctl ermitteln
+0.5      2026-10-17  Alle fastd-Instanzen gleichzeitig abfragen
+0.6      2026-10-17  Peer-Index, Watch-Modus (-w) und JSON-Ausgabe (-j)
+0.7      2026-10-17  fastd-Instanz (-I) und Mesh-Interface (-m) wählbar
+0.8      2026-10-17  Watch-Modus: Ausfall einer Instanz bzw. von
+                     batman-adv erzeugt keine falschen Ereignisse
 
 """
 
-import os
 import sys
-import socket
 import json
-import subprocess
+import time
+import getopt
+
+from ffpi.batadv import Batadv, BatadvError
+from ffpi.fastd import query_all, discover, instance_socket, PeerIndex
 
 __author__ = "Thomas Hooge"
 __copyright__ = "Public Domain"
-__version__ = "0.3"
+__version__ = "0.8"
 __email__ = "thomas@hoogi.de"
 __status__ = "Development"
 
-def call(cmdnargs):
-    output =  subprocess.check_output(cmdnargs)
-    lines = [line.decode("utf-8") for line in output.splitlines()]
-    return lines
-
-def get_fastd_data(sockfile):
-    # fastd-Socket auslesen, liefert ein JSON-Objekt
-    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-    try:
-        client.connect(sockfile)
-    except socket.error as msg:
-        print(msg, file=sys.stderr)
+def get_fastd_data(index, instances=None, fatal=True):
+    # Alle fastd-Sockets auslesen, die Peers landen im Index
+    if instances is None:
+        instances = discover() or {'ffpi': instance_socket('ffpi')}
+    results = query_all(instances, on_peer=index.add)
+    for result in results:
+        if result.error:
+            print("%s: %s" % (result.sockpath, result.error), file=sys.stderr)
+    if fatal and all(result.error for result in results):
         sys.exit(1)
-    data = json.loads(client.makefile('r').read())
-    client.close()
-    return data
+    return [result for result in results if not result.error]
 
-def get_gate_macs():
+def get_gate_macs(meshif='bat0'):
     # Ermitteln der (sichtbaren) Gateways
-    lines = call(['batctl', 'meshif', 'bat0', 'gwl'])
-    return set([gw[3:20] for gw in lines[1:]])
+    return Batadv(meshif).gateway_macs()
 
-def main():
-    data = get_fastd_data("/var/run/fastd/ffpi.sock")
-    gw_macs = get_gate_macs()
-    npeers = 0
-    ngates = 0
-    for key, peer in data['peers'].items():
-        if peer['connection']:
-            if set(peer['connection']['mac_addresses']) & gw_macs:
-                print("Gate %s (%s) connected as %s..." % (peer['name'], peer['connection']['mac_addresses'][0], key[:16]))
+def snapshot(meshif='bat0', instances=None, fatal=True, gw_macs=None):
+    if gw_macs is None:
+        gw_macs = get_gate_macs(meshif)
+    index = PeerIndex(gw_macs)
+    results = get_fastd_data(index, instances, fatal)
+    return index, results
+
+def peer_json(p):
+    return {'key': p.key, 'name': p.name, 'macs': list(p.macs), 'gateway': p.gateway,
+            'instance': p.instance, 'address': p.address}
+
+def print_peers(index, results):
+    for result in results:
+        if len(results) > 1:
+            print("Instance %s" % result.instance)
+        npeers = 0
+        ngates = 0
+        for p in index.by_key.values():
+            if p.instance != result.instance:
+                continue
+            if p.gateway:
+                print("Gate %s (%s) connected as %s..." % (p.name, p.macs[0], p.key[:16]))
                 ngates += 1
             else:
-                try:
-                    peer_mac = peer['connection']['mac_addresses'][0]
-                except:
-                    peer_mac = '*no mac*'
-                print("Peer %s (%s) connected as %s..." % (peer['name'], peer_mac, key[:16]))
+                peer_mac = p.macs[0] if p.macs else '*no mac*'
+                print("Peer %s (%s) connected as %s..." % (p.name, peer_mac, p.key[:16]))
                 npeers += 1
-    print("%d peers total, %d gateways and %d peers currently connected" % (len(data['peers']), ngates, npeers))
+        print("%d peers total, %d gateways and %d peers currently connected" % (index.total.get(result.instance, 0), ngates, npeers))
+
+def print_json(index, results):
+    print(json.dumps({
+        'instances': {r.instance: {'socket': r.sockpath, 'total': index.total.get(r.instance, 0)} for r in results},
+        'peers': [peer_json(p) for p in index.by_key.values()]
+    }, separators=(',', ':')))
+
+def watch(interval, meshif='bat0', instances=None, as_json=False):
+    """
+    In festen Abständen abfragen und nur Änderungen ausgeben
+    """
+    old, results = snapshot(meshif, instances)
+    if as_json:
+        print_json(old, results)
+    else:
+        print("%d connected, watching every %g seconds" % (len(old), interval))
+    sys.stdout.flush()
+    gw_macs = old.gw_macs
+    while True:
+        time.sleep(interval)
+        try:
+            gw_macs = get_gate_macs(meshif)
+        except BatadvError as err:
+            # Gateways vom letzten Mal weiterverwenden
+            print("%s: %s" % (meshif, err), file=sys.stderr)
+        queried = instances
+        if queried is None:
+            queried = discover() or {'ffpi': instance_socket('ffpi')}
+        new, results = snapshot(meshif, queried, False, gw_macs)
+        if not results:
+            continue
+        # Peers einer Instanz, deren Abfrage fehlschlug, gelten als
+        # unverändert statt als getrennt und später neu verbunden
+        for instance in set(queried) - {r.instance for r in results}:
+            new.keep(old, instance)
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        for event, p, q in old.diff(new):
+            if as_json:
+                print(json.dumps({'time': now, 'event': event,
+                                  'old': p and peer_json(p), 'new': q and peer_json(q)},
+                                 separators=(',', ':')))
+            elif event == 'connect':
+                print("%s + %s %s (%s) connected as %s..." % (now, 'Gate' if q.gateway else 'Peer', q.name, ', '.join(q.macs) or '*no mac*', q.key[:16]))
+            elif event == 'disconnect':
+                print("%s - %s %s (%s) disconnected" % (now, 'Gate' if p.gateway else 'Peer', p.name, ', '.join(p.macs) or '*no mac*'))
+            else:
+                print("%s * %s MAC changed from %s to %s" % (now, q.name, ', '.join(p.macs) or '*no mac*', ', '.join(q.macs) or '*no mac*'))
+        sys.stdout.flush()
+        old = new
+
+def usage():
+    print("fastd status")
+    print("Version {}".format(__version__))
+    print()
+    print("Options")
+    print(" -h           show this help")
+    print(" -j           JSON output")
+    print(" -w           watch mode, show only changes")
+    print(" -i <seconds> interval for watch mode (default 5)")
+    print(" -I <instance> fastd instance, may be repeated (default: all)")
+    print(" -m <meshif>  batman-adv interface for gateway detection (default bat0)")
+    print()
+
+def main():
+    as_json = False
+    watching = False
+    interval = 5.0
+    meshif = 'bat0'
+    instances = None
+    try:
+        opts, args = getopt.gnu_getopt(sys.argv[1:], "hjwi:I:m:", ["help", "json", "watch", "interval=", "instance=", "meshif="])
+    except getopt.GetoptError as err:
+        print(str(err))
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(1)
+        elif opt in ("-j", "--json"):
+            as_json = True
+        elif opt in ("-w", "--watch"):
+            watching = True
+        elif opt in ("-i", "--interval"):
+            interval = float(arg)
+        elif opt in ("-I", "--instance"):
+            if instances is None:
+                instances = {}
+            instances[arg] = instance_socket(arg)
+        elif opt in ("-m", "--meshif"):
+            meshif = arg
+
+    if watching:
+        try:
+            watch(interval, meshif, instances, as_json)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    index, results = snapshot(meshif, instances)
+    if as_json:
+        print_json(index, results)
+    else:
+        print_peers(index, results)
 
 if __name__ == '__main__':
     main()
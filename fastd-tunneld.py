@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tunnel-Ereignisse von fastd nach Redis schreiben
+
+fastd ruft bei jedem Auf- und Abbau eines Tunnels das Hook-Script
+fastd-hook auf, das nur ein Datagramm an den Socket dieses Daemons
+schickt (mit socat, ohne einen Python-Interpreter zu starten):
+
+  on establish "/usr/local/bin/fastd-hook establish ffpi";
+  on disestablish "/usr/local/bin/fastd-hook disestablish ffpi";
+
+Ereignisse werden für kurze Zeit gesammelt (-b) und dann gemeinsam in
+einer Pipeline geschrieben; mehrere Ereignisse für denselben Tunnel
+ergeben nur einen Schreibzugriff. Die MAC-Adresse eines Tunnels ist
+im Hook nicht bekannt, sie stammt aus dem letzten Abgleich oder wird
+für neue Schlüssel gezielt am Status-Socket der Instanz nachgefragt.
+
+Der vollständige Abgleich mit den Status-Sockets (wie fastd2redis.py)
+läuft nur noch in großen Abständen (-S) und korrigiert verpaßte
+Ereignisse. Kann die MAC-Adresse eines neuen Schlüssels nicht ermittelt
+werden, wird er sofort ausgeführt.
+
+Im Daemon-Modus wird in die Datei cfg['logfile'] (-l) protokolliert,
+sonst nach stderr.
+
+Änderungsprotokoll
+==================
+
+Version  Datum       Änderung(en)                                           von
+-------- ----------- ------------------------------------------------------ ----
+0.1      2026-10-17  Erste Version
+0.2      2026-10-17  Protokolldatei (-l), vorgezogener Abgleich, wenn ein
+                     Schlüssel nicht gefunden wird
+
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import getopt
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from ffpi.fastd import discover, instance_socket, query_async
+from ffpi.tunnels import (collect_async, gate_nodeid, tunnel_id, TunnelWriter, STATEFILE,
+                          REDIS_ERRORS)
+
+__author__ = "Thomas Hooge"
+__copyright__ = "Public Domain"
+__version__ = "0.2"
+__email__ = "thomas@hoogi.de"
+__status__ = "Development"
+
+cfg = {
+    'socket': '/var/run/ffpi/tunneld.sock',
+    'pidfile': '/var/run/ffpi/tunneld.pid',
+    # Nur im Daemon-Modus, sonst wird nach stderr protokolliert
+    'logfile': '/var/log/fastd-tunneld.log',
+    'redis': ('127.0.0.1', 7000),
+    'statefile': STATEFILE,
+    'batch': 1.0,
+    'sweep': 900,
+    # Wartezeiten für die Nachfrage nach der MAC-Adresse eines neuen
+    # Schlüssels, batman-adv braucht etwas bis die Adresse bekannt ist
+    'lookup_delays': (2, 10, 30),
+    'timeout': 5.0,
+    # Dictionary Instanz -> Socket, ohne -I alle konfigurierten
+    'instances': None,
+}
+
+log = logging.getLogger()
+
+# Fehler beim Schreiben: Redis sowie OSError z.B. beim Speichern der
+# Zustandsdatei, die Tasks dürfen daran nicht enden
+WRITE_ERRORS = REDIS_ERRORS + (OSError,)
+
+class HookProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, receiver):
+        self.receiver = receiver
+
+    def datagram_received(self, data, addr):
+        self.receiver.event(data)
+
+class Receiver(object):
+    """
+    Nimmt die Hook-Ereignisse an und schreibt sie gesammelt über den
+    TunnelWriter. Alle Redis-Zugriffe laufen nacheinander in einem
+    eigenen Thread, damit die Ereignisschleife nicht blockiert.
+    """
+
+    def __init__(self, writer, instances):
+        self.writer = writer
+        self.instances = instances
+        self.pending = {}
+        self.lookups = set()
+        self.wakeup = None
+        self.resweep = None
+        self.stop = None
+        self.redis = ThreadPoolExecutor(max_workers=1)
+        self.reindex()
+
+    def reindex(self):
+        # Schlüssel -> Tunnel-ID aus dem zuletzt geschriebenen Stand
+        self.by_key = {key: tid for tid, key in self.writer.state.get('tunnels', {}).items()}
+
+    def event(self, data):
+        try:
+            event, instance, key = data.decode('ascii').split()[:3]
+        except (UnicodeDecodeError, ValueError):
+            log.warning("Ungültiges Ereignis: {!r}".format(data))
+            return
+        tid = self.by_key.get(key)
+        if event == 'establish':
+            if tid is not None:
+                self.pending[tid] = key
+                self.wakeup.set()
+            elif (instance, key) not in self.lookups:
+                self.lookups.add((instance, key))
+                asyncio.ensure_future(self.lookup(instance, key))
+        elif event == 'disestablish':
+            if tid is not None:
+                self.pending[tid] = None
+                self.wakeup.set()
+        else:
+            log.warning("Unbekanntes Ereignis: {}".format(event))
+
+    async def lookup(self, instance, key):
+        """
+        MAC-Adresse eines unbekannten Schlüssels am Status-Socket der
+        Instanz ermitteln. Wird sie nicht gefunden, wird der nächste
+        Abgleich vorgezogen, statt das Ereignis bis dahin zu verlieren.
+        """
+        sockpath = self.instances.get(instance) or instance_socket(instance)
+        found = []
+        def on_peer(peer_key, peer):
+            conn = peer.get('connection')
+            if peer_key == key and conn and conn.get('mac_addresses'):
+                found.append(tunnel_id(conn['mac_addresses'][0]))
+        try:
+            for delay in cfg['lookup_delays']:
+                await asyncio.sleep(delay)
+                try:
+                    await query_async(sockpath, cfg['timeout'], on_peer)
+                except (OSError, ValueError, asyncio.TimeoutError) as err:
+                    log.warning("{}: {}".format(sockpath, err))
+                    continue
+                if found:
+                    self.by_key[key] = found[0]
+                    self.pending[found[0]] = key
+                    self.wakeup.set()
+                    return
+            log.warning("MAC address of {} not found, sweeping now".format(key[:16]))
+        except Exception as err:
+            log.error("Lookup of {} failed, sweeping now: {!r}".format(key[:16], err))
+        finally:
+            self.lookups.discard((instance, key))
+        self.resweep.set()
+
+    def flush(self, batch, now):
+        established = {tid: key for tid, key in batch.items() if key is not None}
+        gone = [tid for tid, key in batch.items() if key is None]
+        self.writer.apply(established, gone, now)
+        log.debug("{} verbunden, {} getrennt".format(len(established), len(gone)))
+
+    async def flusher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(cfg['batch'])
+            self.wakeup.clear()
+            batch, self.pending = self.pending, {}
+            if not batch:
+                continue
+            try:
+                await loop.run_in_executor(self.redis, self.flush, batch, time.time())
+            except WRITE_ERRORS as err:
+                # Nicht verloren geben, neuere Ereignisse haben Vorrang
+                log.error("Schreiben fehlgeschlagen: {}".format(err))
+                for tid, key in batch.items():
+                    self.pending.setdefault(tid, key)
+                self.wakeup.set()
+                await asyncio.sleep(cfg['sweep'] / 10)
+
+    async def sweeper(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.resweep.clear()
+            tunnels = await collect_async(self.instances, cfg['timeout'])
+            if tunnels is not None:
+                try:
+                    changed, refreshed = await loop.run_in_executor(self.redis, self.writer.write, tunnels)
+                    log.info("Abgleich: {} geschrieben, {} aufgefrischt".format(changed, refreshed))
+                    self.reindex()
+                except WRITE_ERRORS as err:
+                    log.error("Abgleich fehlgeschlagen: {}".format(err))
+            try:
+                await asyncio.wait_for(self.resweep.wait(), cfg['sweep'])
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, sockpath):
+        loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.resweep = asyncio.Event()
+        self.stop = asyncio.Event()
+        if os.path.exists(sockpath):
+            os.unlink(sockpath)
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: HookProtocol(self), local_addr=sockpath, family=socket.AF_UNIX)
+        os.chmod(sockpath, 0o660)
+        loop.add_signal_handler(signal.SIGTERM, self.stop.set)
+        loop.add_signal_handler(signal.SIGINT, self.stop.set)
+        tasks = [asyncio.ensure_future(self.flusher()), asyncio.ensure_future(self.sweeper())]
+        try:
+            await self.stop.wait()
+        finally:
+            loop.remove_signal_handler(signal.SIGTERM)
+            loop.remove_signal_handler(signal.SIGINT)
+            for task in tasks:
+                task.cancel()
+            transport.close()
+            os.unlink(sockpath)
+            # Gesammelte Ereignisse nicht verwerfen
+            if self.pending:
+                try:
+                    self.flush(self.pending, time.time())
+                except WRITE_ERRORS as err:
+                    log.error("Schreiben fehlgeschlagen: {}".format(err))
+
+def main(daemonize):
+    # /var/run ist ein tmpfs, das Verzeichnis fehlt nach dem Booten
+    for path in (cfg['socket'], cfg['pidfile']):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    from redis.cluster import RedisCluster, ClusterNode
+    rc = RedisCluster(startup_nodes=[ClusterNode(*cfg['redis'])], decode_responses=True)
+    writer = TunnelWriter(rc, gate_nodeid(), cfg['statefile'])
+    instances = cfg['instances'] or discover() or {'ffpi': instance_socket('ffpi')}
+    receiver = Receiver(writer, instances)
+    if not daemonize:
+        asyncio.run(receiver.run(cfg['socket']))
+        return
+    import daemon
+    context = daemon.DaemonContext(
+        files_preserve=[h.stream for h in log.handlers if hasattr(h, 'stream')])
+    with context:
+        with open(cfg['pidfile'], 'w') as fh:
+            fh.write("{}\n".format(os.getpid()))
+        try:
+            asyncio.run(receiver.run(cfg['socket']))
+        finally:
+            os.unlink(cfg['pidfile'])
+
+def usage():
+    print("fastd tunnel event receiver")
+    print("Version {}".format(__version__))
+    print()
+    print("Options")
+    print(" -h               show this help")
+    print(" -d               run as daemon")
+    print(" -b <seconds>     collect events for batch writes (default {})".format(cfg['batch']))
+    print(" -S <seconds>     interval of the full sweep (default {})".format(cfg['sweep']))
+    print(" -s <socket>      hook socket (default {})".format(cfg['socket']))
+    print(" -I <instance>    fastd instance, may be repeated (default: all)")
+    print(" -r <host:port>   redis cluster startup node (default 127.0.0.1:7000)")
+    print(" -l <file>        log file in daemon mode (default {})".format(cfg['logfile']))
+    print(" -v               verbose")
+    print()
+
+if __name__ == '__main__':
+    daemonize = False
+    loglevel = logging.WARNING
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hdb:S:s:I:r:l:v",
+            ["help", "daemon", "batch=", "sweep=", "socket=", "instance=", "redis=", "logfile=", "verbose"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(1)
+        elif opt in ("-d", "--daemon"):
+            daemonize = True
+        elif opt in ("-b", "--batch"):
+            cfg['batch'] = float(arg)
+        elif opt in ("-S", "--sweep"):
+            cfg['sweep'] = float(arg)
+        elif opt in ("-s", "--socket"):
+            cfg['socket'] = arg
+        elif opt in ("-I", "--instance"):
+            cfg['instances'] = cfg['instances'] or {}
+            cfg['instances'][arg] = instance_socket(arg)
+        elif opt in ("-r", "--redis"):
+            host, sep, port = arg.rpartition(':')
+            if not sep or not port.isdigit():
+                print("Invalid redis address: {}".format(arg))
+                sys.exit(2)
+            cfg['redis'] = (host or '127.0.0.1', int(port))
+        elif opt in ("-l", "--logfile"):
+            cfg['logfile'] = arg
+        elif opt in ("-v", "--verbose"):
+            loglevel = logging.DEBUG
+    # Der Daemon hat kein stderr mehr, deshalb vor dem Start in eine
+    # Datei umleiten. Deren Stream bleibt über files_preserve offen.
+    logging.basicConfig(level=loglevel, format='%(asctime)s %(levelname)s %(message)s',
+                        filename=cfg['logfile'] if daemonize else None)
+    try:
+        main(daemonize)
+    except REDIS_ERRORS as err:
+        print(err, file=sys.stderr)
+        sys.exit(1)
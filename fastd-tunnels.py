@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Abfragen über die von fastd2redis.py in Redis abgelegten Tunnel
+
+Die Abfragen verwenden die Indizes (Menge je Gateway, Sorted Set nach
+last_seen). Nur mit -R wird der gesamte Schlüsselraum auf allen
+Cluster-Knoten gleichzeitig durchsucht, um die Indizes neu aufzubauen.
+
+Beispiele
+  fastd-tunnels.py -g ffpi-gw01     Tunnel, die an ffpi-gw01 verbunden sind
+  fastd-tunnels.py -s 300           Tunnel, die in den letzten 5 Minuten
+                                    gesehen wurden
+  fastd-tunnels.py -t 02caffee0001  einzelner Tunnel
+  fastd-tunnels.py -R               Indizes neu aufbauen
+
+Änderungsprotokoll
+==================
+
+Version  Datum       Änderung(en)                                           von
+-------- ----------- ------------------------------------------------------ ----
+0.1      2026-10-17  Erste Version
+
+"""
+
+import sys
+import json
+import getopt
+
+from redis.cluster import RedisCluster, ClusterNode
+from redis.exceptions import RedisError
+
+from ffpi.tunnels import TunnelIndex, tunnel_id
+
+__author__ = "Thomas Hooge"
+__copyright__ = "Public Domain"
+__version__ = "0.1"
+__email__ = "thomas@hoogi.de"
+__status__ = "Development"
+
+def usage():
+    print("fastd tunnel query")
+    print("Version {}".format(__version__))
+    print()
+    print("Options")
+    print(" -h               show this help")
+    print(" -g <gate>        tunnels connected to gate")
+    print(" -s <seconds>     tunnels seen within the last seconds")
+    print(" -t <mac>         show single tunnel")
+    print(" -R               rebuild indexes (parallel scan of all nodes)")
+    print(" -r <host:port>   redis cluster startup node (default 127.0.0.1:7000)")
+    print(" -j               JSON output")
+    print()
+
+def output(tunnels, as_json):
+    if as_json:
+        print(json.dumps(tunnels, separators=(',', ':'), sort_keys=True))
+        return
+    for tid in sorted(tunnels):
+        data = tunnels[tid]
+        print("%s %s %s %s" % (tid, data.get('last_seen', '-'),
+                               data.get('last_gate', '-'), data.get('key', '-')))
+
+def main():
+    startup_nodes = [ClusterNode('127.0.0.1', 7000)]
+    query = None
+    as_json = False
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hg:s:t:Rr:j",
+            ["help", "gate=", "seen=", "tunnel=", "rebuild", "redis=", "json"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(1)
+        elif opt in ("-g", "--gate"):
+            query = ('gate', arg)
+        elif opt in ("-s", "--seen"):
+            query = ('seen', int(arg))
+        elif opt in ("-t", "--tunnel"):
+            query = ('tunnel', tunnel_id(arg.lower()))
+        elif opt in ("-R", "--rebuild"):
+            query = ('rebuild', None)
+        elif opt in ("-r", "--redis"):
+            host, sep, port = arg.rpartition(':')
+            startup_nodes = [ClusterNode(host, int(port))]
+        elif opt in ("-j", "--json"):
+            as_json = True
+    if query is None:
+        usage()
+        sys.exit(1)
+
+    try:
+        index = TunnelIndex(RedisCluster(startup_nodes=startup_nodes, decode_responses=True))
+        what, arg = query
+        if what == 'rebuild':
+            print("%d tunnels indexed" % index.rebuild())
+        elif what == 'gate':
+            output(index.tunnels(index.on_gate(arg)), as_json)
+        elif what == 'seen':
+            output(index.tunnels(index.seen_since(arg)), as_json)
+        else:
+            output(index.tunnels([arg]), as_json)
+    except RedisError as err:
+        print(err, file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
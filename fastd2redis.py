@@ -1,69 +1,85 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
 # Dieses Programm sollte auf einem Gateway laufen
 # Es liefert Informationen über die Tunnel nach Redis
+#
+# Alle Tunnel werden in einer Pipeline geschrieben, unveränderte
+# Tunnel bekommen nur ein neues last_seen (siehe ffpi.tunnels).
+# Ist der Cluster nicht erreichbar, wird mit wachsender Pause
+# wiederholt.
+# Läuft fastd-tunneld.py, ist dieses Programm nicht mehr nötig: der
+# Daemon schreibt die Ereignisse der fastd-Hooks und gleicht selbst in
+# größeren Abständen mit dem Status-Socket ab.
 
-import os  
-import sys   
-import socket
-import json
-import subprocess
-import datetime
+import sys
+import getopt
 
-from rediscluster import StrictRedisCluster
-from rediscluster.exceptions import ClusterDownError
-from redis.exceptions import ConnectionError
+from redis.cluster import RedisCluster, ClusterNode
+from redis.exceptions import RedisError, RedisClusterException
 
-def get_gate_nodeid():
-    # Die ID kann statisch angegeben werden, falls das nicht
-    # der Fall ist, wird der Hostname angenommen
-    try:
-        with open('/etc/alfred/statics.json', 'r') as fh:
-            statics = json.load(fh)
-    except (IOError, ValueError):
-        return socket.gethostname()
-    try:
-        nodeid = statics['node']['node_id']
-    except:
-        nodeid = socket.gethostname()
-    return nodeid
+from ffpi.fastd import instance_socket
+from ffpi.tunnels import collect, gate_nodeid, TunnelWriter, STATEFILE
 
+def usage():
+    print("fastd tunnels to redis")
+    print()
+    print("Options")
+    print(" -h               show this help")
+    print(" -r <host:port>   redis cluster startup node (default 127.0.0.1:7000)")
+    print(" -s <file>        state file (default {})".format(STATEFILE))
+    print(" -I <instance>    fastd instance, may be repeated (default: all)")
+    print(" -v               verbose")
+    print()
 
-def main(rc):
+def main(rc, statefile=STATEFILE, instances=None, verbose=False):
 
-    # fastd-Socket auslesen, liefert ein JSON-Objekt
-    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # fastd-Sockets auslesen
+    tunnels = collect(instances)
+    if tunnels is None:
+        sys.exit(1)
+    # Ermittelte Daten nach Redis schreiben
+    writer = TunnelWriter(rc, gate_nodeid(), statefile)
     try:
-        client.connect("/var/run/fastd/ffpi.sock")
-    except socket.error, msg:  
-        print >>sys.stderr, msg
+        changed, refreshed = writer.write(tunnels)
+    except (RedisError, RedisClusterException, OSError) as err:
+        print(err, file=sys.stderr)
         sys.exit(1)
-    data = json.loads(client.makefile('r').read())
-    client.close()
-    # Ermittelte Daten aufbereiten und nach Redis schreiben
-    gate_id = get_gate_nodeid()
-    now = datetime.datetime.now().replace(microsecond=0).isoformat()
-    peers = {}
-    for key, peer in data['peers'].iteritems():
-        if peer['connection']:
-            try:
-                tunnel_id = peer['connection']['mac_addresses'][0].replace(':', '')
-            except IndexError:
-                continue
-            rckey = "fastd:tunnel:%s" % tunnel_id
-            try:
-                rc.hset(rckey, 'key', key)
-                rc.hset(rckey, 'last_seen', now)
-                rc.hset(rckey, 'last_gate', gate_id)
-            except ClusterDownError:
-                pass
+    if verbose:
+        print("%d tunnels written, %d refreshed" % (changed, refreshed))
 
 if __name__ == '__main__':
-    startup_nodes = [{"host": "127.0.0.1", "port": "7000"}]
+    startup_nodes = [ClusterNode('127.0.0.1', 7000)]
+    statefile = STATEFILE
+    instances = None
+    verbose = False
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hr:s:I:v", ["help", "redis=", "state=", "instance=", "verbose"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(1)
+        elif opt in ("-r", "--redis"):
+            host, sep, port = arg.rpartition(':')
+            if not sep or not port.isdigit():
+                print("Invalid redis address: {}".format(arg))
+                sys.exit(2)
+            startup_nodes = [ClusterNode(host or '127.0.0.1', int(port))]
+        elif opt in ("-s", "--state"):
+            statefile = arg
+        elif opt in ("-I", "--instance"):
+            if instances is None:
+                instances = {}
+            instances[arg] = instance_socket(arg)
+        elif opt in ("-v", "--verbose"):
+            verbose = True
     try:
-        rc = StrictRedisCluster(startup_nodes=startup_nodes, decode_responses=True)
-    except ConnectionError:
-        # Kann z.B. bei lokalen Netzwerkproblemen auftreten
+        rc = RedisCluster(startup_nodes=startup_nodes, decode_responses=True)
+    except (RedisError, RedisClusterException):
+        # RedisClusterException, wenn kein Knoten erreichbar ist,
+        # z.B. bei lokalen Netzwerkproblemen
         sys.exit(1)
-    main(rc)
+    main(rc, statefile, instances, verbose)
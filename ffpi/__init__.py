@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+"""
+Gemeinsam genutzte Module der Freifunk Pinneberg Gateway-Werkzeuge
+
+Die Programme (alfred-announce.py, dhcpd-leases.py, ...) bleiben
+einzelne Scripte, alles was von mehreren davon benötigt wird, liegt
+hier.
+"""
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+"""
+Client für den Unix-Socket des alfred-Servers
+
+Statt für jeden Datentyp das Programm "alfred -s <typ>" zu starten,
+wird direkt das TLV-Protokoll von alfred gesprochen. Je Paket wird
+eine eigene Verbindung aufgebaut, der Server verarbeitet pro
+Verbindung genau eine Anfrage.
+
+Aufbau eines Push-Pakets (alle Zahlen in Netzwerk-Byte-Reihenfolge):
+
+  alfred_tlv              type=0 (PUSH_DATA), version=0, length
+  alfred_transaction_mgmt id, seqno
+  alfred_data             source[6], alfred_tlv (Datentyp, Version,
+                          Länge), Nutzdaten
+
+Abfrage (ALFRED_REQUEST) eines Datentyps:
+
+  alfred_tlv              type=2 (REQUEST), version=0, length=3
+  requested_type, tx_id
+
+Der Server antwortet mit einem oder mehreren Push-Paketen, die je
+mehrere alfred_data-Blöcke (einen je Quell-MAC) enthalten können, und
+schließt dann die Verbindung. Bei einem Fehler kommt statt dessen ein
+Paket vom Typ STATUS_ERROR mit dem Fehlercode als seqno.
+
+Vergleiche dazu: alfred/packet.h und alfred/client.c
+
+Die Nutzdaten werden als kompaktes JSON mit zlib komprimiert. Damit
+unveränderte Daten (vor allem nodeinfo) nicht jedesmal neu komprimiert
+und übertragen werden, gibt es den PayloadCache.
+"""
+
+import os
+import json
+import zlib
+import time
+import socket
+import struct
+import random
+import hashlib
+
+ALFRED_SOCK = '/var/run/alfred.sock'
+
+ALFRED_VERSION = 0
+
+ALFRED_PUSH_DATA = 0
+ALFRED_REQUEST = 2
+ALFRED_STATUS_TXEND = 3
+ALFRED_STATUS_ERROR = 4
+
+_tlv = struct.Struct('!BBH')
+_tx = struct.Struct('!HH')
+_data = struct.Struct('!6sBBH')
+_request = struct.Struct('!BH')
+
+# So lange hält alfred Daten vor, wenn sie nicht erneuert werden
+# (ALFRED_DATA_TIMEOUT in alfred.h)
+ALFRED_DATA_TIMEOUT = 600
+
+# MAX_PAYLOAD aus alfred.h abzüglich der Kopfdaten
+MAX_PAYLOAD = (1 << 16) - 1 - 8
+MAX_DATA = MAX_PAYLOAD - _tlv.size - _tx.size - _data.size
+
+class AlfredError(Exception):
+    pass
+
+def pack_push_data(datatype, payload, version=0, txid=None):
+    if len(payload) > MAX_DATA:
+        raise AlfredError("Payload for type {} too large ({} > {} bytes)".format(datatype, len(payload), MAX_DATA))
+    if txid is None:
+        txid = random.randint(0, 0xffff)
+    return b''.join((
+        _tlv.pack(ALFRED_PUSH_DATA, ALFRED_VERSION, _tx.size + _data.size + len(payload)),
+        _tx.pack(txid, 0),
+        _data.pack(b'\0' * 6, datatype, version, len(payload)),
+        payload
+    ))
+
+def pack_request(datatype, txid=None):
+    if txid is None:
+        txid = random.randint(0, 0xffff)
+    return _tlv.pack(ALFRED_REQUEST, ALFRED_VERSION, _request.size) + _request.pack(datatype, txid)
+
+def format_mac(raw):
+    return ':'.join('{:02x}'.format(b) for b in raw)
+
+def parse_push_data(packet):
+    """
+    Datenblöcke eines Push-Pakets (ohne alfred_tlv) als Tupel
+    (Quell-MAC, Datentyp, Version, Nutzdaten)
+    """
+    pos = _tx.size
+    while pos + _data.size <= len(packet):
+        source, datatype, version, length = _data.unpack_from(packet, pos)
+        pos += _data.size
+        if pos + length > len(packet):
+            raise AlfredError("Truncated data block from {}".format(format_mac(source)))
+        yield format_mac(source), datatype, version, packet[pos:pos + length]
+        pos += length
+
+class AlfredClient(object):
+
+    def __init__(self, sockpath=ALFRED_SOCK, timeout=5.0):
+        self.sockpath = sockpath
+        self.timeout = timeout
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.sockpath)
+        except (FileNotFoundError, ConnectionRefusedError) as err:
+            sock.close()
+            raise AlfredError("Cannot connect to alfred at {}: {}".format(self.sockpath, err.strerror))
+        return sock
+
+    def _check_status(self, sock, datatype):
+        # Der Server schließt die Verbindung nach der Verarbeitung,
+        # im Fehlerfall kommt vorher noch eine Statusmeldung
+        reply = b''
+        try:
+            while True:
+                buf = sock.recv(256)
+                if not buf:
+                    break
+                reply += buf
+        except socket.timeout:
+            pass
+        if len(reply) < _tlv.size + _tx.size:
+            return
+        rtype, rversion, rlength = _tlv.unpack_from(reply)
+        if rtype == ALFRED_STATUS_ERROR:
+            txid, code = _tx.unpack_from(reply, _tlv.size)
+            raise AlfredError("alfred rejected type {}: {}".format(datatype, os.strerror(code)))
+
+    def push(self, datatype, payload, version=0):
+        packet = pack_push_data(datatype, payload, version)
+        sock = self._connect()
+        try:
+            sock.sendall(packet)
+            sock.shutdown(socket.SHUT_WR)
+            self._check_status(sock, datatype)
+        except OSError as err:
+            raise AlfredError("Communication error with alfred (type {}): {}".format(datatype, err))
+        finally:
+            sock.close()
+
+    def _recv_exactly(self, sock, size):
+        buf = b''
+        while len(buf) < size:
+            chunk = sock.recv(size - len(buf))
+            if not chunk:
+                if buf:
+                    raise AlfredError("Connection closed by alfred in the middle of a packet")
+                return None
+            buf += chunk
+        return buf
+
+    def request(self, datatype):
+        """
+        Alle Daten eines Typs abfragen (wie "alfred -r <typ>").
+        Liefert ein Dictionary Quell-MAC -> Nutzdaten.
+        """
+        result = {}
+        sock = self._connect()
+        try:
+            sock.sendall(pack_request(datatype))
+            while True:
+                header = self._recv_exactly(sock, _tlv.size)
+                if header is None:
+                    break
+                rtype, rversion, rlength = _tlv.unpack(header)
+                packet = self._recv_exactly(sock, rlength)
+                if packet is None or len(packet) < _tx.size:
+                    raise AlfredError("Short reply from alfred (type {})".format(datatype))
+                if rtype == ALFRED_STATUS_ERROR:
+                    txid, code = _tx.unpack_from(packet)
+                    raise AlfredError("alfred rejected request for type {}: {}".format(datatype, os.strerror(code)))
+                if rtype == ALFRED_STATUS_TXEND:
+                    break
+                if rtype != ALFRED_PUSH_DATA:
+                    raise AlfredError("Unexpected reply type {} from alfred".format(rtype))
+                for source, dtype, version, payload in parse_push_data(packet):
+                    if dtype == datatype:
+                        result[source] = payload
+        except OSError as err:
+            raise AlfredError("Communication error with alfred (type {}): {}".format(datatype, err))
+        finally:
+            sock.close()
+        return result
+
+    def push_many(self, data):
+        """
+        Mehrere Datentypen in einem Durchgang übertragen.
+        data ist ein Dictionary Datentyp -> Nutzdaten. Ein Fehler bei
+        einem Typ verhindert nicht die Übertragung der übrigen, die
+        Fehler werden gesammelt zurückgegeben.
+        """
+        errors = {}
+        for datatype, payload in data.items():
+            try:
+                self.push(datatype, payload)
+            except AlfredError as err:
+                errors[datatype] = err
+        return errors
+
+class PayloadCache(object):
+    """
+    Letzter serialisierter und komprimierter Stand je Datentyp.
+
+    Anhand eines Hashwerts über das JSON wird erkannt, ob sich die Daten
+    geändert haben. Unveränderte Daten werden nicht neu komprimiert und
+    nur alle refresh Sekunden erneut übertragen, damit alfred sie nicht
+    vergißt.
+
+    Ist metrics angegeben (ffpi.metrics.Metrics), werden die Zeiten für
+    Serialisieren und Komprimieren dort eingetragen.
+    """
+
+    def __init__(self, level=6, refresh=ALFRED_DATA_TIMEOUT // 2, metrics=None):
+        self.level = level
+        self.refresh = refresh
+        self.metrics = metrics
+        self.entries = {}
+        self.stats = {'serialized': 0, 'compressed': 0, 'sent': 0,
+                      'skipped': 0, 'bytes_raw': 0, 'bytes_sent': 0}
+
+    @staticmethod
+    def serialize(data):
+        return json.dumps(data, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+    def get(self, datatype, data, now=None):
+        """
+        Komprimierte Nutzdaten für datatype, None wenn nichts
+        übertragen werden muß.
+        """
+        if now is None:
+            now = time.monotonic()
+        t0 = time.monotonic()
+        raw = self.serialize(data)
+        digest = hashlib.sha1(raw).digest()
+        if self.metrics:
+            self.metrics.add('serialize', time.monotonic() - t0)
+        self.stats['serialized'] += 1
+        self.stats['bytes_raw'] += len(raw)
+        entry = self.entries.get(datatype)
+        if entry is not None and entry['digest'] == digest:
+            if now - entry['sent'] < self.refresh:
+                self.stats['skipped'] += 1
+                return None
+        else:
+            t0 = time.monotonic()
+            entry = {'digest': digest, 'blob': zlib.compress(raw, self.level)}
+            if self.metrics:
+                self.metrics.add('compress', time.monotonic() - t0)
+            self.entries[datatype] = entry
+            self.stats['compressed'] += 1
+        entry['sent'] = now
+        self.stats['sent'] += 1
+        self.stats['bytes_sent'] += len(entry['blob'])
+        return entry['blob']
+
+    def invalidate(self, datatype=None):
+        # Nach einem Übertragungsfehler beim nächsten Mal erneut senden
+        if datatype is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(datatype, None)
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+"""
+Zugriff auf batman-adv über Generic Netlink
+
+Ersetzt die Aufrufe von "batctl meshif bat0 gwl|if|o|n" und das
+Zerlegen der Textausgabe an festen Spaltenpositionen. Die Anfragen
+gehen direkt an die Netlink-Familie "batadv" des Kernelmoduls, die
+Antworten werden als Records (namedtuple) geliefert. Originatoren und
+Nachbarn werden beim Empfang einzeln weitergereicht, damit auch große
+Tabellen ohne Zwischenliste verarbeitet werden können.
+
+Vergleiche dazu: include/uapi/linux/batman_adv.h und batctl/netlink.c
+"""
+
+import os
+import socket
+import struct
+from collections import namedtuple
+
+NETLINK_GENERIC = 16
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+NLM_F_REQUEST = 0x01
+NLM_F_ACK = 0x04
+NLM_F_DUMP = 0x300
+
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+BATADV_NL_NAME = 'batadv'
+BATADV_NL_VERSION = 1
+
+# enum batadv_nl_commands
+BATADV_CMD_GET_MESH = 1
+BATADV_CMD_GET_HARDIF = 5
+BATADV_CMD_GET_ORIGINATORS = 8
+BATADV_CMD_GET_NEIGHBORS = 9
+BATADV_CMD_GET_GATEWAYS = 10
+
+# enum batadv_nl_attrs
+BATADV_ATTR_VERSION = 1
+BATADV_ATTR_ALGO_NAME = 2
+BATADV_ATTR_MESH_IFINDEX = 3
+BATADV_ATTR_MESH_IFNAME = 4
+BATADV_ATTR_MESH_ADDRESS = 5
+BATADV_ATTR_HARD_IFINDEX = 6
+BATADV_ATTR_HARD_IFNAME = 7
+BATADV_ATTR_HARD_ADDRESS = 8
+BATADV_ATTR_ORIG_ADDRESS = 9
+BATADV_ATTR_ACTIVE = 15
+BATADV_ATTR_FLAG_BEST = 22
+BATADV_ATTR_LAST_SEEN_MSECS = 23
+BATADV_ATTR_NEIGH_ADDRESS = 24
+BATADV_ATTR_TQ = 25
+BATADV_ATTR_THROUGHPUT = 26
+BATADV_ATTR_BANDWIDTH_UP = 27
+BATADV_ATTR_BANDWIDTH_DOWN = 28
+BATADV_ATTR_ROUTER = 29
+
+_nlmsghdr = struct.Struct('=IHHII')
+_genlmsghdr = struct.Struct('=BBH')
+_nlattr = struct.Struct('=HH')
+_u8 = struct.Struct('=B')
+_u16 = struct.Struct('=H')
+_u32 = struct.Struct('=I')
+
+# Anzahl der Klassen für die Verteilung der TQ-Werte (0..255)
+TQ_BUCKETS = 8
+
+Gateway = namedtuple('Gateway', ('orig', 'best', 'tq', 'throughput', 'router', 'hardif',
+                                 'bandwidth_down', 'bandwidth_up'))
+HardIf = namedtuple('HardIf', ('ifindex', 'ifname', 'address', 'active'))
+Originator = namedtuple('Originator', ('orig', 'neigh', 'hardif_index', 'last_seen_msecs',
+                                       'tq', 'throughput', 'best'))
+Neighbour = namedtuple('Neighbour', ('neigh', 'hardif_index', 'last_seen_msecs', 'throughput'))
+
+class BatadvError(Exception):
+    pass
+
+def mac(raw):
+    return ':'.join('{:02x}'.format(b) for b in raw) if raw is not None else None
+
+def u8(raw):
+    return _u8.unpack(raw[:1])[0] if raw is not None else None
+
+def u32(raw):
+    return _u32.unpack(raw[:4])[0] if raw is not None else None
+
+def string(raw):
+    return raw.split(b'\0', 1)[0].decode('utf-8') if raw is not None else None
+
+def pack_attr(atype, value):
+    length = _nlattr.size + len(value)
+    return _nlattr.pack(length, atype) + value + b'\0' * (-length % 4)
+
+def parse_attrs(data, offset=0):
+    attrs = {}
+    while offset + _nlattr.size <= len(data):
+        length, atype = _nlattr.unpack_from(data, offset)
+        if length < _nlattr.size:
+            break
+        attrs[atype & 0x3fff] = data[offset + _nlattr.size:offset + length]
+        offset += (length + 3) & ~3
+    return attrs
+
+class Netlink(object):
+    """
+    Generic-Netlink-Socket. Für Tests kann ein beliebiges Objekt mit
+    send() und recv() als sock übergeben werden.
+    """
+
+    def __init__(self, sock=None, timeout=5.0):
+        if sock is None:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+            sock.settimeout(timeout)
+            sock.bind((0, 0))
+        self.sock = sock
+        self.seq = 0
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def request(self, family, cmd, version, attrs=b'', flags=NLM_F_REQUEST):
+        self.seq += 1
+        payload = _genlmsghdr.pack(cmd, version, 0) + attrs
+        self.sock.send(_nlmsghdr.pack(_nlmsghdr.size + len(payload), family, flags, self.seq, 0) + payload)
+        return self.seq
+
+    def responses(self, seq):
+        """
+        Liefert die Attribute jeder Antwortnachricht zu seq, bis der
+        Kernel das Ende meldet
+        """
+        while True:
+            data = self.sock.recv(65536)
+            if not data:
+                raise BatadvError("netlink socket closed")
+            offset = 0
+            while offset + _nlmsghdr.size <= len(data):
+                length, mtype, flags, mseq, pid = _nlmsghdr.unpack_from(data, offset)
+                if length < _nlmsghdr.size:
+                    raise BatadvError("malformed netlink message")
+                body = data[offset + _nlmsghdr.size:offset + length]
+                offset += (length + 3) & ~3
+                if mseq != seq:
+                    continue
+                if mtype == NLMSG_DONE:
+                    return
+                if mtype == NLMSG_ERROR:
+                    error = struct.unpack_from('=i', body)[0]
+                    if error == 0:
+                        return
+                    raise BatadvError(os.strerror(-error))
+                yield parse_attrs(body, _genlmsghdr.size)
+                if not flags & 0x02:
+                    # Kein NLM_F_MULTI: Einzelantwort
+                    return
+
+    def family_id(self, name):
+        seq = self.request(GENL_ID_CTRL, CTRL_CMD_GETFAMILY, 1,
+                           pack_attr(CTRL_ATTR_FAMILY_NAME, name.encode('ascii') + b'\0'))
+        try:
+            for attrs in self.responses(seq):
+                if CTRL_ATTR_FAMILY_ID in attrs:
+                    return _u16.unpack(attrs[CTRL_ATTR_FAMILY_ID][:2])[0]
+        except BatadvError:
+            pass
+        raise BatadvError("netlink family {} not found".format(name))
+
+class Batadv(object):
+    """
+    Abfragen eines batman-adv Mesh-Interfaces.
+    Jede Abfrage verwendet einen eigenen Netlink-Socket, damit mehrere
+    Threads gleichzeitig abfragen können. connect erzeugt den Socket,
+    für Tests kann hier ein Ersatz übergeben werden.
+    """
+
+    def __init__(self, meshif='bat0', connect=Netlink):
+        self.meshif = meshif
+        self.connect = connect
+        self.family = None
+
+    def dump(self, cmd):
+        with self.connect() as nl:
+            if self.family is None:
+                self.family = nl.family_id(BATADV_NL_NAME)
+            try:
+                ifindex = socket.if_nametoindex(self.meshif)
+            except OSError:
+                raise BatadvError("mesh interface {} not found".format(self.meshif))
+            seq = nl.request(self.family, cmd, BATADV_NL_VERSION,
+                             pack_attr(BATADV_ATTR_MESH_IFINDEX, _u32.pack(ifindex)),
+                             NLM_F_REQUEST | NLM_F_DUMP)
+            for attrs in nl.responses(seq):
+                yield attrs
+
+    def gateways(self):
+        return [Gateway(mac(a.get(BATADV_ATTR_ORIG_ADDRESS)),
+                        BATADV_ATTR_FLAG_BEST in a,
+                        u8(a.get(BATADV_ATTR_TQ)),
+                        u32(a.get(BATADV_ATTR_THROUGHPUT)),
+                        mac(a.get(BATADV_ATTR_ROUTER)),
+                        string(a.get(BATADV_ATTR_HARD_IFNAME)),
+                        u32(a.get(BATADV_ATTR_BANDWIDTH_DOWN)),
+                        u32(a.get(BATADV_ATTR_BANDWIDTH_UP)))
+                for a in self.dump(BATADV_CMD_GET_GATEWAYS)]
+
+    def hardifs(self):
+        return [HardIf(u32(a.get(BATADV_ATTR_HARD_IFINDEX)),
+                       string(a.get(BATADV_ATTR_HARD_IFNAME)),
+                       mac(a.get(BATADV_ATTR_HARD_ADDRESS)),
+                       BATADV_ATTR_ACTIVE in a)
+                for a in self.dump(BATADV_CMD_GET_HARDIF)]
+
+    def originators(self):
+        for a in self.dump(BATADV_CMD_GET_ORIGINATORS):
+            yield Originator(mac(a.get(BATADV_ATTR_ORIG_ADDRESS)),
+                             mac(a.get(BATADV_ATTR_NEIGH_ADDRESS)),
+                             u32(a.get(BATADV_ATTR_HARD_IFINDEX)),
+                             u32(a.get(BATADV_ATTR_LAST_SEEN_MSECS)),
+                             u8(a.get(BATADV_ATTR_TQ)),
+                             u32(a.get(BATADV_ATTR_THROUGHPUT)),
+                             BATADV_ATTR_FLAG_BEST in a)
+
+    def neighbours(self):
+        for a in self.dump(BATADV_CMD_GET_NEIGHBORS):
+            yield Neighbour(mac(a.get(BATADV_ATTR_NEIGH_ADDRESS)),
+                            u32(a.get(BATADV_ATTR_HARD_IFINDEX)),
+                            u32(a.get(BATADV_ATTR_LAST_SEEN_MSECS)),
+                            u32(a.get(BATADV_ATTR_THROUGHPUT)))
+
+    def gateway_macs(self):
+        return set(gw.orig for gw in self.gateways())
+
+    def ifnames(self):
+        return {h.ifindex: h.ifname for h in self.hardifs()}
+
+    def originator_stats(self):
+        """
+        Kennzahlen der Originator-Tabelle in einem Durchgang:
+        Anzahl der Originatoren, Verteilung der TQ-Werte und Anzahl der
+        besten Next-Hops je Hard-Interface.
+        Gezählt werden nur die als beste markierten Einträge, davon gibt
+        es je Originator genau einen. Es wird nichts zwischengespeichert,
+        der Speicherbedarf hängt nicht von der Größe der Tabelle ab.
+        """
+        ifnames = self.ifnames()
+        count = 0
+        tq = [0] * TQ_BUCKETS
+        nexthops = {}
+        for a in self.dump(BATADV_CMD_GET_ORIGINATORS):
+            if BATADV_ATTR_FLAG_BEST not in a:
+                continue
+            count += 1
+            value = a.get(BATADV_ATTR_TQ)
+            if value is not None:
+                tq[value[0] * TQ_BUCKETS >> 8] += 1
+            ifindex = u32(a.get(BATADV_ATTR_HARD_IFINDEX))
+            ifname = ifnames.get(ifindex, str(ifindex))
+            nexthops[ifname] = nexthops.get(ifname, 0) + 1
+        width = 256 // TQ_BUCKETS
+        return {'count': count,
+                'tq': {'{}-{}'.format(i * width, (i + 1) * width - 1): n for i, n in enumerate(tq)},
+                'nexthops': nexthops}
+
+    def neighbour_stats(self):
+        """
+        Anzahl der Nachbarn insgesamt und je Hard-Interface
+        """
+        ifnames = self.ifnames()
+        count = 0
+        hardifs = {}
+        for a in self.dump(BATADV_CMD_GET_NEIGHBORS):
+            count += 1
+            ifindex = u32(a.get(BATADV_ATTR_HARD_IFINDEX))
+            ifname = ifnames.get(ifindex, str(ifindex))
+            hardifs[ifname] = hardifs.get(ifname, 0) + 1
+        return {'count': count, 'hardifs': hardifs}
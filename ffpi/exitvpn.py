@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+
+"""
+Zustand der Exit-VPNs (OpenVPN-Tunnel für den ausgehenden Verkehr)
+
+Alle in /etc/openvpn/*.conf konfigurierten Exits werden gleichzeitig
+geprüft: je Exit gibt es einen ICMP-Socket, der mit SO_BINDTODEVICE an
+das Tunnel-Interface gebunden ist. Eine Prüfrunde schickt an jedes Ziel
+über jeden Exit ein Echo Request und wartet mit select() gemeinsam auf
+alle Antworten, eine Runde dauert also höchstens timeout Sekunden,
+unabhängig von der Anzahl der Exits.
+
+Je Exit werden die letzten window Ergebnisse (Laufzeit oder Verlust)
+aufbewahrt. Daraus ergibt sich, ob der Exit funktioniert und eine
+Rangfolge nach Laufzeit und Verlust, aus der bei einem Ausfall der
+beste funktionierende Exit gewählt wird.
+
+Bei "dev tun" bzw. "dev tap" ohne Nummer vergibt erst der Kernel den
+Namen des Interfaces. Er wird beim laufenden OpenVPN-Prozeß der
+Konfiguration nachgesehen (openvpn_devices()) und vor jeder Prüfrunde
+aufgefrischt.
+
+Welcher Exit aktiv ist, ergibt sich aus den MASQUERADE-Regeln. Dafür
+muß iptables gestartet werden, das Ergebnis wird deshalb nat_ttl
+Sekunden aufbewahrt und im Hintergrund-Thread aufgefrischt, so daß die
+Items im Daemon-Modus kein Programm starten.
+
+Verwendet werden ungeprivilegierte ICMP-Sockets (SOCK_DGRAM, siehe
+net.ipv4.ping_group_range), sonst Raw-Sockets. SO_BINDTODEVICE
+erfordert in jedem Fall CAP_NET_RAW.
+"""
+
+import os
+import glob
+import time
+import errno
+import select
+import logging
+import socket
+import struct
+import threading
+import subprocess
+from collections import deque, namedtuple
+
+log = logging.getLogger(__name__)
+
+OPENVPN_DIR = '/etc/openvpn'
+OPENVPN_DEFAULT = '/etc/default/openvpn'
+# Geräte, deren Nummer der Kernel vergibt
+DYNAMIC_DEVICES = ('tun', 'tap')
+TARGETS = ('217.172.186.141', '81.7.16.37')
+
+SO_BINDTODEVICE = getattr(socket, 'SO_BINDTODEVICE', 25)
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+# dynamic: das Interface ist erst bekannt, wenn OpenVPN läuft
+Exit = namedtuple('Exit', ('name', 'interface', 'country', 'dynamic'), defaults=(False,))
+
+def openvpn_devices(proc='/proc'):
+    """
+    Interfaces der laufenden OpenVPN-Prozesse als Dictionary
+    Konfiguration -> Interface. Die Konfiguration steht in der
+    Kommandozeile (--config oder *.conf), das Interface in fdinfo des
+    geöffneten /dev/net/tun (Zeile "iff:").
+    """
+    result = {}
+    for piddir in glob.glob(os.path.join(proc, '[0-9]*')):
+        try:
+            with open(os.path.join(piddir, 'comm')) as fh:
+                if fh.read().strip() != 'openvpn':
+                    continue
+            with open(os.path.join(piddir, 'cmdline'), 'rb') as fh:
+                args = fh.read().decode('utf-8', 'replace').split('\0')
+            configs = [arg for prev, arg in zip([''] + args, args)
+                       if prev == '--config' or arg.endswith('.conf')]
+            if not configs:
+                continue
+            name = os.path.basename(configs[-1])
+            if name.endswith('.conf'):
+                name = name[:-5]
+            for fdinfo in glob.glob(os.path.join(piddir, 'fdinfo', '*')):
+                with open(fdinfo) as fh:
+                    for line in fh:
+                        if line.startswith('iff:'):
+                            result[name] = line.split(':', 1)[1].strip()
+        except OSError:
+            # Prozeß beendet oder keine Berechtigung
+            continue
+    return result
+
+def load_exits(confdir=OPENVPN_DIR, proc='/proc'):
+    """
+    Exits aus den OpenVPN-Konfigurationen. Das Interface steht in der
+    Zeile dev, ohne sie heißt es wie die Konfiguration. Bei "dev tun"
+    bzw. "dev tap" wird es beim laufenden OpenVPN nachgesehen, läuft
+    es nicht, bleibt es bei tun bzw. tap (gibt es nicht). Das Land
+    steht im Kommentar "## ExitCountry = XX".
+    """
+    exits = []
+    devices = None
+    for filename in sorted(glob.glob(os.path.join(confdir, '*.conf'))):
+        name = os.path.basename(filename)[:-5]
+        interface = name
+        country = '??'
+        with open(filename) as fh:
+            for line in fh:
+                if line.startswith('## ExitCountry = '):
+                    country = line.split(' = ', 1)[1].strip()
+                elif line.split()[:1] == ['dev'] and len(line.split()) > 1:
+                    interface = line.split()[1]
+        dynamic = interface in DYNAMIC_DEVICES
+        if dynamic:
+            if devices is None:
+                devices = openvpn_devices(proc)
+            interface = devices.get(name, interface)
+        exits.append(Exit(name, interface, country, dynamic))
+    return exits
+
+def autostart(filename=OPENVPN_DEFAULT):
+    """
+    AUTOSTART aus /etc/default/openvpn als Liste, None ohne Eintrag
+    """
+    try:
+        with open(filename) as fh:
+            for line in fh:
+                if line.startswith('AUTOSTART='):
+                    return line.split('=', 1)[1].strip().strip('"').split()
+    except OSError:
+        pass
+    return None
+
+def openvpn_running():
+    for comm in glob.glob('/proc/[0-9]*/comm'):
+        try:
+            with open(comm) as fh:
+                if fh.read().strip() == 'openvpn':
+                    return True
+        except OSError:
+            pass
+    return False
+
+def nat_interfaces(timeout=10):
+    """
+    Ausgangsinterfaces der MASQUERADE-Regeln (Spalte "out")
+    """
+    result = []
+    output = subprocess.check_output(['iptables', '-t', 'nat', '-vnL', 'POSTROUTING'], timeout=timeout)
+    for line in output.decode('utf-8').splitlines():
+        fields = line.split()
+        if len(fields) > 6 and fields[2] == 'MASQUERADE':
+            result.append(fields[6])
+    return result
+
+def interface_up(interface):
+    return os.path.isdir('/sys/class/net/' + interface)
+
+def checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    s = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    s = (s >> 16) + (s & 0xffff)
+    s += s >> 16
+    return ~s & 0xffff
+
+def echo_request(ident, seq, payload=b'ffpi-exitvpn'):
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum(header + payload), ident, seq) + payload
+
+class EchoSocket(object):
+    """
+    ICMP-Socket, gebunden an ein Interface
+    """
+
+    def __init__(self, interface, ident):
+        self.interface = interface
+        self.ident = ident & 0xffff
+        try:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            self.raw = False
+        except PermissionError:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            self.raw = True
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, interface.encode('ascii'))
+            self.sock.setblocking(False)
+        except OSError:
+            self.sock.close()
+            raise
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send(self, target, seq):
+        self.sock.sendto(echo_request(self.ident, seq), (target, 0))
+
+    def replies(self):
+        """
+        Alle anliegenden Antworten als Liste von (Absender, seq)
+        """
+        result = []
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return result
+            if self.raw:
+                data = data[(data[0] & 0x0f) * 4:]
+            if len(data) < 8:
+                continue
+            icmp_type, code, csum, ident, seq = struct.unpack_from('!BBHHH', data)
+            # Bei SOCK_DGRAM setzt der Kernel die Kennung selbst
+            if icmp_type == ICMP_ECHO_REPLY and (not self.raw or ident == self.ident):
+                result.append((addr[0], seq))
+
+    def close(self):
+        self.sock.close()
+
+class Window(object):
+    """
+    Die letzten size Ergebnisse: Laufzeit in Sekunden oder None
+    """
+
+    def __init__(self, size=12):
+        self.results = deque(maxlen=size)
+
+    def add(self, rtt):
+        self.results.append(rtt)
+
+    def clear(self):
+        self.results.clear()
+
+    @property
+    def loss(self):
+        if not self.results:
+            return 1.0
+        return sum(1 for r in self.results if r is None) / len(self.results)
+
+    @property
+    def rtt(self):
+        ok = [r for r in self.results if r is not None]
+        return sum(ok) / len(ok) if ok else None
+
+class ExitProber(object):
+    """
+    Prüft alle Exits gleichzeitig, einmalig mit probe() oder mit
+    start() regelmäßig in einem eigenen Thread.
+    Ein Exit gilt als funktionsfähig, wenn sein Interface existiert
+    und der Verlust im Fenster höchstens max_loss beträgt.
+    """
+
+    def __init__(self, exits=None, targets=TARGETS, window=12, timeout=2.0, max_loss=0.5, nat_ttl=300):
+        self.exits = load_exits() if exits is None else exits
+        self.targets = tuple(targets)
+        self.timeout = timeout
+        self.max_loss = max_loss
+        self.nat_ttl = nat_ttl
+        self.windows = {e.name: Window(window) for e in self.exits}
+        self.sockets = {}
+        self.seq = 0
+        # lock schützt die Fenster, probe_lock die Sockets: gleichzeitige
+        # Prüfrunden würden sich gegenseitig die Antworten wegnehmen
+        self.lock = threading.Lock()
+        self.probe_lock = threading.Lock()
+        self.nat = None
+        self.nat_time = None
+        self.running = False
+        self.last_probe = None
+
+    def _socket(self, index, e):
+        sock = self.sockets.get(e.name)
+        if sock is None and interface_up(e.interface):
+            try:
+                sock = EchoSocket(e.interface, os.getpid() + index)
+                self.sockets[e.name] = sock
+            except OSError:
+                sock = None
+        return sock
+
+    def _drop(self, name):
+        sock = self.sockets.pop(name, None)
+        if sock is not None:
+            sock.close()
+
+    def resolve(self, proc='/proc'):
+        """
+        Interfaces der Exits mit "dev tun" bzw. "dev tap" auffrischen,
+        OpenVPN kann seit dem Laden neu gestartet worden sein. Der
+        Socket eines geänderten Exits wird neu geöffnet.
+        """
+        if not any(e.dynamic for e in self.exits):
+            return
+        devices = openvpn_devices(proc)
+        exits = []
+        for e in self.exits:
+            interface = devices.get(e.name, e.interface) if e.dynamic else e.interface
+            if interface != e.interface:
+                self._drop(e.name)
+                e = e._replace(interface=interface)
+            exits.append(e)
+        self.exits = exits
+
+    def probe(self, max_age=None):
+        """
+        Eine Prüfrunde über alle Exits und Ziele. Läuft bereits eine
+        (z.B. aus einem anderen Item), wird auf deren Ende gewartet;
+        liegt die letzte Runde weniger als max_age Sekunden zurück,
+        wird deren Ergebnis verwendet.
+        """
+        with self.probe_lock:
+            if max_age is not None and self.last_probe is not None \
+                    and time.time() - self.last_probe < max_age:
+                return
+            return self._probe()
+
+    def _probe(self):
+        self.resolve()
+        self.seq = (self.seq + 1) & 0xffff
+        seq = self.seq
+        sent = {}
+        down = []
+        # Die Sockets dieser Runde, auch wenn einer zwischendurch
+        # geschlossen wird
+        names = {}
+        start = time.monotonic()
+        for index, e in enumerate(self.exits):
+            sock = self._socket(index, e)
+            if sock is None:
+                down.append(e.name)
+                continue
+            for target in self.targets:
+                try:
+                    sock.send(target, seq)
+                    sent[(e.name, target)] = time.monotonic()
+                    names[sock] = e.name
+                except OSError as err:
+                    if err.errno in (errno.ENODEV, errno.ENXIO):
+                        # Interface ist verschwunden, neu öffnen
+                        self._drop(e.name)
+                        names.pop(sock, None)
+                        sent.update({(e.name, t): None for t in self.targets})
+                        break
+                    sent[(e.name, target)] = None
+        results = {key: None for key in sent}
+        waiting = list(names)
+        deadline = start + self.timeout
+        while waiting and any(v is None for k, v in results.items() if sent[k] is not None):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            readable, _, _ = select.select(waiting, [], [], remaining)
+            now = time.monotonic()
+            for sock in readable:
+                name = names[sock]
+                for addr, rseq in sock.replies():
+                    key = (name, addr)
+                    if rseq == seq and key in results and sent[key] is not None and results[key] is None:
+                        results[key] = now - sent[key]
+        with self.lock:
+            for name in down:
+                self.windows[name].clear()
+            for (name, target), rtt in results.items():
+                self.windows[name].add(rtt)
+            self.last_probe = time.time()
+        return results
+
+    def healthy(self, name):
+        e = next(e for e in self.exits if e.name == name)
+        window = self.windows[name]
+        return interface_up(e.interface) and bool(window.results) and window.loss <= self.max_loss
+
+    def status(self):
+        """
+        Dictionary Name -> Zustand (interface, country, up, healthy,
+        rtt in ms, loss in Prozent)
+        """
+        with self.lock:
+            result = {}
+            for e in self.exits:
+                window = self.windows[e.name]
+                rtt = window.rtt
+                result[e.name] = {
+                    'interface': e.interface,
+                    'country': e.country,
+                    'up': interface_up(e.interface),
+                    'healthy': self.healthy(e.name),
+                    'rtt': None if rtt is None else round(rtt * 1000, 1),
+                    'loss': round(window.loss * 100, 1),
+                }
+            return result
+
+    def ranking(self):
+        """
+        Exits, die besten zuerst: funktionsfähige vor den anderen,
+        dann nach Laufzeit, wobei Verluste die Laufzeit verschlechtern
+        """
+        status = self.status()
+        def score(e):
+            s = status[e.name]
+            rtt = s['rtt'] if s['rtt'] is not None else float('inf')
+            return (not s['healthy'], rtt * (1 + s['loss'] / 25.0))
+        return sorted(self.exits, key=score)
+
+    def best(self):
+        ranking = self.ranking()
+        if ranking and self.healthy(ranking[0].name):
+            return ranking[0]
+        return None
+
+    def nat_interfaces(self, max_age=None):
+        """
+        Ausgangsinterfaces der MASQUERADE-Regeln, höchstens max_age
+        (Standard nat_ttl) Sekunden alt
+        """
+        if max_age is None:
+            max_age = self.nat_ttl
+        if self.nat is None or time.monotonic() - self.nat_time > max_age:
+            self.nat = nat_interfaces()
+            self.nat_time = time.monotonic()
+        return self.nat
+
+    def active(self):
+        # Der Exit, auf dessen Interface maskiert wird
+        nat = self.nat_interfaces()
+        for e in self.exits:
+            if e.interface in nat:
+                return e
+        return None
+
+    def _loop(self, interval):
+        while self.running:
+            t0 = time.monotonic()
+            try:
+                self.probe()
+                # Vorzeitig auffrischen, damit Items nie darauf warten
+                self.nat_interfaces(max(self.nat_ttl - 2 * interval, interval))
+            except Exception as err:
+                # Der Thread darf nicht enden, sonst wird nie wieder
+                # geprüft, obwohl running gesetzt ist
+                log.error("Exit VPN probe failed: {}".format(err))
+            time.sleep(max(interval - (time.monotonic() - t0), 0))
+
+    def start(self, interval=5):
+        self.running = True
+        thread = threading.Thread(target=self._loop, args=(interval,), name='exitvpn', daemon=True)
+        thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        for name in list(self.sockets):
+            self._drop(name)
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+
+"""
+Abfrage des Status-Sockets von fastd
+
+Es können beliebig viele fastd-Instanzen laufen (siehe init.d/fastd),
+jede mit einer eigenen Konfiguration /etc/fastd/<instanz>/fastd.conf.
+Die Status-Sockets werden aus den Konfigurationen ermittelt und
+gleichzeitig mit asyncio abgefragt, jede Abfrage mit einem Timeout.
+
+fastd liefert beim Verbinden ein JSON-Dokument und schließt danach den
+Socket:
+
+  {"uptime": ..., "interface": "...", "statistics": {...},
+   "peers": {"<key>": {"name": ..., "connection": {...}}, ...}}
+
+Die Antwort wird beim Empfang stückweise zerlegt, jeder Peer wird
+weitergegeben, sobald er vollständig ist. Das komplette Dokument liegt
+also nie als String im Speicher.
+"""
+
+import os
+import re
+import glob
+import json
+import codecs
+import asyncio
+from collections import namedtuple
+
+CONFIG_DIR = '/etc/fastd'
+SOCKET_DIR = '/var/run/fastd'
+
+_regex_socket = re.compile(r'^\s*status\s+socket\s+"([^"]+)"\s*;', re.M)
+
+StatusResult = namedtuple('StatusResult', ('instance', 'sockpath', 'header', 'peers', 'error'))
+
+def instance_socket(instance, config_dir=CONFIG_DIR):
+    """
+    Status-Socket einer Instanz laut fastd.conf, ersatzweise der
+    übliche Pfad /var/run/fastd/<instanz>.sock
+    """
+    try:
+        with open(os.path.join(config_dir, instance, 'fastd.conf')) as fh:
+            conf = re.sub(r'#.*', '', fh.read())
+        match = _regex_socket.search(conf)
+        if match:
+            return match.group(1)
+    except OSError:
+        pass
+    return os.path.join(SOCKET_DIR, instance + '.sock')
+
+def discover(config_dir=CONFIG_DIR):
+    """
+    Alle konfigurierten Instanzen mit ihrem Status-Socket
+    """
+    instances = {}
+    for conf in sorted(glob.glob(os.path.join(config_dir, '*', 'fastd.conf'))):
+        instance = os.path.basename(os.path.dirname(conf))
+        instances[instance] = instance_socket(instance, config_dir)
+    return instances
+
+class StatusParser(object):
+    """
+    Zerlegt das Status-Dokument stückweise. feed() liefert die Peers,
+    die mit den neuen Daten vollständig geworden sind, als Liste von
+    Tupeln (Schlüssel, Peer). Alle übrigen Angaben der obersten Ebene
+    landen in header.
+    """
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.state = 'start'
+        self.key = None
+        self.header = {}
+
+    def _skip(self, pos, chars=' \t\r\n'):
+        buf = self.buf
+        while pos < len(buf) and buf[pos] in chars:
+            pos += 1
+        return pos
+
+    def _expect(self, pos, char):
+        pos = self._skip(pos)
+        if pos >= len(self.buf):
+            return None
+        if self.buf[pos] != char:
+            raise ValueError("Expected {!r} at position {}".format(char, pos))
+        return pos + 1
+
+    def _decode(self, pos):
+        # Wert dekodieren; None, wenn er noch nicht vollständig ist.
+        # Eine Zahl ist erst mit dem folgenden Trennzeichen vollständig,
+        # sonst würde z.B. "123." als 123 gelesen.
+        pos = self._skip(pos)
+        try:
+            value, end = self.decoder.raw_decode(self.buf, pos)
+        except ValueError:
+            return None
+        if end >= len(self.buf):
+            return None
+        if self.buf[pos] not in '"{[':
+            after = self._skip(end)
+            if after >= len(self.buf) or self.buf[after] not in ',}]':
+                return None
+        return value, end
+
+    def _key(self, pos):
+        # '"schlüssel" :' lesen, None wenn noch unvollständig
+        pos = self._skip(pos)
+        if pos >= len(self.buf):
+            return None
+        if self.buf[pos] != '"':
+            raise ValueError("Expected key at position {}".format(pos))
+        result = self._decode(pos)
+        if result is None:
+            return None
+        key, pos = result
+        pos = self._expect(pos, ':')
+        if pos is None:
+            return None
+        return key, pos
+
+    def _step(self, peers):
+        pos = self.pos
+        state = self.state
+        if state == 'start':
+            pos = self._expect(pos, '{')
+            if pos is None:
+                return False
+            self.state = 'key'
+        elif state in ('key', 'peer_key'):
+            pos = self._skip(pos, ' \t\r\n,')
+            if pos >= len(self.buf):
+                return False
+            if self.buf[pos] == '}':
+                pos += 1
+                self.state = 'end' if state == 'key' else 'key'
+            else:
+                result = self._key(pos)
+                if result is None:
+                    return False
+                self.key, pos = result
+                if state == 'peer_key':
+                    self.state = 'peer_value'
+                elif self.key == 'peers':
+                    self.state = 'peers_open'
+                else:
+                    self.state = 'value'
+        elif state == 'peers_open':
+            pos = self._expect(pos, '{')
+            if pos is None:
+                return False
+            self.state = 'peer_key'
+        elif state in ('value', 'peer_value'):
+            result = self._decode(pos)
+            if result is None:
+                return False
+            value, pos = result
+            if state == 'peer_value':
+                peers.append((self.key, value))
+                self.state = 'peer_key'
+            else:
+                self.header[self.key] = value
+                self.state = 'key'
+        else:
+            return False
+        self.pos = pos
+        return True
+
+    def feed(self, data):
+        if isinstance(data, bytes):
+            data = self.utf8.decode(data)
+        if self.pos > 65536:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        self.buf += data
+        peers = []
+        while self._step(peers):
+            pass
+        return peers
+
+    def close(self):
+        if self.state != 'end':
+            raise ValueError("Incomplete fastd status document")
+
+async def query_async(sockpath, timeout=5.0, on_peer=None):
+    """
+    Einen Status-Socket abfragen. Ohne on_peer werden die Peers als
+    Dictionary gesammelt, sonst wird on_peer(schlüssel, peer) für jeden
+    Peer aufgerufen und nichts aufbewahrt.
+    Liefert (header, peers).
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(sockpath), timeout)
+    parser = StatusParser()
+    peers = {}
+    try:
+        while True:
+            data = await asyncio.wait_for(reader.read(65536), max(deadline - loop.time(), 0))
+            if not data:
+                break
+            for key, peer in parser.feed(data):
+                if on_peer is None:
+                    peers[key] = peer
+                else:
+                    on_peer(key, peer)
+        parser.close()
+    finally:
+        writer.close()
+    return parser.header, peers
+
+async def _query_instance(instance, sockpath, timeout, on_peer):
+    try:
+        callback = None if on_peer is None else lambda key, peer: on_peer(instance, key, peer)
+        header, peers = await query_async(sockpath, timeout, callback)
+        return StatusResult(instance, sockpath, header, peers, None)
+    except (OSError, ValueError, asyncio.TimeoutError) as err:
+        return StatusResult(instance, sockpath, {}, {}, err if str(err) else "timeout")
+
+async def query_all_async(instances=None, timeout=5.0, on_peer=None):
+    if instances is None:
+        instances = discover()
+    return await asyncio.gather(*(_query_instance(instance, sockpath, timeout, on_peer)
+                                  for instance, sockpath in instances.items()))
+
+def query_all(instances=None, timeout=5.0, on_peer=None):
+    """
+    Alle Instanzen gleichzeitig abfragen (instances: Dictionary
+    Instanz -> Socket, Standard: alle konfigurierten). Fehler werden
+    nicht ausgelöst, sondern im Feld error des Ergebnisses geliefert.
+    on_peer(instanz, schlüssel, peer) siehe query_async().
+    """
+    return asyncio.run(query_all_async(instances, timeout, on_peer))
+
+Peer = namedtuple('Peer', ('key', 'name', 'macs', 'gateway', 'instance', 'address'))
+
+class PeerIndex(object):
+    """
+    Verbundene Peers, erreichbar über Schlüssel, MAC-Adresse und Name.
+    Ob ein Peer ein Gateway ist, wird beim Einfügen anhand der
+    Gateway-MACs entschieden. add() kann direkt als on_peer an
+    query_all() übergeben werden.
+    """
+
+    def __init__(self, gw_macs=()):
+        self.gw_macs = frozenset(gw_macs)
+        self.by_key = {}
+        self.by_mac = {}
+        self.by_name = {}
+        self.total = {}
+
+    def add(self, instance, key, peer):
+        self.total[instance] = self.total.get(instance, 0) + 1
+        conn = peer.get('connection')
+        if not conn:
+            return
+        macs = tuple(conn.get('mac_addresses') or ())
+        self._insert(Peer(key, peer.get('name'), macs, not self.gw_macs.isdisjoint(macs),
+                          instance, peer.get('address')))
+
+    def _insert(self, p):
+        self.by_key[p.key] = p
+        for mac in p.macs:
+            self.by_mac[mac] = p
+        if p.name:
+            self.by_name[p.name] = p
+
+    def keep(self, other, instance):
+        """
+        Peers einer Instanz unverändert aus einem anderen Stand
+        übernehmen, z.B. wenn ihre Abfrage fehlgeschlagen ist
+        """
+        if instance in other.total:
+            self.total[instance] = other.total[instance]
+        for p in other.by_key.values():
+            if p.instance == instance:
+                self._insert(p)
+
+    def __len__(self):
+        return len(self.by_key)
+
+    def gateways(self):
+        return [p for p in self.by_key.values() if p.gateway]
+
+    def peers(self):
+        return [p for p in self.by_key.values() if not p.gateway]
+
+    def diff(self, new):
+        """
+        Änderungen gegenüber einem neueren Stand als Liste von Tupeln
+        (Ereignis, alter Peer, neuer Peer) mit den Ereignissen
+        'connect', 'disconnect' und 'mac'
+        """
+        events = []
+        for key, p in self.by_key.items():
+            q = new.by_key.get(key)
+            if q is None:
+                events.append(('disconnect', p, None))
+            elif q.macs != p.macs:
+                events.append(('mac', p, q))
+        for key, q in new.by_key.items():
+            if key not in self.by_key:
+                events.append(('connect', None, q))
+        return events
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+"""
+Eigenschaften des Rechners, die sich nur selten ändern
+
+Die Werte werden direkt aus /proc, /sys und /etc gelesen, statt dafür
+Programme wie cat, nproc, lsb_release oder runlevel zu starten.
+Zusätzlich werden sie in einer Datei zwischengespeichert. Ein Wert
+wird neu ermittelt, wenn
+  - der Rechner neu gestartet wurde (andere boot_id) oder
+  - sich die mtime einer der Dateien geändert hat, von denen der Wert
+    abhängt (z.B. das fastd-Programm nach einem Update).
+"""
+
+import os
+import json
+import glob
+import shutil
+import struct
+import threading
+import subprocess
+
+from ffpi.util import write_atomic
+
+CACHEFILE = '/var/cache/ffpi/hostfacts.json'
+
+BOOT_ID = '/proc/sys/kernel/random/boot_id'
+OS_RELEASE = '/etc/os-release'
+DEBIAN_VERSION = '/etc/debian_version'
+UTMP = '/var/run/utmp'
+
+# Namen wie sie lsb_release -is liefert
+_distributor = {'debian': 'Debian', 'ubuntu': 'Ubuntu', 'raspbian': 'Raspbian',
+                'linuxmint': 'Linuxmint', 'devuan': 'Devuan'}
+
+def read_first_line(filename):
+    with open(filename) as fh:
+        return fh.readline().strip()
+
+def boot_id():
+    try:
+        return read_first_line(BOOT_ID)
+    except OSError:
+        return None
+
+def cpu_model():
+    with open('/proc/cpuinfo') as fh:
+        for line in fh:
+            key, sep, value = line.partition(':')
+            if sep and key.strip() == 'model name':
+                return ' '.join(value.split())
+    return ''
+
+def nproc():
+    # Wie nproc: berücksichtigt die CPU-Affinität des Prozesses
+    return str(len(os.sched_getaffinity(0)))
+
+def os_release(filename=OS_RELEASE):
+    result = {}
+    with open(filename) as fh:
+        for line in fh:
+            key, sep, value = line.strip().partition('=')
+            if sep and not key.startswith('#'):
+                result[key] = value.strip('"\'')
+    return result
+
+def firmware_base():
+    info = os_release()
+    osid = info.get('ID', '')
+    return _distributor.get(osid, info.get('NAME', osid).split(' ')[0])
+
+def firmware_release():
+    if firmware_base() == 'Debian':
+        return read_first_line(DEBIAN_VERSION)
+    return os_release().get('VERSION_ID', '')
+
+_utmp = struct.Struct('hi32s4s32s256shhiii4i20s')
+RUN_LVL = 1
+
+def runlevel(filename=UTMP):
+    """
+    Aktueller Runlevel aus der utmp-Datei, wie bei "runlevel"
+    None, wenn keiner ermittelt werden kann
+    """
+    level = None
+    try:
+        with open(filename, 'rb') as fh:
+            while True:
+                record = fh.read(_utmp.size)
+                if len(record) < _utmp.size:
+                    break
+                ut_type, ut_pid = _utmp.unpack(record)[:2]
+                if ut_type == RUN_LVL:
+                    level = chr(ut_pid & 0xff)
+    except OSError:
+        return None
+    return int(level) if level and level.isdigit() else None
+
+def fastd_binary():
+    return shutil.which('fastd', path='/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin')
+
+def fastd_version(binary=None):
+    binary = binary or fastd_binary()
+    if not binary:
+        raise FileNotFoundError("fastd not found")
+    output = subprocess.check_output([binary, '-v'], timeout=10)
+    return output.decode('utf-8').splitlines()[0].split(' ')[1]
+
+def fastd_enabled(level=None):
+    """
+    Prüfe, ob das init-script existiert und in rc.d aktiviert ist
+    bzw. unter systemd eine fastd-Unit aktiviert ist
+    """
+    if level is None:
+        level = runlevel()
+    if level is not None:
+        fname = glob.glob("/etc/rc{}.d/S??fastd".format(level))
+        if fname and os.path.isfile(fname[0]):
+            return True
+    return bool(glob.glob('/etc/systemd/system/multi-user.target.wants/fastd*.service'))
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+class HostFacts(object):
+    """
+    Zwischenspeicher für die obigen Werte
+    """
+
+    def __init__(self, cachefile=CACHEFILE):
+        self.cachefile = cachefile
+        self.boot_id = boot_id()
+        self.lock = threading.Lock()
+        self.facts = {}
+        try:
+            with open(cachefile) as fh:
+                cache = json.load(fh)
+            if cache.get('boot_id') == self.boot_id:
+                self.facts = cache.get('facts', {})
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.cachefile), exist_ok=True)
+            write_atomic(self.cachefile, json.dumps({'boot_id': self.boot_id, 'facts': self.facts}))
+        except OSError:
+            pass
+
+    def get(self, name, fn, deps=()):
+        deps = {path: _mtime(path) for path in deps}
+        with self.lock:
+            entry = self.facts.get(name)
+            if entry is not None and entry['deps'] == deps:
+                return entry['value']
+        value = fn()
+        with self.lock:
+            self.facts[name] = {'value': value, 'deps': deps}
+            self.save()
+        return value
+
+    def cpu_model(self):
+        return self.get('cpu_model', cpu_model)
+
+    def nproc(self):
+        return self.get('nproc', nproc)
+
+    def firmware_base(self):
+        return self.get('firmware_base', firmware_base, (OS_RELEASE,))
+
+    def firmware_release(self):
+        return self.get('firmware_release', firmware_release, (OS_RELEASE, DEBIAN_VERSION))
+
+    def fastd_version(self):
+        # Auch "nicht installiert" (None) wird zwischengespeichert, nach
+        # einer Installation ändert sich der Pfad und damit die Abhängigkeit
+        binary = fastd_binary()
+        version = self.get('fastd_version', lambda: fastd_version(binary) if binary else None,
+                           (binary or '',))
+        if version is None:
+            raise FileNotFoundError("fastd not found")
+        return version
+
+    def fastd_enabled(self):
+        level = runlevel()
+        deps = ['/etc/systemd/system/multi-user.target.wants']
+        if level is not None:
+            deps.append('/etc/rc{}.d'.format(level))
+        return self.get('fastd_enabled', lambda: fastd_enabled(level), deps)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""
+Minimale inotify-Anbindung über ctypes
+
+Es wird nur das benötigt, was zum Beobachten einzelner Dateien bzw.
+Verzeichnisse gebraucht wird. Auf Systemen ohne inotify wird beim
+Anlegen eine OSError ausgelöst, der Aufrufer muß dann auf Abfragen
+in festen Abständen ausweichen.
+"""
+
+import os
+import struct
+import select
+import ctypes
+import ctypes.util
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_event = struct.Struct('iIII')
+
+class Inotify(object):
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify not available")
+        self._libc = libc
+        self.fd = libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.watches = {}
+
+    def add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        self.watches[wd] = path
+        return wd
+
+    def read(self, timeout=None):
+        """
+        Auf Ereignisse warten, höchstens timeout Sekunden.
+        Liefert eine Liste von Tupeln (Pfad, Maske, Name).
+        """
+        r, w, x = select.select([self.fd], [], [], timeout)
+        if not r:
+            return []
+        try:
+            buf = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos < len(buf):
+            wd, mask, cookie, length = _event.unpack_from(buf, pos)
+            pos += _event.size
+            name = buf[pos:pos + length].rstrip(b'\0').decode('utf-8', 'replace')
+            pos += length
+            events.append((self.watches.get(wd), mask, name))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
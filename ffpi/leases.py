@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+"""
+Auswertung der Lease-Datei des ISC DHCP-Servers
+
+Die Datei /var/lib/dhcp/dhcpd.leases wird vom dhcpd nur fortgeschrieben
+und gelegentlich komplett neu erstellt. Zwischen zwei Neuerstellungen
+kann sie auf stark genutzten Gateways etliche MB groß werden.
+Deshalb wird sie hier stückweise gelesen statt als Ganzes in einen
+String geladen und Block für Block zerlegt. Von jedem
+Lease-Block wird nur ausgewertet, was für die Zählung benötigt wird.
+
+Format eines Lease-Blocks:
+
+  lease 10.137.0.23 {
+    starts 3 2024/01/31 11:50:00;
+    ends 3 2024/01/31 12:00:00;
+    binding state active;
+    next binding state free;
+    hardware ethernet 00:11:22:33:44:55;
+    ...
+  }
+
+Vergleiche dazu: man 5 dhcpd.leases
+
+"""
+
+import os
+import re
+import time
+import heapq
+import calendar
+import itertools
+from collections import namedtuple, Counter
+
+LEASEFILE = '/var/lib/dhcp/dhcpd.leases'
+
+# ends: Ablaufzeitpunkt als Unixzeit (UTC), None bei 'never'
+# mac:  nur bei 'hardware ethernet' gesetzt, sonst None
+Lease = namedtuple('Lease', ('ip', 'binding', 'ends', 'mac'))
+
+LeaseSummary = namedtuple('LeaseSummary', ('count', 'leases'))
+
+# Die Zeitstempel wiederholen sich sehr oft, z.B. wenn viele Clients
+# zur gleichen Sekunde erneuert werden. Einmal umgerechnete Werte
+# werden deshalb aufbewahrt.
+_timecache = {}
+_TIMECACHE_MAX = 65536
+
+def parse_time(value):
+    """
+    Zeitangabe aus der Lease-Datei in Unixzeit umrechnen.
+    Mögliche Formate:
+      b'3 2024/01/31 12:00:00'   (Wochentag, Datum und Zeit in UTC)
+      b'epoch 1706702400'        (bei db-time-format local)
+      b'never'
+    """
+    try:
+        return _timecache[value]
+    except KeyError:
+        pass
+    if value == b'never':
+        result = None
+    elif value.startswith(b'epoch '):
+        result = int(value[6:].split()[0])
+    else:
+        d = value[2:]
+        result = calendar.timegm((int(d[0:4]), int(d[5:7]), int(d[8:10]),
+                                  int(d[11:13]), int(d[14:16]), int(d[17:19]),
+                                  0, 0, 0))
+    if len(_timecache) >= _TIMECACHE_MAX:
+        _timecache.clear()
+    _timecache[value] = result
+    return result
+
+# Nur die Zeilen, die für die Auswertung gebraucht werden. Alles
+# andere (starts, cltt, uid, "next binding state", ...) wird vom
+# regulären Ausdruck übersprungen. Das führende \n erlaubt dem
+# Regex-Modul eine schnelle Suche nach Zeilenanfängen.
+_regex_lines = re.compile(rb'\n(?:lease ([0-9.]+) \{'
+                          rb'|[ \t]+(?:binding state ([^;\n]+)'
+                          rb'|ends ([^;\n]+)'
+                          rb'|hardware ([^;\n]+));'
+                          rb'|(\}))')
+
+CHUNKSIZE = 1 << 20
+
+def parse_blocks(fh, offset=0):
+    """
+    Liefert für jeden vollständigen Lease-Block ein Tupel aus der
+    Byte-Position direkt hinter dem Block und dem Lease.
+    fh muß im Binärmodus geöffnet und auf offset positioniert sein,
+    offset muß auf einen Zeilenanfang zeigen.
+    Die Datei wird stückweise gelesen, ein unvollständiger Block am
+    Dateiende wird nicht geliefert.
+    Spätere Angaben innerhalb eines Blocks überschreiben frühere.
+    """
+    # data beginnt immer mit dem Zeilenende vor der Position base
+    base = offset - 1
+    rest = b'\n'
+    while True:
+        chunk = fh.read(CHUNKSIZE)
+        data = rest + chunk
+        # Nur bis hinter die letzte schließende Klammer auswerten,
+        # der Rest wird mit dem nächsten Stück zusammen bearbeitet
+        cut = data.rfind(b'\n}')
+        if cut >= 0:
+            cut = data.find(b'\n', cut + 2)
+            cut = len(data) if cut < 0 and not chunk else cut + 1
+        if cut <= 0:
+            if not chunk:
+                return
+            rest = data
+            continue
+        ip = None
+        for m in _regex_lines.finditer(data, 0, cut):
+            i = m.lastindex
+            if i == 1:
+                ip = m.group(1).decode('ascii')
+                binding = ends = mac = None
+            elif ip is None:
+                continue
+            elif i == 2:
+                binding = m.group(2).decode('ascii')
+            elif i == 3:
+                ends = parse_time(m.group(3))
+            elif i == 4:
+                value = m.group(4)
+                mac = value[9:].decode('ascii') if value.startswith(b'ethernet ') else None
+            else:
+                # Hinter das Zeilenende, fehlt es am Dateiende, direkt
+                # hinter die Klammer
+                yield base + min(m.end() + 1, cut), Lease(ip, binding, ends, mac)
+                ip = None
+        base += cut - 1
+        rest = data[cut - 1:]
+        if not chunk:
+            return
+
+def iter_leases(filename=LEASEFILE):
+    with open(filename, 'rb') as fh:
+        for offset, lease in parse_blocks(fh):
+            yield lease
+
+def is_active(lease, now):
+    return (lease.binding == 'active' and lease.ends is not None
+            and lease.ends > now and lease.mac is not None)
+
+def scan_leases(filename=LEASEFILE, now=None):
+    """
+    Alle aktiven Lease-Blöcke sowie die Anzahl der dazugehörigen
+    eindeutigen MAC-Adressen ermitteln.
+    """
+    if now is None:
+        now = time.time()
+    leases = [lease for lease in iter_leases(filename) if is_active(lease, now)]
+    return LeaseSummary(len(set(lease.mac for lease in leases)), leases)
+
+def count_dhcp_leases(filename=LEASEFILE):
+    return scan_leases(filename).count
+
+class LeaseTracker(object):
+    """
+    Verfolgt die Lease-Datei anhand von Byte-Position und Inode.
+
+    Bei jedem Aufruf von update() werden nur die seit dem letzten Mal
+    angehängten Blöcke gelesen. Hat dhcpd die Datei neu geschrieben
+    (anderer Inode, kleinere Datei oder an der gemerkten Position steht
+    kein Blockende), wird der Index komplett neu aufgebaut.
+
+    Gezählt wird wie bei scan_leases(): jeder aktive Block der Datei
+    zählt, auch wenn später ein weiterer Block zur selben IP-Adresse
+    folgt. Nur für lookup_mac() ersetzt ein späterer Block den früheren.
+
+    Die aktiven Blöcke liegen in einem nach Ablaufzeit sortierten Heap,
+    abgelaufene werden daraus beim Abfragen entfernt, ohne alle Leases
+    erneut durchzusehen.
+    """
+
+    def __init__(self, filename=LEASEFILE):
+        self.filename = filename
+        self.rebuilds = 0
+        self.reset()
+
+    def reset(self):
+        self.inode = None
+        self.offset = 0
+        self.leases = {}        # IP -> letzter Lease-Block
+        self.by_mac = {}        # MAC -> Menge der IP-Adressen
+        self.macs = Counter()   # MAC -> Anzahl aktiver Blöcke
+        self.heap = []          # (ends, lfd. Nr., Lease) je aktivem Block
+        self.seq = itertools.count()
+
+    def _rewritten(self, fh, st):
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            return True
+        if self.offset >= 2:
+            # Blockende, ggf. ohne Zeilenende am damaligen Dateiende
+            fh.seek(self.offset - 2)
+            tail = fh.read(2)
+            if tail != b'}\n' and tail[1:] != b'}':
+                return True
+        return False
+
+    def update(self, now=None):
+        """
+        Neue Blöcke einlesen. Liefert die Anzahl der gelesenen Blöcke.
+        """
+        if now is None:
+            now = time.time()
+        try:
+            fh = open(self.filename, 'rb')
+        except FileNotFoundError:
+            self.reset()
+            return 0
+        with fh:
+            st = os.fstat(fh.fileno())
+            if self._rewritten(fh, st):
+                self.reset()
+                self.inode = st.st_ino
+                self.rebuilds += 1
+            if st.st_size == self.offset:
+                return 0
+            fh.seek(self.offset)
+            n = 0
+            for offset, lease in parse_blocks(fh, self.offset):
+                self._add(lease, now)
+                self.offset = offset
+                n += 1
+        return n
+
+    def _add(self, lease, now):
+        old = self.leases.get(lease.ip)
+        if old is not None and old.mac is not None and old.mac != lease.mac:
+            ips = self.by_mac[old.mac]
+            ips.discard(old.ip)
+            if not ips:
+                del self.by_mac[old.mac]
+        self.leases[lease.ip] = lease
+        if lease.mac is not None:
+            self.by_mac.setdefault(lease.mac, set()).add(lease.ip)
+        if is_active(lease, now):
+            self.macs[lease.mac] += 1
+            heapq.heappush(self.heap, (lease.ends, next(self.seq), lease))
+
+    def expire(self, now=None):
+        if now is None:
+            now = time.time()
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            lease = heapq.heappop(heap)[-1]
+            self.macs[lease.mac] -= 1
+            if not self.macs[lease.mac]:
+                del self.macs[lease.mac]
+
+    def count(self, now=None):
+        """
+        Anzahl der eindeutigen MAC-Adressen mit aktivem Lease
+        """
+        self.expire(now)
+        return len(self.macs)
+
+    def active_leases(self, now=None):
+        """
+        Aktive Lease-Blöcke, nach Ablaufzeit sortiert
+        """
+        self.expire(now)
+        return [entry[-1] for entry in sorted(self.heap)]
+
+    def lookup_mac(self, mac):
+        return [self.leases[ip] for ip in self.by_mac.get(mac, ())]
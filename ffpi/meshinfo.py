@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+"""
+Nodeinfo und Statistik aller Knoten im Mesh aus alfred
+
+Die Datentypen 158 (nodeinfo) und 159 (statistics) werden mit je einer
+Anfrage an alfred abgeholt, beide gleichzeitig, da alfred pro
+Verbindung nur eine Anfrage bearbeitet. Die Nutzdaten sind mit zlib
+komprimiertes JSON (siehe alfred-announce.py).
+
+Entpackt und zerlegt werden nur Datensätze, deren Nutzdaten sich seit
+dem letzten Durchlauf geändert haben (Vergleich per SHA-1). Sind es
+viele, geschieht das in einem Prozeß-Pool, da zlib und json den GIL
+nicht freigeben. Bei wenigen Änderungen lohnt der Pool nicht.
+
+Der Stand ist nach der Quell-MAC der Knoten geordnet und enthält
+zusätzlich Kennzahlen über das ganze Mesh. Mit den Prüfsummen wird er
+in einer Cache-Datei aufbewahrt, so daß auch bei einzelnen Aufrufen
+(z.B. per cron) nur geänderte Knoten neu zerlegt werden.
+"""
+
+import os
+import json
+import zlib
+import hashlib
+import datetime
+import concurrent.futures
+from collections import Counter
+
+from ffpi.util import write_atomic
+
+CACHEFILE = '/var/cache/ffpi/alfred-mesh.json'
+
+DATATYPES = {158: 'nodeinfo', 159: 'statistics'}
+
+# Ab so vielen geänderten Datensätzen wird der Prozeß-Pool verwendet
+POOL_THRESHOLD = 64
+
+def decode(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+def decode_batch(items):
+    """
+    Liste von (Schlüssel, Nutzdaten) entpacken, läuft ggf. im
+    Pool-Prozeß. Liefert Tupel (Schlüssel, Daten, Fehler).
+    """
+    result = []
+    for key, blob in items:
+        try:
+            result.append((key, decode(blob), None))
+        except (zlib.error, ValueError) as err:
+            result.append((key, None, str(err)))
+    return result
+
+def fetch(client, datatypes=DATATYPES):
+    """
+    Alle Datentypen gleichzeitig abfragen (client: ffpi.alfred.AlfredClient).
+    Liefert ein Dictionary Datentyp -> {Quell-MAC: Nutzdaten}.
+    """
+    with concurrent.futures.ThreadPoolExecutor(len(datatypes)) as executor:
+        futures = {datatype: executor.submit(client.request, datatype) for datatype in datatypes}
+        return {datatype: future.result() for datatype, future in futures.items()}
+
+def lookup(data, *path):
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+def aggregate(nodes):
+    """
+    Kennzahlen über alle Knoten: Clients (Summe von statistics.leases),
+    Peers je Gateway sowie Verteilung der Firmware- und
+    batman-adv-Versionen
+    """
+    clients = 0
+    gateways = {}
+    firmware = Counter()
+    batman = Counter()
+    for mac, node in nodes.items():
+        info = node.get('nodeinfo') or {}
+        stats = node.get('statistics') or {}
+        leases = stats.get('leases')
+        if isinstance(leases, int) and not isinstance(leases, bool):
+            clients += leases
+        if info.get('vpn') is True or 'peers' in stats:
+            gateways[mac] = {'hostname': info.get('hostname'), 'peers': stats.get('peers')}
+        release = ' '.join(str(v) for v in (lookup(info, 'software', 'firmware', 'base'),
+                                            lookup(info, 'software', 'firmware', 'release')) if v)
+        firmware[release or 'unknown'] += 1
+        batman[lookup(info, 'software', 'batman_adv', 'version') or 'unknown'] += 1
+    return {
+        'nodes': len(nodes),
+        'clients': clients,
+        'gateways': gateways,
+        'firmware': dict(firmware),
+        'batman_adv': dict(batman)
+    }
+
+class MeshSnapshot(object):
+    """
+    Stand aller Knoten: nodes ist ein Dictionary Quell-MAC ->
+    {'nodeinfo': ..., 'statistics': ...}, errors enthält je
+    (Datentyp-Name, MAC) die Fehlermeldung für nicht lesbare Daten.
+    """
+
+    def __init__(self, workers=None, threshold=POOL_THRESHOLD):
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        self.pool = None
+        self.nodes = {}
+        self.digests = {}
+        self.errors = {}
+        self.stats = {'records': 0, 'decoded': 0, 'unchanged': 0, 'removed': 0}
+
+    def _decode(self, items):
+        if len(items) < self.threshold or self.workers < 2:
+            return decode_batch(items)
+        if self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+        # Einige Stücke je Prozeß, damit ungleich große Datensätze
+        # die Prozesse gleichmäßig auslasten
+        size = max(len(items) // (self.workers * 4), 1)
+        result = []
+        for part in self.pool.map(decode_batch, [items[i:i + size] for i in range(0, len(items), size)]):
+            result.extend(part)
+        return result
+
+    def update(self, records):
+        """
+        Neue Daten eintragen (records siehe fetch()). Liefert die
+        Anzahl der neu zerlegten Datensätze.
+        """
+        seen = set()
+        changed = []
+        digests = {}
+        for datatype, blobs in records.items():
+            name = DATATYPES[datatype]
+            for mac, blob in blobs.items():
+                key = (name, mac)
+                seen.add(key)
+                digest = hashlib.sha1(blob).hexdigest()
+                if self.digests.get(key) == digest:
+                    self.stats['unchanged'] += 1
+                else:
+                    changed.append((key, blob))
+                    digests[key] = digest
+            self.stats['records'] += len(blobs)
+        # Von alfred vergessene Daten entfernen
+        for key in set(self.digests) - seen:
+            name, mac = key
+            del self.digests[key]
+            self.errors.pop(key, None)
+            node = self.nodes.get(mac)
+            if node is not None:
+                node.pop(name, None)
+                if not node:
+                    del self.nodes[mac]
+            self.stats['removed'] += 1
+        for key, data, error in self._decode(changed):
+            name, mac = key
+            # Auch fehlerhafte Daten werden erst nach einer Änderung
+            # erneut versucht
+            self.digests[key] = digests[key]
+            if error is None:
+                self.nodes.setdefault(mac, {})[name] = data
+                self.errors.pop(key, None)
+            else:
+                self.errors[key] = error
+                node = self.nodes.get(mac)
+                if node is not None:
+                    node.pop(name, None)
+                    if not node:
+                        del self.nodes[mac]
+        self.stats['decoded'] += len(changed)
+        return len(changed)
+
+    def aggregates(self):
+        return aggregate(self.nodes)
+
+    def snapshot(self, now=None):
+        # Daten für die Karte
+        timestamp = datetime.datetime.now() if now is None else datetime.datetime.fromtimestamp(now)
+        return {'timestamp': timestamp.isoformat(timespec='seconds'),
+                'aggregates': self.aggregates(),
+                'nodes': self.nodes}
+
+    def write(self, filename, now=None):
+        write_atomic(filename, json.dumps(self.snapshot(now), separators=(',', ':')))
+
+    def load(self, cachefile):
+        try:
+            with open(cachefile) as fh:
+                cache = json.load(fh)
+        except (OSError, ValueError):
+            return False
+        self.nodes = cache.get('nodes', {})
+        self.digests = {(name, mac): digest for name, macs in cache.get('digests', {}).items()
+                        for mac, digest in macs.items()}
+        self.errors = {(name, mac): error for name, macs in cache.get('errors', {}).items()
+                       for mac, error in macs.items()}
+        return True
+
+    def save(self, cachefile):
+        digests = {}
+        for (name, mac), digest in self.digests.items():
+            digests.setdefault(name, {})[mac] = digest
+        errors = {}
+        for (name, mac), error in self.errors.items():
+            errors.setdefault(name, {})[mac] = error
+        os.makedirs(os.path.dirname(cachefile) or '.', exist_ok=True)
+        write_atomic(cachefile, json.dumps({'nodes': self.nodes, 'digests': digests, 'errors': errors},
+                                           separators=(',', ':')))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
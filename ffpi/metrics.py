@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+Laufzeit- und Zustandsdaten der Items
+
+Je Item werden Dauer der letzten Ausführung, Anzahl der Ausführungen
+und Fehler, Zeitpunkt des letzten Erfolgs und ob der Wert veraltet ist
+festgehalten. Dazu kommen die Zeiten der einzelnen Verarbeitungsschritte
+eines Durchlaufs (Sammeln, Serialisieren, Komprimieren, Senden).
+
+Die Daten können als Textdatei für den textfile-Collector des
+Prometheus node-exporters und als einfache Schlüssel/Wert-Datei für
+Zabbix (vfs.file.regexp oder UserParameter) ausgegeben werden. Die
+Dateien sollten mit ffpi.util.write_atomic geschrieben werden, damit
+ein Leser nie einen halb geschriebenen Stand sieht.
+"""
+
+import time
+import contextlib
+
+class Metrics(object):
+
+    def __init__(self, prefix='ffpi_announce'):
+        self.prefix = prefix
+        self.items = {}
+        self.stages = {}
+        self.cycles = 0
+
+    def _item(self, name):
+        return self.items.setdefault(name, {'duration': 0.0, 'runs': 0, 'failures': 0,
+                                            'last_success': 0.0, 'stale': 0})
+
+    def item(self, name, duration, ok, now=None):
+        m = self._item(name)
+        m['duration'] = duration
+        m['runs'] += 1
+        if ok:
+            m['last_success'] = time.time() if now is None else now
+            m['stale'] = 0
+        else:
+            m['failures'] += 1
+            m['stale'] = 1
+
+    def set_stale(self, name, stale):
+        # Nur den Zustand setzen, ohne einen Durchlauf zu zählen
+        self._item(name)['stale'] = int(stale)
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - t0)
+
+    def begin_cycle(self):
+        self.stages = {}
+        self.cycles += 1
+
+    def prometheus(self, now=None):
+        if now is None:
+            now = time.time()
+        p = self.prefix
+        lines = []
+        def metric(name, mtype, helptext, values):
+            lines.append("# HELP {}_{} {}".format(p, name, helptext))
+            lines.append("# TYPE {}_{} {}".format(p, name, mtype))
+            for labels, value in values:
+                lines.append("{}_{}{{{}}} {}".format(p, name, labels, value))
+        items = sorted(self.items.items())
+        metric('item_duration_seconds', 'gauge', "Duration of the last item execution",
+               [('item="{}"'.format(k), "{:.6f}".format(m['duration'])) for k, m in items])
+        metric('item_runs_total', 'counter', "Number of item executions",
+               [('item="{}"'.format(k), m['runs']) for k, m in items])
+        metric('item_failures_total', 'counter', "Number of failed or timed out item executions",
+               [('item="{}"'.format(k), m['failures']) for k, m in items])
+        metric('item_last_success_timestamp_seconds', 'gauge', "Time of the last successful execution",
+               [('item="{}"'.format(k), "{:.0f}".format(m['last_success'])) for k, m in items])
+        metric('item_stale', 'gauge', "1 if the item value is stale",
+               [('item="{}"'.format(k), m['stale']) for k, m in items])
+        metric('stage_duration_seconds', 'gauge', "Duration of the processing stages in the last cycle",
+               [('stage="{}"'.format(k), "{:.6f}".format(v)) for k, v in sorted(self.stages.items())])
+        lines.append("# TYPE {}_cycles_total counter".format(p))
+        lines.append("{}_cycles_total {}".format(p, self.cycles))
+        return "\n".join(lines) + "\n"
+
+    def zabbix(self, now=None):
+        if now is None:
+            now = time.time()
+        lines = []
+        for k, m in sorted(self.items.items()):
+            lines.append("item.duration[{}] {:.6f}".format(k, m['duration']))
+            lines.append("item.failures[{}] {}".format(k, m['failures']))
+            lines.append("item.last_success[{}] {:.0f}".format(k, m['last_success']))
+            lines.append("item.age[{}] {:.0f}".format(k, now - m['last_success'] if m['last_success'] else -1))
+            lines.append("item.stale[{}] {}".format(k, m['stale']))
+        for k, v in sorted(self.stages.items()):
+            lines.append("stage.duration[{}] {:.6f}".format(k, v))
+        lines.append("cycles {}".format(self.cycles))
+        return "\n".join(lines) + "\n"
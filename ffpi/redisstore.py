@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+Werte aus dem Redis-Cluster für alfred-announce.py
+
+Andere Programme (z.B. fastd2redis.py) legen ihre Ergebnisse in Redis
+ab, der Announcer liest sie nur noch. Eine Quelle wird als Tupel
+(Befehl, Schlüssel[, Feld]) angegeben, unterstützt werden die lesenden
+Befehle in COMMANDS. Im Schlüssel können Platzhalter wie {node_id}
+verwendet werden, die beim Anlegen des RedisStore übergeben werden.
+Zeichenketten, die gültiges JSON sind, werden dekodiert.
+
+Alle Quellen eines Durchlaufs werden mit einer Pipeline über eine
+dauerhaft offene Cluster-Verbindung geholt. Die Werte werden lokal
+für ttl Sekunden aufbewahrt, damit ein Ausfall von Redis die
+Übertragung an alfred nicht aufhält: bis zum Ablauf gilt der letzte
+Wert, nach einem Fehler wird erst nach retry Sekunden wieder versucht
+zu verbinden.
+
+Das Modul redis wird erst bei Bedarf importiert.
+"""
+
+import json
+import time
+
+COMMANDS = ('get', 'hget', 'hgetall', 'scard', 'smembers', 'zcard', 'llen')
+
+class RedisStore(object):
+
+    def __init__(self, host='127.0.0.1', port=7000, ttl=600, retry=60,
+                 socket_timeout=1.0, keyargs=None):
+        self.host = host
+        self.port = port
+        self.ttl = ttl
+        self.retry = retry
+        self.socket_timeout = socket_timeout
+        self.keyargs = keyargs or {}
+        self.rc = None
+        self.cache = {}
+        self.down_until = 0
+
+    def connect(self):
+        if self.rc is None:
+            from redis.cluster import RedisCluster, ClusterNode
+            self.rc = RedisCluster(startup_nodes=[ClusterNode(self.host, self.port)],
+                                   decode_responses=True,
+                                   socket_timeout=self.socket_timeout,
+                                   socket_connect_timeout=self.socket_timeout)
+        return self.rc
+
+    @staticmethod
+    def decode(value):
+        if isinstance(value, str):
+            try:
+                return json.loads(value)
+            except ValueError:
+                return value
+        if isinstance(value, set):
+            return sorted(value)
+        if isinstance(value, dict):
+            return {k: RedisStore.decode(v) for k, v in value.items()}
+        return value
+
+    def _fetch(self, sources):
+        pipe = self.connect().pipeline()
+        names = []
+        for name, source in sources.items():
+            command, key = source[0], source[1].format(**self.keyargs)
+            getattr(pipe, command)(key, *source[2:])
+            names.append(name)
+        return dict(zip(names, pipe.execute()))
+
+    def fetch(self, sources, now=None):
+        """
+        sources: Dictionary Name -> Quelle
+        Liefert ein Dictionary Name -> Wert mit allen Namen, für die ein
+        gültiger (ggf. zwischengespeicherter) Wert vorliegt.
+        Fehler werden nur ausgelöst, wenn es auch keine gültigen
+        Werte aus dem Zwischenspeicher gibt.
+        """
+        if now is None:
+            now = time.monotonic()
+        for source in sources.values():
+            if source[0] not in COMMANDS:
+                raise ValueError("Unsupported redis command {}".format(source[0]))
+        error = None
+        if now >= self.down_until:
+            try:
+                for name, value in self._fetch(sources).items():
+                    self.cache[name] = (now, self.decode(value))
+            except ImportError as err:
+                error = err
+                self.down_until = float('inf')
+            except Exception as err:
+                # redis.exceptions.RedisError, aber redis ist evtl.
+                # nicht installiert
+                error = err
+                self.down_until = now + self.retry
+                self.rc = None
+        result = {}
+        for name in sources:
+            if name in self.cache and self.cache[name][0] + self.ttl > now:
+                result[name] = self.cache[name][1]
+        if error is not None and not result:
+            raise error
+        return result
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+"""
+Verkehrszähler des batman-adv-Interfaces (bat0)
+
+Die Zähler werden wie bei "ethtool -S bat0" über das ioctl
+ETHTOOL_GSTATS gelesen, allerdings ohne dafür ein Programm zu starten.
+Steht das ioctl nicht zur Verfügung, werden ersatzweise die
+allgemeinen Zähler aus /sys/class/net/<if>/statistics verwendet
+(dann ohne forward und mgmt).
+
+Die Meßwerte werden in einem Ringpuffer fester Größe aufbewahrt, daraus
+werden Raten je Sekunde und Differenzen zum vorherigen Meßwert
+berechnet.
+"""
+
+import os
+import time
+import fcntl
+import ctypes
+import socket
+import struct
+import threading
+from collections import deque
+
+SIOCETHTOOL = 0x8946
+ETHTOOL_GDRVINFO = 0x00000003
+ETHTOOL_GSTRINGS = 0x0000001b
+ETHTOOL_GSTATS = 0x0000001d
+ETH_SS_STATS = 1
+ETH_GSTRING_LEN = 32
+
+# struct ethtool_drvinfo, n_stats liegt an Position 180
+_DRVINFO_SIZE = 196
+_DRVINFO_NSTATS = 180
+
+class EthtoolBackend(object):
+    """
+    Zähler per ETHTOOL_GSTATS. Die Namen der Zähler ändern sich nur
+    beim Neuladen des Moduls. Sie werden deshalb nur neu gelesen, wenn
+    sich die Anzahl der Zähler geändert hat.
+    """
+
+    def __init__(self, interface):
+        self.interface = interface
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.names = None
+
+    def _ioctl(self, buf):
+        ifreq = struct.pack('16sP', self.interface.encode('ascii'), ctypes.addressof(buf))
+        fcntl.ioctl(self.sock.fileno(), SIOCETHTOOL, ifreq.ljust(40, b'\0'))
+
+    def _n_stats(self):
+        buf = ctypes.create_string_buffer(struct.pack('II', ETHTOOL_GDRVINFO, 0), _DRVINFO_SIZE)
+        self._ioctl(buf)
+        return struct.unpack_from('I', buf, _DRVINFO_NSTATS)[0]
+
+    def _names(self, n):
+        buf = ctypes.create_string_buffer(struct.pack('III', ETHTOOL_GSTRINGS, ETH_SS_STATS, n),
+                                          12 + n * ETH_GSTRING_LEN)
+        self._ioctl(buf)
+        raw = buf.raw[12:]
+        return [raw[i:i + ETH_GSTRING_LEN].split(b'\0', 1)[0].decode('ascii')
+                for i in range(0, n * ETH_GSTRING_LEN, ETH_GSTRING_LEN)]
+
+    def read(self):
+        # Der Kernel schreibt bei GSTATS immer die aktuelle Anzahl
+        # Zähler, unabhängig von der Angabe im Puffer. Die Anzahl wird
+        # deshalb vor jeder Abfrage gelesen und der Puffer danach
+        # bemessen. Ändert sie sich dazwischen, steht im Kopf der
+        # Antwort eine andere Anzahl, dann wird neu gelesen.
+        while True:
+            n = self._n_stats()
+            if self.names is None or len(self.names) != n:
+                self.names = self._names(n)
+            buf = ctypes.create_string_buffer(struct.pack('II', ETHTOOL_GSTATS, n), 8 + n * 8)
+            self._ioctl(buf)
+            if struct.unpack_from('I', buf, 4)[0] == n:
+                break
+            self.names = None
+        values = struct.unpack_from('{}Q'.format(n), buf, 8)
+        return dict(zip(self.names, values))
+
+class SysfsBackend(object):
+    """
+    Allgemeine Interface-Zähler, benannt wie bei batman-adv
+    """
+    mapping = {'rx': 'rx_packets', 'rx_bytes': 'rx_bytes', 'rx_dropped': 'rx_dropped',
+               'tx': 'tx_packets', 'tx_bytes': 'tx_bytes', 'tx_dropped': 'tx_dropped'}
+
+    def __init__(self, interface, sysfs='/sys/class/net'):
+        self.path = os.path.join(sysfs, interface, 'statistics')
+
+    def read(self):
+        result = {}
+        for name, filename in self.mapping.items():
+            with open(os.path.join(self.path, filename)) as fh:
+                result[name] = int(fh.read())
+        return result
+
+def backend_for(interface):
+    backend = EthtoolBackend(interface)
+    try:
+        backend.read()
+    except OSError:
+        backend.sock.close()
+        return SysfsBackend(interface)
+    return backend
+
+def traffic_from_stats(stats):
+    """
+    Zähler in die Struktur für statistics.traffic umsetzen:
+    tx_bytes -> traffic['tx']['bytes'], tx -> traffic['tx']['packets']
+    """
+    traffic = {'tx': {}, 'rx': {}, 'forward': {}, 'mgmt_tx': {}, 'mgmt_rx': {}}
+    for key, value in stats.items():
+        if key.split('_')[0] in ('tx', 'rx', 'mgmt', 'forward'):
+            if not (key.endswith('_bytes') or key.endswith('_dropped')):
+                key += '_packets'
+            ix1, ix2 = key.rsplit('_', 1)
+            if ix1 in traffic:
+                traffic[ix1][ix2] = value
+    return traffic
+
+class TrafficSampler(object):
+    """
+    Ringpuffer mit den letzten size Meßwerten eines Interfaces.
+    Mit start() wird in einem eigenen Thread regelmäßig gemessen.
+    """
+
+    def __init__(self, interface, size=12, backend=None):
+        self.interface = interface
+        self.backend = backend
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+        self.running = False
+
+    def sample(self, now=None):
+        if self.backend is None:
+            self.backend = backend_for(self.interface)
+        stats = self.backend.read()
+        with self.lock:
+            if self.samples and any(stats.get(k, 0) < v for k, v in self.samples[-1][1].items()):
+                # Zähler sind zurückgesetzt worden (Modul neu geladen)
+                self.samples.clear()
+            self.samples.append((time.monotonic() if now is None else now, stats))
+        return stats
+
+    def _loop(self, interval):
+        while self.running:
+            try:
+                self.sample()
+            except OSError:
+                pass
+            time.sleep(interval)
+
+    def start(self, interval=5):
+        self.running = True
+        thread = threading.Thread(target=self._loop, args=(interval,), name='traffic', daemon=True)
+        thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def traffic(self):
+        """
+        Aktuelle Zählerstände, ergänzt um <name>_rate (je Sekunde über
+        den ganzen Ringpuffer) und <name>_delta (Differenz zum
+        vorherigen Meßwert)
+        """
+        with self.lock:
+            samples = list(self.samples)
+        if not samples:
+            return None
+        t_last, last = samples[-1]
+        traffic = traffic_from_stats(last)
+        if len(samples) >= 2 and t_last > samples[0][0]:
+            t_first, first = samples[0]
+            t_prev, prev = samples[-2]
+            rates = traffic_from_stats({k: (v - first.get(k, v)) / (t_last - t_first) for k, v in last.items()})
+            deltas = traffic_from_stats({k: v - prev.get(k, v) for k, v in last.items()})
+            for ix1, values in traffic.items():
+                for ix2 in list(values):
+                    values[ix2 + '_rate'] = round(rates[ix1][ix2], 1)
+                    values[ix2 + '_delta'] = deltas[ix1][ix2]
+        return traffic
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+"""
+Verkehrsstatistik je Interface in der Art von RRD (Ersatz für vnstat)
+
+Je Interface gibt es eine Datei fester Größe mit drei Ringen:
+  hourly   HOURS Stunden
+  daily    DAYS Tage
+  monthly  MONTHS Monate
+Jeder Eintrag besteht aus der Periode (Stunde seit Epoch, Tag als
+Ordinalzahl bzw. Jahr * 12 + Monat - 1) und den empfangenen bzw.
+gesendeten Bytes darin. Ein Eintrag ist nur gültig, wenn seine Periode
+zur Position im Ring paßt, veraltete Einträge werden beim nächsten
+Zugriff überschrieben. Mit den Standardgrößen belegt ein Interface
+knapp 14 KiB und reicht für zehn Jahre.
+
+Beim Abtasten werden nur die geänderten Einträge und der Kopf mit
+os.pwrite() an ihre Stelle geschrieben, nicht die ganze Datei. Eine neue
+Datei wird atomar angelegt. Eine unbrauchbare Datei (falsche Größe oder
+Kennung) wird nach <datei>.bad verschoben und neu begonnen.
+"""
+
+import os
+import time
+import array
+import struct
+import datetime
+
+from ffpi.util import write_atomic
+
+DATADIR = '/var/lib/ffpi/traffic'
+SYSFS = '/sys/class/net'
+
+MAGIC = b'FFTR'
+VERSION = 1
+HOURS = 72
+DAYS = 400
+MONTHS = 120
+
+# Magic, Version, letzte Abtastung, letzte Änderung, Zählerstände
+# rx/tx, Summen rx/tx
+_header = struct.Struct('<4sHxxqqQQQQ')
+_slot = struct.Struct('<qqq')
+
+RINGS = (('hourly', HOURS), ('daily', DAYS), ('monthly', MONTHS))
+
+def periods(now):
+    """
+    Perioden (hourly, daily, monthly) für einen Zeitpunkt in Ortszeit
+    """
+    t = datetime.datetime.fromtimestamp(now)
+    return (int(now) // 3600,
+            t.date().toordinal(),
+            t.year * 12 + t.month - 1)
+
+def read_counters(interface, sysfs=SYSFS):
+    path = os.path.join(sysfs, interface, 'statistics')
+    with open(os.path.join(path, 'rx_bytes')) as fh:
+        rx = int(fh.read())
+    with open(os.path.join(path, 'tx_bytes')) as fh:
+        tx = int(fh.read())
+    return rx, tx
+
+def interfaces(sysfs=SYSFS, exclude=('lo',)):
+    return sorted(name for name in os.listdir(sysfs)
+                  if name not in exclude and os.path.isdir(os.path.join(sysfs, name, 'statistics')))
+
+class TrafficDB(object):
+    """
+    Statistik eines Interfaces. Die Ringe liegen als array('q') mit
+    je drei Werten pro Eintrag im Speicher.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.last_sample = 0
+        self.last_change = 0
+        self.counters = (0, 0)
+        self.total = [0, 0]
+        self.rings = {name: array.array('q', bytes(_slot.size * size)) for name, size in RINGS}
+        self.dirty = set()
+        self.rotated = None
+        if os.path.exists(filename):
+            self.load()
+
+    @property
+    def size(self):
+        return _header.size + sum(_slot.size * size for name, size in RINGS)
+
+    def load(self):
+        """
+        Liefert False, wenn die Datei unbrauchbar war. Sie wird dann
+        beiseite gelegt (rotated) und mit leeren Ringen neu begonnen.
+        """
+        with open(self.filename, 'rb') as fh:
+            data = fh.read()
+        if len(data) != self.size or _header.unpack_from(data)[:2] != (MAGIC, VERSION):
+            self.rotated = self.filename + '.bad'
+            os.replace(self.filename, self.rotated)
+            return False
+        magic, version, self.last_sample, self.last_change, rx, tx, trx, ttx = \
+            _header.unpack_from(data)
+        self.counters = (rx, tx)
+        self.total = [trx, ttx]
+        pos = _header.size
+        for name, size in RINGS:
+            ring = array.array('q')
+            ring.frombytes(data[pos:pos + _slot.size * size])
+            self.rings[name] = ring
+            pos += _slot.size * size
+        return True
+
+    def _offset(self, name, index):
+        pos = _header.size
+        for ring, size in RINGS:
+            if ring == name:
+                return pos + index * _slot.size
+            pos += _slot.size * size
+
+    def _header_bytes(self):
+        return _header.pack(MAGIC, VERSION, self.last_sample, self.last_change,
+                            self.counters[0], self.counters[1], self.total[0], self.total[1])
+
+    def save(self):
+        """
+        Neue Datei komplett, sonst nur Kopf und geänderte Einträge
+        schreiben
+        """
+        os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+        if not os.path.exists(self.filename):
+            write_atomic(self.filename, b''.join([self._header_bytes()] +
+                                                 [self.rings[name].tobytes() for name, size in RINGS]))
+            self.dirty.clear()
+            return
+        fd = os.open(self.filename, os.O_WRONLY)
+        try:
+            for name, index in sorted(self.dirty):
+                ring = self.rings[name]
+                os.pwrite(fd, ring[index * 3:index * 3 + 3].tobytes(), self._offset(name, index))
+            os.pwrite(fd, self._header_bytes(), 0)
+        finally:
+            os.close(fd)
+        self.dirty.clear()
+
+    def add(self, rx, tx, now):
+        for (name, size), period in zip(RINGS, periods(now)):
+            ring = self.rings[name]
+            index = period % size
+            i = index * 3
+            if ring[i] != period:
+                ring[i:i + 3] = array.array('q', (period, 0, 0))
+            ring[i + 1] += rx
+            ring[i + 2] += tx
+            self.dirty.add((name, index))
+        self.total[0] += rx
+        self.total[1] += tx
+        self.last_change = int(now)
+
+    def sample(self, rx, tx, now=None):
+        """
+        Neue Zählerstände eintragen. Die Differenz zum letzten Stand
+        wird der aktuellen Periode zugerechnet; ist ein Zähler kleiner
+        geworden (Neustart, Interface neu angelegt), zählt der ganze
+        neue Stand. Der erste Aufruf setzt nur die Zählerstände.
+        Liefert True, wenn sich etwas geändert hat.
+        """
+        if now is None:
+            now = time.time()
+        first = self.last_sample == 0
+        old_rx, old_tx = self.counters
+        drx = rx - old_rx if rx >= old_rx else rx
+        dtx = tx - old_tx if tx >= old_tx else tx
+        self.counters = (rx, tx)
+        self.last_sample = int(now)
+        if first or not (drx or dtx):
+            return False
+        self.add(drx, dtx, now)
+        return True
+
+    def series(self, name, count, now=None):
+        """
+        Die letzten count Perioden eines Rings bis einschließlich der
+        aktuellen als Liste von (Periode, rx, tx), ältester zuerst
+        """
+        if now is None:
+            now = time.time()
+        size = dict(RINGS)[name]
+        ring = self.rings[name]
+        current = periods(now)[[r for r, s in RINGS].index(name)]
+        result = []
+        for period in range(current - min(count, size) + 1, current + 1):
+            i = (period % size) * 3
+            if ring[i] == period:
+                result.append((period, ring[i + 1], ring[i + 2]))
+            else:
+                result.append((period, 0, 0))
+        return result
+
+    def top(self, count=10, now=None):
+        """
+        Die Tage mit dem meisten Verkehr als (Tag, rx, tx). Wie bei
+        series() zählen nur Einträge innerhalb des Rings bis zum
+        aktuellen Tag, ältere sind veraltet.
+        """
+        if now is None:
+            now = time.time()
+        ring = self.rings['daily']
+        current = periods(now)[1]
+        days = [(ring[i], ring[i + 1], ring[i + 2]) for i in range(0, len(ring), 3)
+                if current - DAYS < ring[i] <= current]
+        days.sort(key=lambda d: d[1] + d[2], reverse=True)
+        return days[:count]
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+"""
+fastd-Tunnel eines Gateways in Redis ablegen
+
+Je Tunnel gibt es einen Hash fastd:tunnel:<mac> mit den Feldern key,
+last_seen und last_gate. Alle Schreibzugriffe eines Laufs gehen über
+eine Cluster-Pipeline, die die Befehle selbst nach Slot bzw. Knoten
+gruppiert. Der zuletzt geschriebene Stand wird lokal gespeichert:
+unveränderte Tunnel bekommen nur ein neues last_seen, komplett neu
+geschrieben wird nur, was sich geändert hat (und in größeren Abständen
+alles, falls in Redis etwas verloren gegangen ist).
+
+Damit nicht für jede Abfrage der ganze Schlüsselraum durchsucht werden
+muß, werden zusätzlich Indizes gepflegt:
+  fastd:gate:<gate>   Menge der Tunnel-IDs, die gerade an diesem
+                      Gateway verbunden sind
+  fastd:seen          Sorted Set Tunnel-ID -> last_seen als Epoch,
+                      ältere Einträge als prune Sekunden werden
+                      entfernt
+Nur TunnelIndex.rebuild() durchsucht noch mit SCAN alle Knoten
+(parallel) und baut daraus die Indizes neu auf.
+"""
+
+import os
+import json
+import time
+import socket
+import asyncio
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from ffpi.fastd import query_all_async, discover, instance_socket
+from ffpi.util import write_atomic
+
+try:
+    from redis.exceptions import (RedisError, RedisClusterException, ClusterDownError,
+                                  ConnectionError, TimeoutError)
+    # Fehler, bei denen ein erneuter Versuch sinnvoll ist
+    RETRY_ERRORS = (ClusterDownError, ConnectionError, TimeoutError)
+    # Alle Fehler von redis-py. RedisClusterException (z.B. kein Knoten
+    # erreichbar) ist keine RedisError.
+    REDIS_ERRORS = (RedisError, RedisClusterException)
+except ImportError:
+    # Ohne redis-py nur mit einem Ersatz für den Cluster benutzbar
+    # (Tests), dann gibt es auch keine Fehler von redis-py
+    RETRY_ERRORS = REDIS_ERRORS = ()
+
+STATEFILE = '/var/cache/ffpi/fastd2redis.json'
+KEY_PREFIX = 'fastd:tunnel:'
+GATE_PREFIX = 'fastd:gate:'
+SEEN_KEY = 'fastd:seen'
+PRUNE = 7 * 86400
+
+def gate_nodeid(statics='/etc/alfred/statics.json'):
+    # Die ID kann statisch angegeben werden, falls das nicht
+    # der Fall ist, wird der Hostname angenommen
+    try:
+        with open(statics, 'r') as fh:
+            return json.load(fh)['node']['node_id']
+    except (OSError, ValueError, KeyError, TypeError):
+        return socket.gethostname()
+
+def tunnel_id(mac):
+    return mac.replace(':', '')
+
+def timestamp(now=None):
+    if now is None:
+        now = time.time()
+    return datetime.datetime.fromtimestamp(int(now)).isoformat()
+
+def epoch(seen):
+    return datetime.datetime.fromisoformat(seen).timestamp()
+
+def execute(rc, commands, retries=5, backoff=1.0):
+    """
+    Befehle (Methode, args, kwargs) in einer Pipeline ausführen, bei
+    Cluster- oder Verbindungsfehlern mit wachsender Pause wiederholen.
+    Die Befehle müssen idempotent sein, da eine teilweise ausgeführte
+    Pipeline komplett wiederholt wird.
+    """
+    delay = backoff
+    for attempt in range(retries + 1):
+        pipe = rc.pipeline()
+        for method, args, kwargs in commands:
+            getattr(pipe, method)(*args, **kwargs)
+        try:
+            return pipe.execute()
+        except RETRY_ERRORS:
+            if attempt == retries:
+                raise
+            time.sleep(delay)
+            delay *= 2
+
+def _tunnel_collector(tunnels):
+    def on_peer(instance, key, peer):
+        conn = peer.get('connection')
+        if conn and conn.get('mac_addresses'):
+            tunnels[tunnel_id(conn['mac_addresses'][0])] = key
+    return on_peer
+
+async def collect_async(instances=None, timeout=5.0):
+    if instances is None:
+        instances = discover() or {'ffpi': instance_socket('ffpi')}
+    tunnels = {}
+    results = await query_all_async(instances, timeout, _tunnel_collector(tunnels))
+    if not results or all(result.error for result in results):
+        return None
+    return tunnels
+
+def collect(instances=None, timeout=5.0):
+    """
+    Verbundene Tunnel aller fastd-Instanzen als Dictionary
+    Tunnel-ID -> Schlüssel. Die Tunnel-ID ist die erste MAC-Adresse
+    der Verbindung ohne Doppelpunkte.
+    Ohne Konfiguration in /etc/fastd wird wie bei fastd-status.py die
+    Instanz ffpi angenommen. Liefert None, wenn keine Instanz abgefragt
+    werden konnte; ein leeres Ergebnis würde sonst als vollständiger
+    Lauf alle Tunnel des Gateways aus dem Index löschen.
+    """
+    return asyncio.run(collect_async(instances, timeout))
+
+class TunnelWriter(object):
+    """
+    Schreibt Tunnel-Schnappschüsse als Delta gegenüber dem vorherigen
+    Lauf. Der Stand wird erst nach erfolgreichem Schreiben gespeichert,
+    damit nach einem Fehler beim nächsten Mal wieder alles geschrieben
+    wird.
+    """
+
+    def __init__(self, rc, gate_id, statefile=STATEFILE, full_every=3600,
+                 retries=5, backoff=1.0, prune=PRUNE):
+        self.rc = rc
+        self.gate_id = gate_id
+        self.statefile = statefile
+        self.full_every = full_every
+        self.retries = retries
+        self.backoff = backoff
+        self.prune = prune
+        self.state = self.load()
+
+    def load(self):
+        if not self.statefile:
+            return {}
+        try:
+            with open(self.statefile) as fh:
+                state = json.load(fh)
+        except (OSError, ValueError):
+            return {}
+        if state.get('gate') != self.gate_id:
+            return {}
+        return state
+
+    def save(self):
+        if self.statefile:
+            os.makedirs(os.path.dirname(self.statefile) or '.', exist_ok=True)
+            write_atomic(self.statefile, json.dumps(self.state, separators=(',', ':')))
+
+    def plan(self, tunnels, now):
+        """
+        Liefert (geändert, unverändert) als Listen von Tunnel-IDs
+        """
+        previous = self.state.get('tunnels', {})
+        if now - self.state.get('full', 0) >= self.full_every:
+            return list(tunnels), []
+        changed = []
+        unchanged = []
+        for tid, key in tunnels.items():
+            if previous.get(tid) == key:
+                unchanged.append(tid)
+            else:
+                changed.append(tid)
+        return changed, unchanged
+
+    def write(self, tunnels, now=None):
+        """
+        tunnels: Dictionary Tunnel-ID -> Schlüssel, siehe collect().
+        Liefert (Anzahl geändert, Anzahl nur last_seen).
+        """
+        if now is None:
+            now = time.time()
+        seen = timestamp(now)
+        changed, unchanged = self.plan(tunnels, now)
+        full = len(changed) == len(tunnels) and not unchanged
+        gatekey = GATE_PREFIX + self.gate_id
+        commands = []
+        for tid in changed:
+            commands.append(('hset', (KEY_PREFIX + tid,), {'mapping': {
+                'key': tunnels[tid], 'last_seen': seen, 'last_gate': self.gate_id}}))
+        for tid in unchanged:
+            commands.append(('hset', (KEY_PREFIX + tid, 'last_seen', seen), {}))
+        # Indizes
+        if full:
+            commands.append(('delete', (gatekey,), {}))
+        else:
+            gone = set(self.state.get('tunnels', {})).difference(tunnels)
+            if gone:
+                commands.append(('srem', (gatekey,) + tuple(gone), {}))
+        if changed:
+            commands.append(('sadd', (gatekey,) + tuple(changed), {}))
+        if tunnels:
+            commands.append(('zadd', (SEEN_KEY, dict.fromkeys(tunnels, int(now))), {}))
+        commands.append(('zremrangebyscore', (SEEN_KEY, '-inf', int(now - self.prune)), {}))
+        execute(self.rc, commands, self.retries, self.backoff)
+        self.state = {'gate': self.gate_id,
+                      'full': now if full else self.state.get('full', 0),
+                      'tunnels': tunnels}
+        self.save()
+        return len(changed), len(unchanged)
+
+    def apply(self, established, gone, now=None):
+        """
+        Einzelne Ereignisse schreiben (siehe fastd-tunneld.py).
+        established: Dictionary Tunnel-ID -> Schlüssel neu verbundener
+        Tunnel, gone: getrennte Tunnel-IDs
+        """
+        if now is None:
+            now = time.time()
+        seen = timestamp(now)
+        gatekey = GATE_PREFIX + self.gate_id
+        commands = []
+        for tid, key in established.items():
+            commands.append(('hset', (KEY_PREFIX + tid,), {'mapping': {
+                'key': key, 'last_seen': seen, 'last_gate': self.gate_id}}))
+        for tid in gone:
+            commands.append(('hset', (KEY_PREFIX + tid, 'last_seen', seen), {}))
+        if established:
+            commands.append(('sadd', (gatekey,) + tuple(established), {}))
+        if gone:
+            commands.append(('srem', (gatekey,) + tuple(gone), {}))
+        ids = list(established) + list(gone)
+        if not ids:
+            return
+        commands.append(('zadd', (SEEN_KEY, dict.fromkeys(ids, int(now))), {}))
+        execute(self.rc, commands, self.retries, self.backoff)
+        tunnels = dict(self.state.get('tunnels', {}))
+        tunnels.update(established)
+        for tid in gone:
+            tunnels.pop(tid, None)
+        self.state = {'gate': self.gate_id, 'full': self.state.get('full', 0),
+                      'tunnels': tunnels}
+        self.save()
+
+class TunnelIndex(object):
+    """
+    Abfragen über die Indizes. Die Hashes der gefundenen Tunnel werden
+    mit einer Pipeline geholt.
+    """
+
+    def __init__(self, rc, prune=PRUNE):
+        self.rc = rc
+        self.prune = prune
+
+    def on_gate(self, gate_id):
+        return sorted(self.rc.smembers(GATE_PREFIX + gate_id))
+
+    def seen_since(self, seconds, now=None):
+        if now is None:
+            now = time.time()
+        return self.rc.zrangebyscore(SEEN_KEY, int(now - seconds), '+inf')
+
+    def tunnels(self, ids):
+        """
+        Dictionary Tunnel-ID -> Hash, nicht (mehr) vorhandene fehlen
+        """
+        ids = list(ids)
+        if not ids:
+            return {}
+        pipe = self.rc.pipeline()
+        for tid in ids:
+            pipe.hgetall(KEY_PREFIX + tid)
+        return {tid: data for tid, data in zip(ids, pipe.execute()) if data}
+
+    def _scan_node(self, node, match):
+        conn = self.rc.get_redis_connection(node)
+        return list(conn.scan_iter(match=match, count=1000))
+
+    def scan(self, match, workers=8):
+        """
+        SCAN auf allen Primärknoten gleichzeitig
+        """
+        nodes = self.rc.get_primaries()
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(nodes)))) as pool:
+            found = pool.map(lambda node: self._scan_node(node, match), nodes)
+            return [key for keys in found for key in keys]
+
+    def rebuild(self, workers=8, now=None):
+        """
+        Indizes aus den vorhandenen Hashes neu aufbauen.
+        Liefert die Anzahl der Tunnel.
+        """
+        if now is None:
+            now = time.time()
+        keys = self.scan(KEY_PREFIX + '*', workers)
+        data = self.tunnels(key[len(KEY_PREFIX):] for key in keys)
+        gates = {}
+        seen = {}
+        limit = now - self.prune
+        for tid, fields in data.items():
+            try:
+                ts = epoch(fields['last_seen'])
+            except (KeyError, ValueError):
+                continue
+            if ts >= limit:
+                seen[tid] = int(ts)
+            if 'last_gate' in fields:
+                gates.setdefault(fields['last_gate'], []).append(tid)
+        # Die Gateway-Mengen enthalten beim Neuaufbau alle Tunnel,
+        # die zuletzt an dem Gateway gesehen wurden. Der nächste
+        # vollständige Lauf des Gateways bereinigt sie.
+        commands = [('delete', (key,), {}) for key in self.scan(GATE_PREFIX + '*', workers)]
+        commands.append(('delete', (SEEN_KEY,), {}))
+        for gate_id, ids in gates.items():
+            commands.append(('sadd', (GATE_PREFIX + gate_id,) + tuple(ids), {}))
+        if seen:
+            commands.append(('zadd', (SEEN_KEY, seen), {}))
+        execute(self.rc, commands)
+        return len(data)
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+"""
+Hilfsfunktionen ohne eigenes Fachgebiet
+"""
+
+import os
+import tempfile
+
+def write_atomic(filename, text):
+    """
+    Datei ersetzen, ohne daß ein Leser je einen halb geschriebenen
+    Stand sieht: erst eine temporäre Datei im selben Verzeichnis
+    schreiben, dann umbenennen. text als str oder bytes.
+    """
+    dirname = os.path.dirname(filename) or '.'
+    fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.' + os.path.basename(filename))
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(text, bytes) else 'w') as fh:
+            fh.write(text)
+        os.chmod(tmpname, 0o644)
+        os.replace(tmpname, filename)
+    except BaseException:
+        os.unlink(tmpname)
+        raise
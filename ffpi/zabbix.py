@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""
+Zabbix-Agent (passive Checks) für Werte, die ohnehin im Speicher sind
+
+Der Zabbix-Server bzw. -Proxy verbindet sich, schickt einen Schlüssel
+und bekommt den Wert zurück. Unterstützt werden Anfragen mit Header
+(ZBXD\\x01, Länge als 8 Byte little endian) und, z.B. für
+zabbix/ffpi-get mit socat, einfache Textzeilen. Die Antwort hat das
+gleiche Format wie die Anfrage. Als Textzeile enthält ZBX_NOTSUPPORTED
+keine Fehlermeldung, das Trennzeichen \0 würde sonst im Wert landen.
+
+Schlüssel haben die Form name oder name[param1,param2,...]. Welche
+Werte es dazu gibt, entscheidet die beim Anlegen übergebene Funktion
+lookup(name, params); löst sie KeyError aus, wird ZBX_NOTSUPPORTED
+geliefert.
+"""
+
+import os
+import json
+import struct
+import logging
+import threading
+import socketserver
+
+ZBX_HEADER = b'ZBXD\x01'
+ZBX_NOTSUPPORTED = 'ZBX_NOTSUPPORTED'
+MAX_KEY = 2048
+
+log = logging.getLogger(__name__)
+
+def parse_key(key):
+    """
+    'name[a,"b c",]' -> ('name', ['a', 'b c', ''])
+    """
+    key = key.strip()
+    name, sep, rest = key.partition('[')
+    if not sep:
+        return name, []
+    if not rest.endswith(']'):
+        raise ValueError("Invalid item key {!r}".format(key))
+    params = [p.strip() for p in rest[:-1].split(',')]
+    return name, [p[1:-1] if len(p) > 1 and p[0] == p[-1] == '"' else p for p in params]
+
+def encode(value):
+    if value is None:
+        raise KeyError('no value')
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(',', ':'), sort_keys=True)
+    return str(value)
+
+class AgentHandler(socketserver.StreamRequestHandler):
+
+    timeout = 5
+
+    def read_key(self):
+        head = self.rfile.read(len(ZBX_HEADER))
+        if head == ZBX_HEADER:
+            length, = struct.unpack('<Q', self.rfile.read(8))
+            if length > MAX_KEY:
+                raise ValueError("Item key too long")
+            return self.rfile.read(length).decode('utf-8'), True
+        line = head + self.rfile.readline(MAX_KEY)
+        return line.decode('utf-8'), False
+
+    def handle(self):
+        try:
+            key, framed = self.read_key()
+        except (OSError, ValueError, struct.error) as err:
+            log.debug("Invalid zabbix request: {}".format(err))
+            return
+        try:
+            name, params = parse_key(key)
+            value = encode(self.server.lookup(name, params))
+        except (KeyError, IndexError, TypeError, ValueError) as err:
+            value = '{}\0{}'.format(ZBX_NOTSUPPORTED, err) if framed else ZBX_NOTSUPPORTED
+        data = value.encode('utf-8')
+        if framed:
+            data = ZBX_HEADER + struct.pack('<Q', len(data)) + data
+        else:
+            data += b'\n'
+        try:
+            self.wfile.write(data)
+        except OSError:
+            pass
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+class AgentServer(object):
+    """
+    Lauscht auf einer TCP-Adresse (host, port) und/oder einem
+    Unix-Socket, jeweils in einem eigenen Thread.
+    """
+
+    def __init__(self, lookup, address=None, sockpath=None, group=None):
+        self.lookup = lookup
+        self.address = address
+        self.sockpath = sockpath
+        self.group = group
+        self.servers = []
+
+    def _unix_server(self):
+        # /var/run ist ein tmpfs, das Verzeichnis fehlt nach dem Booten
+        os.makedirs(os.path.dirname(self.sockpath) or '.', exist_ok=True)
+        if os.path.exists(self.sockpath):
+            os.unlink(self.sockpath)
+        server = _UnixServer(self.sockpath, AgentHandler)
+        mode = 0o666
+        if self.group:
+            import grp
+            try:
+                os.chown(self.sockpath, -1, grp.getgrnam(self.group).gr_gid)
+                mode = 0o660
+            except (KeyError, OSError):
+                pass
+        os.chmod(self.sockpath, mode)
+        return server
+
+    def start(self):
+        """
+        Erst alle Sockets binden, dann bedienen. Schlägt einer fehl,
+        werden die bereits gebundenen wieder geschlossen, damit kein
+        Port offen bleibt, den niemand bedient.
+        """
+        servers = []
+        try:
+            if self.address:
+                servers.append(_TCPServer(tuple(self.address), AgentHandler))
+            if self.sockpath:
+                servers.append(self._unix_server())
+        except OSError:
+            for server in servers:
+                server.server_close()
+            raise
+        for server in servers:
+            server.lookup = self.lookup
+            threading.Thread(target=server.serve_forever, name='zabbix-agent',
+                             daemon=True).start()
+            self.servers.append(server)
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.servers = []
+        if self.sockpath and os.path.exists(self.sockpath):
+            os.unlink(self.sockpath)
@@ -1,8 +1,23 @@
 #!/bin/sh
 
+# Gemeinsam genutzte Module
+SITEDIR=$(python3 -c 'import sysconfig; print(sysconfig.get_path("purelib"))')
+install -v -d $SITEDIR/ffpi
+install -v -m 644 ffpi/*.py $SITEDIR/ffpi
+
 install -v fastd-status.py /usr/local/bin
+install -v fastd2redis.py /usr/local/bin
+install -v fastd-tunnels.py /usr/local/bin
+install -v fastd-tunneld.py /usr/local/bin
+install -v fastd-hook /usr/local/bin
 install -v ffgate-check /usr/local/bin
 install -v alfred-announce.py /usr/local/bin
-install -v vnstati.sh /usr/local/bin
+install -v alfred-mesh.py /usr/local/bin
+install -v dhcpd-leases.py /usr/local/bin
+install -v traffic-stats.py /usr/local/bin
 
 install -v init.d/fastd /etc/init.d
+
+# Zabbix: Werte aus alfred-announce.py
+install -v zabbix/ffpi-get /usr/local/bin
+install -v -m 644 zabbix/userparameter_ffpi.conf /etc/zabbix/zabbix_agentd.d
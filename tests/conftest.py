@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+"""
+Gemeinsame Einstellungen für die Tests
+
+Die Ersatzserver (fastd, alfred, batman-adv über Netlink, ethtool,
+redis-server) liegen in bench/fixtures.py und werden auch für die
+Laufzeitmessungen verwendet.
+"""
+
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+# Gemeinsam mit bench.py
+from fixtures import load_script
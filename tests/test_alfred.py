@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+ffpi.alfred: Übertragung an einen nachgebildeten alfred-Socket und
+Abfrage von FakeAlfred
+"""
+
+import os
+import json
+import zlib
+import errno
+import socket
+import threading
+
+import pytest
+
+from ffpi import alfred
+from ffpi.alfred import AlfredClient, AlfredError, PayloadCache, parse_push_data
+from fixtures import FakeAlfred
+
+class PushServer(object):
+    """
+    Nimmt wie alfred je Verbindung ein Paket bis zum Ende entgegen.
+    Für Datentypen in reject wird STATUS_ERROR geantwortet.
+    """
+
+    def __init__(self, sockpath, reject=()):
+        self.sockpath = sockpath
+        self.reject = reject
+        self.packets = []
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(sockpath)
+        self.sock.listen(4)
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except OSError:
+                return
+            with conn:
+                data = b''
+                while True:
+                    buf = conn.recv(65536)
+                    if not buf:
+                        break
+                    data += buf
+                self.packets.append(data)
+                rtype, version, length = alfred._tlv.unpack_from(data)
+                blocks = list(parse_push_data(data[alfred._tlv.size:]))
+                if blocks and blocks[0][1] in self.reject:
+                    txid = alfred._tx.unpack_from(data, alfred._tlv.size)[0]
+                    conn.sendall(alfred._tlv.pack(alfred.ALFRED_STATUS_ERROR, 0, alfred._tx.size)
+                                 + alfred._tx.pack(txid, errno.EINVAL))
+
+    def close(self):
+        self.sock.close()
+
+@pytest.fixture
+def server(tmp_path):
+    s = PushServer(str(tmp_path / 'alfred.sock'), reject=(159,))
+    yield s
+    s.close()
+
+def test_push(server):
+    payload = zlib.compress(b'{"hostname":"ffpi-gw"}')
+    AlfredClient(server.sockpath).push(158, payload)
+    packet, = server.packets
+    rtype, version, length = alfred._tlv.unpack_from(packet)
+    assert (rtype, version, length) == (alfred.ALFRED_PUSH_DATA, 0, len(packet) - alfred._tlv.size)
+    assert list(parse_push_data(packet[alfred._tlv.size:])) == [('00:00:00:00:00:00', 158, 0, payload)]
+
+def test_push_rejected(server):
+    with pytest.raises(AlfredError) as err:
+        AlfredClient(server.sockpath).push(159, b'x')
+    assert os.strerror(errno.EINVAL) in str(err.value)
+
+def test_push_many_collects_errors(server):
+    errors = AlfredClient(server.sockpath).push_many({158: b'a', 159: b'b', 160: b'c'})
+    assert list(errors) == [159]
+    assert len(server.packets) == 3
+
+def test_push_without_server(tmp_path):
+    with pytest.raises(AlfredError):
+        AlfredClient(str(tmp_path / 'missing.sock')).push(158, b'x')
+
+def test_payload_too_large():
+    with pytest.raises(AlfredError):
+        alfred.pack_push_data(158, b'\0' * (alfred.MAX_DATA + 1))
+
+def test_payload_cache():
+    cache = PayloadCache(refresh=300)
+    blob = cache.get(158, {'b': 1, 'a': 2}, now=0)
+    assert json.loads(zlib.decompress(blob).decode('utf-8')) == {'a': 2, 'b': 1}
+    # Unverändert: erst nach refresh Sekunden erneut
+    assert cache.get(158, {'a': 2, 'b': 1}, now=100) is None
+    assert cache.get(158, {'a': 2, 'b': 1}, now=300) == blob
+    assert cache.stats['compressed'] == 1
+    assert cache.get(158, {'a': 3}, now=301) is not None
+    cache.invalidate(158)
+    assert cache.get(158, {'a': 3}, now=302) is not None
+    assert cache.stats['compressed'] == 3
+
+def test_request_fake_alfred(tmp_path):
+    # Genug Knoten für mehrere Push-Pakete
+    server = FakeAlfred(str(tmp_path / 'alfred.sock'), nodes=500).start()
+    try:
+        client = AlfredClient(server.sockpath)
+        nodeinfo = client.request(158)
+        statistics = client.request(159)
+    finally:
+        server.stop()
+    assert len(nodeinfo) == len(statistics) == 500
+    assert sum(map(len, nodeinfo.values())) > alfred.MAX_PAYLOAD
+    info = json.loads(zlib.decompress(nodeinfo['02:00:00:00:00:32']).decode('utf-8'))
+    assert info['hostname'] == 'ffpi-gw-00050'
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""
+ffpi.batadv gegen den nachgebildeten Netlink-Socket (FakeBatadvSocket)
+"""
+
+import struct
+
+import pytest
+
+from ffpi import batadv
+from ffpi.batadv import Batadv, BatadvError, Netlink
+from fixtures import FakeBatadvSocket, fake_batadv, gateway_mac, mac_string
+
+class ErrorSocket(object):
+    # Antwortet auf jede Anfrage mit NLMSG_ERROR (ENOENT)
+    def close(self):
+        pass
+
+    def send(self, data):
+        self.seq = batadv._nlmsghdr.unpack_from(data)[3]
+
+    def recv(self, bufsize):
+        body = struct.pack('=i', -2) + b'\0' * 16
+        return batadv._nlmsghdr.pack(batadv._nlmsghdr.size + len(body), batadv.NLMSG_ERROR,
+                                     0, self.seq, 0) + body
+
+def test_hardifs():
+    hardifs = fake_batadv(originators=10).hardifs()
+    assert [h.ifname for h in hardifs] == ['mesh-vpn0', 'mesh-vpn1', 'mesh-vpn2', 'mesh-vpn3']
+    assert hardifs[1].ifindex == 11
+    assert hardifs[1].address == '02:00:00:00:01:01'
+    assert all(h.active for h in hardifs)
+
+def test_gateways():
+    gateways = fake_batadv(originators=10, gateways=3).gateways()
+    assert [gw.orig for gw in gateways] == [mac_string(gateway_mac(g)) for g in range(3)]
+    assert [gw.best for gw in gateways] == [True, False, False]
+    assert gateways[2].hardif == 'mesh-vpn2'
+    assert gateways[0].bandwidth_down == 1000
+
+def test_originators_across_chunks():
+    # Kleiner Puffer: die Antworten verteilen sich auf viele recv()
+    cache = {}
+    b = Batadv('lo', connect=lambda: Netlink(FakeBatadvSocket(originators=500, bufsize=1024, cache=cache)))
+    originators = list(b.originators())
+    assert len(originators) == 1500
+    assert sum(o.best for o in originators) == 500
+    stats = b.originator_stats()
+    assert stats['count'] == 500
+    assert sum(stats['tq'].values()) == 500
+    assert sum(stats['nexthops'].values()) == 500
+    assert set(stats['nexthops']) <= {'mesh-vpn0', 'mesh-vpn1', 'mesh-vpn2', 'mesh-vpn3'}
+
+def test_neighbour_stats():
+    stats = fake_batadv(originators=100).neighbour_stats()
+    assert stats['count'] == 10
+    assert sum(stats['hardifs'].values()) == 10
+
+def test_family_not_found():
+    b = Batadv('lo', connect=lambda: Netlink(ErrorSocket()))
+    with pytest.raises(BatadvError):
+        b.hardifs()
+
+def test_missing_mesh_interface():
+    b = Batadv('ffpi-missing0', connect=lambda: Netlink(FakeBatadvSocket(originators=1)))
+    with pytest.raises(BatadvError):
+        b.hardifs()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+ddns-update gegen einen lokalen HTTP-Server und ein nsupdate-Ersatzskript
+"""
+
+import os
+import time
+import threading
+import http.server
+
+import pytest
+
+from conftest import load_script
+
+ddns = load_script('ddns-update', 'ddns_update')
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # /ip liefert eine Adresse, /slow erst nach 2 s, /bad keine gültige
+    answers = {'/ip': 'Your IP: 192.0.2.10\n', '/bad': '192.0.2.300\n', '/slow': '198.51.100.1\n'}
+
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(2)
+        body = self.answers.get(self.path, '').encode('ascii')
+        self.send_response(200 if body else 404)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture(scope='module')
+def http_url():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def conf(tmp_path, http_url):
+    # nsupdate-Ersatz: schreibt die Eingabe und die Argumente mit
+    nsupdate = tmp_path / 'nsupdate'
+    nsupdate.write_text('#!/bin/sh\necho "$@" >> "{0}/args"\ncat >> "{0}/input"\nexit ${{NSUPDATE_EXIT:-0}}\n'
+                        .format(tmp_path))
+    nsupdate.chmod(0o755)
+    return dict(ddns.cfg, HOST='gw1 gw2', ZONE='dyn.example.org', MYIPURL=http_url + '/ip',
+                NSUPDATE=str(nsupdate), KEYFILE='/etc/dyndns/test.key', IPTIMEOUT='1',
+                CACHEFILE=str(tmp_path / 'cache' / 'ddclient.cache'))
+
+def updates(tmp_path):
+    try:
+        return (tmp_path / 'input').read_text()
+    except FileNotFoundError:
+        return ''
+
+def test_discover_first_valid_answer(http_url):
+    urls = [http_url + '/bad', http_url + '/slow', http_url + '/missing', http_url + '/ip']
+    t0 = time.monotonic()
+    assert ddns.discover_ip(urls, timeout=1.5) == '192.0.2.10'
+    # Der langsame Dienst wird nicht abgewartet
+    assert time.monotonic() - t0 < 1.5
+
+def test_discover_timeout(http_url):
+    assert ddns.discover_ip([http_url + '/slow'], timeout=0.3) is None
+
+def test_update_all_hosts_once(conf, tmp_path):
+    assert ddns.main(conf) == 0
+    assert updates(tmp_path) == ("update delete gw1.dyn.example.org A\n"
+                                 "update add gw1.dyn.example.org 90 A 192.0.2.10\n"
+                                 "update delete gw2.dyn.example.org A\n"
+                                 "update add gw2.dyn.example.org 90 A 192.0.2.10\n"
+                                 "send\n")
+    assert (tmp_path / 'args').read_text() == "-k /etc/dyndns/test.key\n"
+    cache = ddns.Cache(conf['CACHEFILE'])
+    assert cache.get('gw2.dyn.example.org')['ip'] == '192.0.2.10'
+    # Unverändert: kein weiteres Update
+    assert ddns.main(conf) == 0
+    assert updates(tmp_path).count('send') == 1
+
+def test_update_because_of_age(conf, tmp_path):
+    cache = ddns.Cache(conf['CACHEFILE'])
+    cache.set('gw1.dyn.example.org', ip='192.0.2.10', mtime=str(int(time.time())))
+    cache.set('gw2.dyn.example.org', ip='192.0.2.10', mtime='0')
+    cache.save()
+    assert ddns.main(conf) == 0
+    assert 'gw1' not in updates(tmp_path)
+    assert 'update add gw2.dyn.example.org' in updates(tmp_path)
+
+def test_cache_keeps_foreign_lines(conf):
+    os.makedirs(os.path.dirname(conf['CACHEFILE']))
+    with open(conf['CACHEFILE'], 'w') as fh:
+        fh.write("## ddclient-3.9.1\nip=192.0.2.1,mtime=5,status=good other.example.org\n")
+    assert ddns.main(conf) == 0
+    with open(conf['CACHEFILE']) as fh:
+        lines = fh.read().splitlines()
+    assert lines[:2] == ["## ddclient-3.9.1", "ip=192.0.2.1,mtime=5,status=good other.example.org"]
+    assert len(lines) == 4
+
+def test_nsupdate_failure_keeps_cache(conf, tmp_path, monkeypatch):
+    monkeypatch.setenv('NSUPDATE_EXIT', '2')
+    assert ddns.main(conf) == 1
+    assert not os.path.exists(conf['CACHEFILE'])
+
+def test_no_address(conf, http_url):
+    conf['MYIPURL'] = http_url + '/bad'
+    assert ddns.main(conf) == 1
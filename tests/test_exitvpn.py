@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""
+ffpi.exitvpn gegen das Loopback-Interface: 127.0.0.1 antwortet immer,
+192.0.2.1 (TEST-NET-1) nie. Dazu die Konfigurationen in /etc/openvpn
+und /proc sowie das Umschalten in ffgate-check.
+"""
+
+import os
+import sys
+import threading
+import subprocess
+
+import pytest
+
+from conftest import ROOT, load_script
+from ffpi import exitvpn
+from ffpi.exitvpn import Exit, ExitProber, EchoSocket, load_exits, autostart
+
+def icmp_allowed():
+    try:
+        EchoSocket('lo', 1).close()
+    except OSError:
+        return False
+    return True
+
+icmp = pytest.mark.skipif(not icmp_allowed(), reason="keine ICMP-Sockets auf lo (CAP_NET_RAW)")
+
+@pytest.fixture
+def prober():
+    p = ExitProber(exits=[Exit('loop', 'lo', 'XX')], targets=('127.0.0.1',), timeout=0.5)
+    yield p
+    p.stop()
+    p.close()
+
+@icmp
+def test_probe_loopback(prober):
+    results = prober.probe()
+    assert results[('loop', '127.0.0.1')] is not None
+    assert prober.healthy('loop')
+
+@icmp
+def test_probe_unreachable_target():
+    p = ExitProber(exits=[Exit('loop', 'lo', 'XX')], targets=('192.0.2.1',), timeout=0.2)
+    try:
+        p.probe()
+        p.probe()
+        assert not p.healthy('loop')
+    finally:
+        p.close()
+
+@icmp
+def test_concurrent_probes_keep_replies(prober):
+    # Gleichzeitige Runden dürfen sich die Antworten nicht wegnehmen
+    errors = []
+    def run():
+        for n in range(5):
+            results = prober.probe()
+            if results[('loop', '127.0.0.1')] is None:
+                errors.append(n)
+    threads = [threading.Thread(target=run) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert prober.status()['loop']['loss'] == 0
+
+@icmp
+def test_probe_reuses_recent_round(prober):
+    prober.probe()
+    seq = prober.seq
+    assert prober.probe(max_age=30) is None
+    assert prober.seq == seq
+
+@icmp
+def test_active_exit_cached(prober, monkeypatch):
+    calls = []
+    def fake_nat():
+        calls.append(1)
+        return ['lo']
+    monkeypatch.setattr(exitvpn, 'nat_interfaces', fake_nat)
+    assert prober.active().name == 'loop'
+    assert prober.active().name == 'loop'
+    assert len(calls) == 1
+
+@icmp
+def test_loop_survives_errors(prober, monkeypatch):
+    done = threading.Event()
+    calls = []
+    def broken(max_age=None):
+        calls.append(1)
+        if len(calls) > 2:
+            done.set()
+        raise KeyError('loop')
+    monkeypatch.setattr(prober, 'probe', broken)
+    prober.start(0.01)
+    assert done.wait(5)
+
+def write(filename, content):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'w') as fh:
+        fh.write(content)
+
+@pytest.fixture
+def openvpn(tmp_path):
+    confdir = str(tmp_path / 'openvpn')
+    write(os.path.join(confdir, 'exit1.conf'), 'client\ndev tun\n## ExitCountry = SE\n')
+    write(os.path.join(confdir, 'exit2.conf'), 'client\ndev tun7\n## ExitCountry = NL\n')
+    write(os.path.join(confdir, 'exit3.conf'), 'client\n')
+    proc = str(tmp_path / 'proc')
+    write(os.path.join(proc, '100', 'comm'), 'openvpn\n')
+    write(os.path.join(proc, '100', 'cmdline'), 'openvpn\0--cd\0/etc/openvpn\0--config\0exit1.conf\0')
+    write(os.path.join(proc, '100', 'fdinfo', '3'), 'pos:\t0\nflags:\t02\n')
+    write(os.path.join(proc, '100', 'fdinfo', '6'), 'pos:\t0\nflags:\t04002\nmnt_id:\t26\niff:\ttun3\n')
+    write(os.path.join(proc, '200', 'comm'), 'bash\n')
+    return confdir, proc
+
+def test_load_exits_dynamic_device(openvpn):
+    confdir, proc = openvpn
+    assert load_exits(confdir, proc) == [Exit('exit1', 'tun3', 'SE', True),
+                                         Exit('exit2', 'tun7', 'NL', False),
+                                         Exit('exit3', 'exit3', '??', False)]
+    # OpenVPN läuft nicht: das Interface ist (noch) unbekannt
+    assert load_exits(confdir, confdir)[0] == Exit('exit1', 'tun', 'SE', True)
+
+def test_resolve_after_restart(openvpn):
+    confdir, proc = openvpn
+    prober = ExitProber(exits=load_exits(confdir, confdir))
+    prober.resolve(proc)
+    assert [e.interface for e in prober.exits] == ['tun3', 'tun7', 'exit3']
+    write(os.path.join(proc, '100', 'fdinfo', '6'), 'iff:\ttun0\n')
+    prober.resolve(proc)
+    assert prober.exits[0].interface == 'tun0'
+
+def test_autostart(tmp_path):
+    filename = str(tmp_path / 'openvpn')
+    assert autostart(filename) is None
+    write(filename, '#AUTOSTART="all"\nAUTOSTART="exit1 exit2"\n')
+    assert autostart(filename) == ['exit1', 'exit2']
+
+@pytest.fixture
+def ffgate_check(monkeypatch):
+    module = load_script('ffgate-check', 'ffgate_check')
+    calls = []
+    rules = ['-P POSTROUTING ACCEPT',
+             '-A POSTROUTING -s 10.137.0.0/16 -o tun0 -j MASQUERADE',
+             '-A POSTROUTING -o eth0 -j SNAT --to-source 192.0.2.1',
+             '-A POSTROUTING -s 10.137.0.0/16 -o tun0 -m comment --comment "exit tun0" -j MASQUERADE']
+    def check_output(args, timeout=None):
+        assert args == ['iptables', '-t', 'nat', '-S', 'POSTROUTING']
+        return '\n'.join(rules).encode('utf-8')
+    monkeypatch.setattr(module.subprocess, 'check_output', check_output)
+    monkeypatch.setattr(module.subprocess, 'check_call', calls.append)
+    return module, calls
+
+def test_failover_replaces_rules(ffgate_check):
+    module, calls = ffgate_check
+    module.failover('tun0', 'tun3')
+    nat = ['iptables', '-t', 'nat']
+    assert calls == [nat + ['-R', 'POSTROUTING', '1', '-s', '10.137.0.0/16', '-o', 'tun3', '-j', 'MASQUERADE'],
+                     nat + ['-R', 'POSTROUTING', '3', '-s', '10.137.0.0/16', '-o', 'tun3',
+                            '-m', 'comment', '--comment', 'exit tun0', '-j', 'MASQUERADE']]
+
+def test_failover_without_rule(ffgate_check):
+    module, calls = ffgate_check
+    module.failover(None, 'tun3')
+    module.failover('tun9', 'tun3')
+    assert calls == [['iptables', '-t', 'nat', '-A', 'POSTROUTING', '-o', 'tun3', '-j', 'MASQUERADE']] * 2
+
+@pytest.mark.parametrize('rounds', ['0', '-1', 'x'])
+def test_ffgate_check_invalid_rounds(rounds):
+    proc = subprocess.run([sys.executable, os.path.join(ROOT, 'ffgate-check'), '-n', rounds],
+                          env=dict(os.environ, PYTHONPATH=ROOT), stdout=subprocess.PIPE)
+    assert proc.returncode == 2
+    assert b'Invalid number of rounds' in proc.stdout
+
+def test_exitvpn_provider(monkeypatch):
+    announce = load_script('alfred-announce.py', 'alfred_announce')
+    monkeypatch.setattr(announce, 'autostart', lambda: ['exit1'])
+    assert announce.fn_exitvpn_provider() == 'exit1'
+    monkeypatch.setattr(announce, 'autostart', lambda: None)
+    assert announce.fn_exitvpn_provider() == 'n/a'
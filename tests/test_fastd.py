@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+ffpi.fastd: StatusParser mit an beliebiger Stelle geteilten Daten und
+query_all() gegen FakeFastd
+"""
+
+import os
+import json
+
+import pytest
+
+from ffpi.fastd import StatusParser, query_all
+from fixtures import FakeFastd, fastd_status
+
+# Wie von fastd geliefert: Gleitkommazahlen, null und Umlaute
+STATUS = json.dumps({
+    'uptime': 123.5,
+    'interface': 'ffpi-mesh-vpn',
+    'statistics': {'rx': {'packets': 10, 'bytes': 1e3}},
+    'peers': {
+        'a' * 64: {'name': 'Knoten Müller', 'address': '[2001:db8::1]:10000',
+                   'interface': 'ffpi-mesh-vpn',
+                   'connection': {'established': 98765.25, 'method': 'salsa2012+umac',
+                                  'mac_addresses': ['02:00:00:00:00:01']}},
+        'b' * 64: {'name': 'offline', 'address': None, 'interface': None, 'connection': None},
+        'c' * 64: {'name': 'ganzzahlig', 'address': '[2001:db8::3]:10000',
+                   'interface': 'ffpi-mesh-vpn', 'connection': {'established': -7, 'mac_addresses': []}},
+    },
+    'enabled': True,
+}, ensure_ascii=False, indent=4).encode('utf-8')
+
+def parse(*chunks):
+    parser = StatusParser()
+    peers = {}
+    for chunk in chunks:
+        peers.update(parser.feed(chunk))
+    parser.close()
+    return parser.header, peers
+
+def expected(document):
+    doc = json.loads(document.decode('utf-8'))
+    return doc, doc.pop('peers')
+
+@pytest.mark.parametrize('document', [STATUS, STATUS.replace(b'\n', b'').replace(b' ', b''),
+                                      fastd_status(3).encode('utf-8')],
+                         ids=['indent', 'compact', 'fixture'])
+def test_split_at_every_offset(document):
+    header, peers = expected(document)
+    for n in range(len(document) + 1):
+        assert parse(document[:n], document[n:]) == (header, peers), n
+
+def test_bytewise():
+    header, peers = expected(STATUS)
+    assert parse(*(STATUS[n:n + 1] for n in range(len(STATUS)))) == (header, peers)
+
+def test_incomplete_document():
+    parser = StatusParser()
+    parser.feed(STATUS[:-1])
+    with pytest.raises(ValueError):
+        parser.close()
+
+def test_query_all_fake_fastd(tmp_path):
+    server = FakeFastd(os.path.join(str(tmp_path), 'fastd.sock'), peers=50).start()
+    try:
+        result, = query_all({'ffpi': server.sockpath})
+    finally:
+        server.stop()
+    header, peers = expected(fastd_status(50).encode('utf-8'))
+    assert result.error is None
+    assert result.header == header
+    assert result.peers == peers
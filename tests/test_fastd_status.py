@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""
+Watch-Modus von fastd-status.py mit nachgebildeten Abfragen
+"""
+
+import pytest
+
+from conftest import load_script
+from ffpi.batadv import BatadvError
+from ffpi.fastd import StatusResult
+
+status = load_script('fastd-status.py', 'fastd_status')
+
+GW_MAC = '02:00:00:00:00:01'
+
+def peer(name, mac):
+    return {'name': name, 'connection': {'mac_addresses': [mac]}}
+
+class Stop(Exception):
+    pass
+
+@pytest.fixture
+def rounds(monkeypatch):
+    """
+    Je Durchlauf die Peers jeder Instanz, None für eine fehlgeschlagene
+    Abfrage, sowie die Gateway-MACs oder eine BatadvError
+    """
+    plan = []
+    def query_all(instances, on_peer=None):
+        peers, macs = plan[0]
+        results = []
+        for instance in instances:
+            if peers[instance] is None:
+                results.append(StatusResult(instance, instance + '.sock', {}, {}, "timeout"))
+                continue
+            for key, data in peers[instance].items():
+                on_peer(instance, key, data)
+            results.append(StatusResult(instance, instance + '.sock', {}, peers[instance], None))
+        return results
+    def get_gate_macs(meshif):
+        peers, macs = plan[0]
+        if isinstance(macs, Exception):
+            raise macs
+        return macs
+    def sleep(interval):
+        plan.pop(0)
+        if not plan:
+            raise Stop()
+    monkeypatch.setattr(status, 'query_all', query_all)
+    monkeypatch.setattr(status, 'get_gate_macs', get_gate_macs)
+    monkeypatch.setattr(status.time, 'sleep', sleep)
+    return plan
+
+def test_failed_instance_keeps_peers(rounds, capsys):
+    a = {'k1': peer('gw', GW_MAC), 'k2': peer('knoten', '02:00:00:00:00:02')}
+    b = {'k3': peer('andere', '02:00:00:00:00:03')}
+    rounds.extend([({'a': a, 'b': b}, {GW_MAC}),
+                   ({'a': None, 'b': b}, {GW_MAC}),
+                   ({'a': a, 'b': {}}, {GW_MAC})])
+    with pytest.raises(Stop):
+        status.watch(5, instances={'a': 'a.sock', 'b': 'b.sock'})
+    out = capsys.readouterr().out.splitlines()
+    assert out[0] == "3 connected, watching every 5 seconds"
+    # Ausfall von a ohne Ereignis, danach nur der getrennte Peer aus b
+    assert len(out) == 2
+    assert out[1].endswith("- Peer andere (02:00:00:00:00:03) disconnected")
+
+def test_batadv_error_keeps_gateways(rounds, capsys):
+    a = {'k1': peer('gw', GW_MAC)}
+    rounds.extend([({'a': a}, {GW_MAC}),
+                   ({'a': a}, BatadvError("Mesh interface bat0 not found")),
+                   ({'a': a}, {GW_MAC})])
+    with pytest.raises(Stop):
+        status.watch(5, instances={'a': 'a.sock'}, as_json=True)
+    captured = capsys.readouterr()
+    assert len(captured.out.splitlines()) == 1
+    assert "bat0 not found" in captured.err
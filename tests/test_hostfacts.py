@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""
+ffpi.hostfacts: utmp, os-release und der Zwischenspeicher der Werte
+"""
+
+import os
+import json
+
+import pytest
+
+from ffpi import hostfacts
+from ffpi.hostfacts import HostFacts, os_release, runlevel
+
+def utmp_record(ut_type, ut_pid, user=b''):
+    values = [ut_type, ut_pid, b'', b'', user, b'', 0, 0, 0, 0, 0, 0, 0, 0, 0, b'']
+    return hostfacts._utmp.pack(*values)
+
+def test_runlevel(tmp_path):
+    utmp = tmp_path / 'utmp'
+    # BOOT_TIME, RUN_LVL 3, LOGIN; der letzte RUN_LVL-Eintrag gilt
+    utmp.write_bytes(utmp_record(2, 0) + utmp_record(hostfacts.RUN_LVL, ord('3'), b'runlevel')
+                     + utmp_record(6, 1234, b'LOGIN') + utmp_record(hostfacts.RUN_LVL, ord('5')))
+    assert runlevel(str(utmp)) == 5
+
+def test_runlevel_missing(tmp_path):
+    assert runlevel(str(tmp_path / 'utmp')) is None
+    # Nur ein unvollständiger Eintrag
+    (tmp_path / 'utmp').write_bytes(utmp_record(hostfacts.RUN_LVL, ord('3'))[:100])
+    assert runlevel(str(tmp_path / 'utmp')) is None
+
+def test_os_release(tmp_path):
+    filename = tmp_path / 'os-release'
+    filename.write_text('# Kommentar\n'
+                        'PRETTY_NAME="Debian GNU/Linux 12 (bookworm)"\n'
+                        'NAME=\'Debian GNU/Linux\'\n'
+                        'VERSION_ID="12"\n'
+                        'ID=debian\n'
+                        '\n'
+                        'HOME_URL="https://www.debian.org/"\n')
+    info = os_release(str(filename))
+    assert info['ID'] == 'debian'
+    assert info['NAME'] == 'Debian GNU/Linux'
+    assert info['VERSION_ID'] == '12'
+    assert info['HOME_URL'] == 'https://www.debian.org/'
+    assert '# Kommentar' not in info
+
+@pytest.fixture
+def facts(tmp_path, monkeypatch):
+    monkeypatch.setattr(hostfacts, 'boot_id', lambda: 'boot-1')
+    return HostFacts(str(tmp_path / 'cache' / 'hostfacts.json'))
+
+def test_cache_across_runs(facts, tmp_path):
+    dep = tmp_path / 'dep'
+    dep.write_text('1')
+    calls = []
+    def fn():
+        calls.append(1)
+        return len(calls)
+    assert facts.get('value', fn, (str(dep),)) == 1
+    # Neue Instanz, gleicher Systemstart: Wert aus der Datei
+    restored = HostFacts(facts.cachefile)
+    assert restored.get('value', fn, (str(dep),)) == 1
+    assert len(calls) == 1
+    # Geänderte Abhängigkeit
+    dep.write_text('22')
+    os.utime(str(dep), ns=(0, 0))
+    assert restored.get('value', fn, (str(dep),)) == 2
+
+def test_fastd_missing_cached(facts, monkeypatch):
+    monkeypatch.setattr(hostfacts, 'fastd_binary', lambda: None)
+    for n in range(2):
+        with pytest.raises(FileNotFoundError):
+            facts.fastd_version()
+    with open(facts.cachefile) as fh:
+        cache = json.load(fh)
+    assert cache['facts']['fastd_version'] == {'value': None, 'deps': {'': None}}
+    # "nicht installiert" gilt auch für den nächsten Lauf
+    restored = HostFacts(facts.cachefile)
+    monkeypatch.setattr(hostfacts, 'fastd_version', lambda binary: pytest.fail("not cached"))
+    with pytest.raises(FileNotFoundError):
+        restored.fastd_version()
+
+def test_fastd_installed_later(facts, monkeypatch, tmp_path):
+    monkeypatch.setattr(hostfacts, 'fastd_binary', lambda: None)
+    with pytest.raises(FileNotFoundError):
+        facts.fastd_version()
+    fastd = tmp_path / 'fastd'
+    fastd.write_text('#!/bin/sh\necho "fastd v22"\n')
+    fastd.chmod(0o755)
+    monkeypatch.setattr(hostfacts, 'fastd_binary', lambda: str(fastd))
+    assert facts.fastd_version() == 'v22'
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+"""
+ItemCache aus alfred-announce.py: Timeout, verspätete Ergebnisse und
+die Metriken dazu
+"""
+
+import time
+import threading
+
+import pytest
+
+from conftest import load_script
+from ffpi.metrics import Metrics
+
+announce = load_script('alfred-announce.py', 'alfred_announce')
+
+@pytest.fixture
+def slow():
+    # Item, das erst nach release.set() fertig wird
+    release = threading.Event()
+    def fn():
+        release.wait(5)
+        return 42
+    yield release, fn
+    release.set()
+
+def wait_late(cache):
+    # Bis das verspätete Ergebnis in der Warteschlange liegt
+    deadline = time.monotonic() + 5
+    while cache.late.empty() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def test_timeout_counted_once(slow):
+    release, fn = slow
+    metrics = Metrics()
+    cache = announce.ItemCache({'slow': {'interval': 60, 'exec': fn, 'timeout': 0.05}}, metrics=metrics)
+    cache.update(now=0)
+    assert 'slow' in cache.stale
+    assert metrics.items['slow']['runs'] == 1
+    assert metrics.items['slow']['failures'] == 1
+    assert metrics.items['slow']['stale'] == 1
+    release.set()
+    wait_late(cache)
+    cache.collect_late()
+    # Das verspätete Ergebnis zählt nicht als weiterer Durchlauf
+    assert cache.value['slow'] == 42
+    assert cache.running == {}
+    assert metrics.items['slow']['runs'] == 1
+
+def test_still_running_not_counted(slow):
+    release, fn = slow
+    metrics = Metrics()
+    cache = announce.ItemCache({'slow': {'interval': 0, 'exec': fn, 'timeout': 0.05}}, metrics=metrics)
+    cache.update(now=0)
+    cache.update(now=1)
+    assert metrics.items['slow']['runs'] == 1
+    assert metrics.items['slow']['stale'] == 1
+    assert 'slow' in cache.stale
+
+def test_failure_and_recovery():
+    metrics = Metrics()
+    calls = []
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("kaputt")
+        return len(calls)
+    cache = announce.ItemCache({'item': {'interval': 60, 'exec': fn}}, metrics=metrics)
+    cache.update(now=0)
+    assert 'item' in cache.stale and 'item' not in cache.value
+    # Fehlgeschlagene Items sind sofort wieder fällig
+    cache.update(now=1)
+    assert cache.value['item'] == 2
+    assert 'item' not in cache.stale
+    assert metrics.items['item']['runs'] == 2
+    assert metrics.items['item']['failures'] == 1
+    assert metrics.items['item']['stale'] == 0
+
+def test_inline():
+    metrics = Metrics()
+    cache = announce.ItemCache({'item': {'interval': 60, 'exec': lambda: 'x'}}, metrics=metrics)
+    assert cache.update(now=0, inline=True) == {'item': 'x'}
+    assert metrics.items['item']['runs'] == 1
+
+def test_late_result_clears_stale(slow):
+    release, fn = slow
+    metrics = Metrics()
+    cache = announce.ItemCache({'slow': {'interval': 60, 'exec': fn, 'timeout': 0.05}}, metrics=metrics)
+    cache.update(now=0)
+    assert 'slow' in cache.stale
+    release.set()
+    wait_late(cache)
+    # Übernommen wird erst im nächsten Durchlauf im Hauptthread
+    assert 'slow' not in cache.value
+    assert 'slow' in cache.stale
+    cache.update(now=1)
+    assert cache.value['slow'] == 42
+    assert 'slow' not in cache.stale
+    assert metrics.items['slow']['stale'] == 0
+    assert 'item.stale[slow] 0' in metrics.zabbix()
+
+def test_redis_items_opt_in(monkeypatch, tmp_path):
+    monkeypatch.setitem(announce.cfg, 'statics', str(tmp_path / 'statics.json'))
+    site = announce.Site('ffpi', 'lo')
+    announcer = announce.Announcer(announce.item, announce.site_item, [site])
+    assert 'statistics.tunnels' not in announcer.cache.items
+    monkeypatch.setitem(announce.cfg, 'redis', ('127.0.0.1', 7000))
+    announcer = announce.Announcer(announce.item, announce.site_item, [site])
+    assert 'statistics.tunnels' in announcer.cache.items
+    assert announcer.cache.store.port == 7000
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""
+ffpi.leases: stückweises Zerlegen und LeaseTracker
+"""
+
+import os
+import re
+import datetime
+
+import pytest
+
+from ffpi import leases
+from ffpi.leases import LeaseTracker, iter_leases, scan_leases
+from fixtures import write_leases
+
+NOW = 1760000000
+
+BLOCK = ("lease 10.137.9.{0} {{\n"
+         "  starts 3 2025/10/09 08:00:00;\n"
+         "  ends 3 2025/10/09 10:00:00;\n"
+         "  binding state active;\n"
+         "  hardware ethernet 06:00:00:00:09:{0:02x};\n"
+         "}}\n")
+
+def regex_count(filename, now):
+    # count_dhcp_leases() aus dhcpd-leases.py vor der Umstellung auf
+    # ffpi.leases, nur mit Dateiname und Zeitpunkt als Parameter
+    regex_leaseblock = re.compile(r"lease (?P<ip>\d+\.\d+\.\d+\.\d+) {(?P<config>[\s\S]+?)\n}")
+    regex_properties = re.compile(r"\s+(?P<key>\S+) (?P<value>[\s\S]+?);")
+    utcnow = datetime.datetime.utcfromtimestamp(now)
+    with open(filename) as lease_file:
+        macs = set()
+        for match in regex_leaseblock.finditer(lease_file.read()):
+             block = match.groupdict()
+             properties = {key: value for (key, value) in regex_properties.findall(block['config'])}
+             if properties['binding'].split(' ')[1] == 'active' and properties['ends'] != 'never':
+                 dt_ends = datetime.datetime.strptime(properties['ends'][2:], "%Y/%m/%d %H:%M:%S")
+                 if dt_ends > utcnow and properties['hardware'].startswith('ethernet'):
+                     macs.add(properties['hardware'][9:])
+    return len(macs)
+
+@pytest.mark.parametrize('blocks', [1, 300, 2000])
+def test_same_count_as_regex_version(tmp_path, blocks):
+    filename = write_leases(str(tmp_path / 'dhcpd.leases'), blocks, now=NOW)
+    tracker = LeaseTracker(filename)
+    tracker.update(NOW - 3600)
+    # Der Tracker läßt abgelaufene Blöcke fallen, also nur vorwärts
+    for now in (NOW - 3600, NOW - 600, NOW, NOW + 1800):
+        expected = regex_count(filename, now)
+        assert scan_leases(filename, now).count == expected
+        assert tracker.count(now) == expected
+
+def test_small_chunks(tmp_path, monkeypatch):
+    filename = write_leases(str(tmp_path / 'dhcpd.leases'), 300, now=NOW)
+    expected = list(iter_leases(filename))
+    monkeypatch.setattr(leases, 'CHUNKSIZE', 97)
+    assert list(iter_leases(filename)) == expected
+    assert len(expected) == 300
+
+def test_offsets_point_behind_blocks(tmp_path):
+    filename = str(tmp_path / 'dhcpd.leases')
+    with open(filename, 'w') as fh:
+        fh.write(BLOCK.format(1) + BLOCK.format(2))
+    with open(filename, 'rb') as fh:
+        offsets = [offset for offset, lease in leases.parse_blocks(fh)]
+    assert offsets == [len(BLOCK.format(1)), os.path.getsize(filename)]
+
+def test_tracker_appends(tmp_path):
+    filename = write_leases(str(tmp_path / 'dhcpd.leases'), 200, now=NOW)
+    tracker = LeaseTracker(filename)
+    assert tracker.update(NOW) == 200
+    assert tracker.count(NOW) == 8
+    with open(filename, 'a') as fh:
+        fh.write(BLOCK.format(1) + BLOCK.format(2))
+        # Die IP-Adresse geht an einen anderen Client, der frühere
+        # Block zählt bis zu seinem Ablauf weiter
+        fh.write(BLOCK.format(1).replace('09:01', '09:81'))
+    assert tracker.update(NOW) == 3
+    assert tracker.update(NOW) == 0
+    assert tracker.rebuilds == 1
+    assert tracker.count(NOW) == 11
+    assert tracker.count(NOW) == scan_leases(filename, NOW).count
+    assert tracker.lookup_mac('06:00:00:00:09:01') == []
+    assert tracker.lookup_mac('06:00:00:00:09:81')[0].ip == '10.137.9.1'
+    # Nach 10:00 UTC sind alle Blöcke abgelaufen
+    assert tracker.count(NOW + 4000) == 0
+    assert tracker.active_leases(NOW + 4000) == []
+
+def test_tracker_without_trailing_newline(tmp_path):
+    filename = str(tmp_path / 'dhcpd.leases')
+    with open(filename, 'w') as fh:
+        fh.write(BLOCK.format(1) + BLOCK.format(2).rstrip('\n'))
+    tracker = LeaseTracker(filename)
+    assert tracker.update(NOW) == 2
+    assert tracker.offset == os.path.getsize(filename)
+    # Keine Neuerstellung bei jedem Aufruf
+    assert tracker.update(NOW) == 0
+    assert tracker.rebuilds == 1
+    with open(filename, 'a') as fh:
+        fh.write('\n' + BLOCK.format(3))
+    assert tracker.update(NOW) == 1
+    assert tracker.rebuilds == 1
+    assert len(tracker.leases) == 3
+
+def test_tracker_rewritten(tmp_path):
+    filename = write_leases(str(tmp_path / 'dhcpd.leases'), 100, now=NOW)
+    tracker = LeaseTracker(filename)
+    tracker.update(NOW)
+    # dhcpd legt die Datei neu an und benennt sie um
+    write_leases(filename + '.new', 50, now=NOW, seed=2)
+    os.replace(filename + '.new', filename)
+    assert tracker.update(NOW) == 50
+    assert tracker.rebuilds == 2
+    assert tracker.count(NOW) == scan_leases(filename, NOW).count
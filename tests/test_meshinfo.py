@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""
+ffpi.meshinfo und alfred-mesh.py gegen FakeAlfred
+"""
+
+import json
+import zlib
+
+import pytest
+
+from conftest import load_script
+from ffpi.alfred import AlfredClient
+from ffpi.meshinfo import MeshSnapshot, aggregate, fetch
+from fixtures import FakeAlfred
+
+NODES = 200
+
+@pytest.fixture(scope='module')
+def alfred_server(tmp_path_factory):
+    server = FakeAlfred(str(tmp_path_factory.mktemp('alfred') / 'alfred.sock'), nodes=NODES).start()
+    yield server
+    server.stop()
+
+@pytest.mark.parametrize('workers,threshold', [(1, 64), (2, 0)], ids=['inline', 'pool'])
+def test_only_changed_nodes_decoded(alfred_server, workers, threshold):
+    client = AlfredClient(alfred_server.sockpath)
+    mesh = MeshSnapshot(workers, threshold)
+    try:
+        assert mesh.update(fetch(client)) == 2 * NODES
+        # Bei jeder Abfrage ändert sich die Statistik eines Zehntels
+        assert mesh.update(fetch(client)) == NODES // 10
+    finally:
+        mesh.close()
+    assert len(mesh.nodes) == NODES
+    assert mesh.errors == {}
+    aggregates = mesh.aggregates()
+    assert aggregates['nodes'] == NODES
+    assert len(aggregates['gateways']) == NODES // 50
+    assert sum(aggregates['firmware'].values()) == NODES
+
+def test_removed_and_broken_records():
+    mesh = MeshSnapshot(1)
+    blob = zlib.compress(json.dumps({'hostname': 'a'}).encode('utf-8'))
+    mesh.update({158: {'02:00:00:00:00:01': blob, '02:00:00:00:00:02': blob}, 159: {}})
+    mesh.update({158: {'02:00:00:00:00:01': b'kaputt'}, 159: {}})
+    assert mesh.nodes == {}
+    assert list(mesh.errors) == [('nodeinfo', '02:00:00:00:00:01')]
+    assert mesh.stats['removed'] == 1
+    # Unveränderte fehlerhafte Daten werden nicht erneut zerlegt
+    assert mesh.update({158: {'02:00:00:00:00:01': b'kaputt'}, 159: {}}) == 0
+
+def test_aggregate():
+    nodes = {
+        'gw': {'nodeinfo': {'hostname': 'gw', 'vpn': True,
+                            'software': {'firmware': {'base': 'Debian', 'release': '12.7'}}},
+               'statistics': {'peers': 7, 'leases': 3}},
+        'n1': {'nodeinfo': {'software': {'batman_adv': {'version': '2023.3'}}},
+               'statistics': {'leases': True}},
+        'n2': {'statistics': {}},
+    }
+    result = aggregate(nodes)
+    assert result['clients'] == 3
+    assert result['gateways'] == {'gw': {'hostname': 'gw', 'peers': 7}}
+    assert result['firmware'] == {'Debian 12.7': 1, 'unknown': 2}
+    assert result['batman_adv'] == {'2023.3': 1, 'unknown': 2}
+
+def test_cache_file(alfred_server, tmp_path):
+    client = AlfredClient(alfred_server.sockpath)
+    records = fetch(client)
+    mesh = MeshSnapshot(1)
+    mesh.update(records)
+    cachefile = str(tmp_path / 'cache' / 'alfred-mesh.json')
+    mesh.save(cachefile)
+    output = str(tmp_path / 'meshinfo.json')
+    mesh.write(output, now=0)
+    restored = MeshSnapshot(1)
+    assert restored.load(cachefile)
+    assert restored.update(records) == 0
+    assert restored.nodes == mesh.nodes
+    with open(output) as fh:
+        assert json.load(fh)['aggregates']['nodes'] == NODES
+
+def test_alfred_mesh_run_once(alfred_server, tmp_path, capsys):
+    module = load_script('alfred-mesh.py', 'alfred_mesh')
+    module.cfg.update(output=str(tmp_path / 'meshinfo.json'), cachefile=None)
+    mesh = MeshSnapshot(1)
+    assert module.run_once(AlfredClient(alfred_server.sockpath), mesh, as_json=True)
+    assert json.loads(capsys.readouterr().out)['nodes'] == NODES
+    assert not module.run_once(AlfredClient(str(tmp_path / 'missing.sock')), mesh, quiet=True)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""
+ffpi.traffic mit nachgebildetem ioctl (FakeEthtoolBackend) und einem
+sysfs-Verzeichnis im Temp-Verzeichnis
+"""
+
+from ffpi.traffic import SysfsBackend, TrafficSampler, backend_for, traffic_from_stats
+from fixtures import BATADV_COUNTERS, FakeEthtoolBackend
+
+class ResettingBackend(object):
+    # Zähler, die nach dem zweiten Abruf wieder bei 0 beginnen
+    def __init__(self):
+        self.values = [{'tx': 100, 'tx_bytes': 1000}, {'tx': 200, 'tx_bytes': 2000},
+                       {'tx': 5, 'tx_bytes': 50}]
+
+    def read(self):
+        return self.values.pop(0)
+
+def test_ethtool_counters():
+    backend = FakeEthtoolBackend('bat0')
+    stats = backend.read()
+    assert list(stats) == list(BATADV_COUNTERS)
+    assert stats['tx'] == 1000
+    assert stats['rx_bytes'] == 5000
+    assert backend.read()['tx'] == 2000
+    assert backend.calls == 2
+
+def test_ethtool_counters_changed():
+    backend = FakeEthtoolBackend('bat0')
+    backend.read()
+    names = backend.names
+    # Gleiche Anzahl: die Namen werden nicht erneut gelesen
+    backend.read()
+    assert backend.names is names
+    # Neu geladenes Modul mit zusätzlichem Zähler
+    backend.counters = BATADV_COUNTERS + ('tp_meter_tx',)
+    stats = backend.read()
+    assert len(stats) == len(BATADV_COUNTERS) + 1
+    assert stats['tp_meter_tx'] == (len(BATADV_COUNTERS) + 1) * 3000
+    backend.counters = BATADV_COUNTERS[:5]
+    assert list(backend.read()) == list(BATADV_COUNTERS[:5])
+
+def test_traffic_structure():
+    traffic = traffic_from_stats({'tx': 1, 'tx_bytes': 2, 'tx_dropped': 3, 'forward': 4,
+                                  'mgmt_rx_bytes': 5, 'frag_tx': 6})
+    assert traffic == {'tx': {'packets': 1, 'bytes': 2, 'dropped': 3},
+                       'rx': {},
+                       'forward': {'packets': 4},
+                       'mgmt_tx': {},
+                       'mgmt_rx': {'bytes': 5}}
+
+def test_rates_and_deltas():
+    sampler = TrafficSampler('bat0', backend=FakeEthtoolBackend('bat0'))
+    assert sampler.traffic() is None
+    for t in (0, 5, 10):
+        sampler.sample(now=t)
+    tx = sampler.traffic()['tx']
+    assert tx['packets'] == 3000
+    assert tx['packets_rate'] == 200.0
+    assert tx['packets_delta'] == 1000
+    assert tx['bytes_delta'] == 2000
+
+def test_counter_reset_clears_samples():
+    sampler = TrafficSampler('bat0', backend=ResettingBackend())
+    for t in (0, 1, 2):
+        sampler.sample(now=t)
+    assert len(sampler.samples) == 1
+    assert 'packets_rate' not in sampler.traffic()['tx']
+
+def test_sysfs_backend(tmp_path):
+    path = tmp_path / 'bat0' / 'statistics'
+    path.mkdir(parents=True)
+    for name, filename in SysfsBackend.mapping.items():
+        (path / filename).write_text('{}\n'.format(len(name)))
+    stats = SysfsBackend('bat0', sysfs=str(tmp_path)).read()
+    assert stats['rx_bytes'] == len('rx_bytes')
+    assert traffic_from_stats(stats)['tx'] == {'packets': 2, 'bytes': 8, 'dropped': 10}
+
+def test_fallback_without_ethtool():
+    assert isinstance(backend_for('ffpi-missing0'), SysfsBackend)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+"""
+traffic-stats.py: Abtasten und Ausgabe nur bei Änderungen
+"""
+
+import os
+
+import pytest
+
+from conftest import load_script
+
+NOW = 1760000000
+
+@pytest.fixture
+def stats(tmp_path, monkeypatch):
+    module = load_script('traffic-stats.py', 'traffic_stats')
+    counters = {'bat0': [1000, 2000], 'eth0': [0, 0]}
+    monkeypatch.setitem(module.cfg, 'datadir', str(tmp_path / 'traffic'))
+    monkeypatch.setitem(module.cfg, 'target', str(tmp_path / 'html'))
+    monkeypatch.setitem(module.cfg, 'interfaces', sorted(counters))
+    monkeypatch.setattr(module, 'read_counters', lambda iface: tuple(counters[iface]))
+    rendered = []
+    render_interface = module.render_interface
+    def counting(iface, db, target, now):
+        rendered.append(iface)
+        render_interface(iface, db, target, now)
+    monkeypatch.setattr(module, 'render_interface', counting)
+    os.makedirs(module.cfg['target'])
+    return module, counters, rendered
+
+def test_render_only_when_changed(stats):
+    module, counters, rendered = stats
+    module.run(now=NOW)
+    assert sorted(rendered) == ['bat0', 'eth0']
+    assert os.path.exists(os.path.join(module.cfg['target'], 'index.html'))
+    del rendered[:]
+    module.run(now=NOW + 3600)
+    assert rendered == []
+    counters['bat0'][0] += 500
+    # Bruchteile einer Sekunde dürfen den Vergleich nicht stören
+    module.run(now=NOW + 7200.7)
+    assert rendered == ['bat0']
+    del rendered[:]
+    module.run(now=NOW + 7200.9)
+    module.run(now=NOW + 10800)
+    assert rendered == []
+    stamp = module.stamp_file(module.cfg['target'], 'bat0')
+    assert os.stat(stamp).st_mtime == NOW + 7200
+
+def test_render_only(stats):
+    module, counters, rendered = stats
+    module.run(sample=False, now=NOW)
+    assert sorted(rendered) == ['bat0', 'eth0']
+    assert not os.path.exists(module.cfg['datadir'])
+    os.unlink(os.path.join(module.cfg['target'], 'index.html'))
+    module.run(sample=False, now=NOW)
+    assert sorted(rendered) == ['bat0', 'eth0']
+    assert os.path.exists(os.path.join(module.cfg['target'], 'index.html'))
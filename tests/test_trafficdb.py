@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+"""
+ffpi.trafficdb: Anlegen, Fortschreiben und unbrauchbare Dateien
+"""
+
+import os
+
+from ffpi.trafficdb import TrafficDB, periods, DAYS
+
+NOW = 1760000000
+
+def test_roundtrip(tmp_path):
+    filename = str(tmp_path / 'traffic' / 'bat0.db')
+    db = TrafficDB(filename)
+    db.sample(1000, 2000, now=NOW)
+    assert db.sample(1500, 2600, now=NOW + 60)
+    db.save()
+    assert os.path.getsize(filename) == db.size
+    assert os.listdir(os.path.dirname(filename)) == ['bat0.db']
+    # Zähler zurückgesetzt: der neue Stand zählt ganz
+    restored = TrafficDB(filename)
+    assert restored.sample(100, 100, now=NOW + 120)
+    restored.save()
+    db = TrafficDB(filename)
+    assert db.total == [600, 700]
+    hour = periods(NOW)[0]
+    assert db.series('hourly', 1, now=NOW + 120) == [(hour, 600, 700)]
+
+def test_damaged_file_rotated(tmp_path):
+    filename = str(tmp_path / 'bat0.db')
+    with open(filename, 'wb') as fh:
+        fh.write(b'garbage')
+    db = TrafficDB(filename)
+    assert db.rotated == filename + '.bad'
+    assert db.total == [0, 0]
+    with open(db.rotated, 'rb') as fh:
+        assert fh.read() == b'garbage'
+    db.sample(1, 1, now=NOW)
+    db.save()
+    assert TrafficDB(filename).rotated is None
+
+def test_wrong_magic_rotated(tmp_path):
+    filename = str(tmp_path / 'bat0.db')
+    db = TrafficDB(filename)
+    db.save()
+    with open(filename, 'r+b') as fh:
+        fh.write(b'XXXX')
+    assert TrafficDB(filename).rotated == filename + '.bad'
+    assert not os.path.exists(filename)
+
+def test_top_only_days_in_ring(tmp_path):
+    db = TrafficDB(str(tmp_path / 'bat0.db'))
+    db.add(5000, 5000, now=NOW)
+    # Gleiche Position im Ring, aber DAYS Tage später
+    later = NOW + DAYS * 86400
+    db.add(10, 10, now=later - 86400)
+    assert [day for day, rx, tx in db.top(10, now=NOW)] == [periods(NOW)[1]]
+    assert [day for day, rx, tx in db.top(10, now=later)] == [periods(later - 86400)[1]]
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+fastd-tunneld.py: Hook-Datagramme, gesammeltes Schreiben und Abgleich
+gegen FakeFastd und FakeCluster
+"""
+
+import os
+import socket
+import asyncio
+
+import pytest
+
+from conftest import load_script
+from ffpi.tunnels import TunnelWriter, GATE_PREFIX, collect_async
+
+from fixtures import FakeCluster, FakeFastd
+
+PEERS = 20
+
+@pytest.fixture
+def tunneld():
+    module = load_script('fastd-tunneld.py', 'fastd_tunneld')
+    module.cfg.update(batch=0.05, sweep=60, lookup_delays=(0, 0.01), timeout=2.0)
+    return module
+
+@pytest.fixture
+def fastd(tmp_path):
+    server = FakeFastd(str(tmp_path / 'fastd.sock'), peers=PEERS).start()
+    yield server
+    server.stop()
+
+def send(sockpath, *datagrams):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        for data in datagrams:
+            sock.sendto(data, sockpath)
+
+async def until(condition, timeout=5.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+def run(receiver, sockpath, scenario):
+    """
+    Receiver.run() starten, scenario() ausführen und den Daemon wie mit
+    SIGTERM beenden
+    """
+    async def main():
+        task = asyncio.ensure_future(receiver.run(sockpath))
+        await until(lambda: os.path.exists(sockpath))
+        try:
+            await scenario()
+        finally:
+            receiver.stop.set()
+            await task
+    asyncio.run(main())
+
+def commands(pipeline, name):
+    return [args for cmd, args, kwargs in pipeline if cmd == name]
+
+def test_events_batched(tunneld, fastd, tmp_path):
+    rc = FakeCluster()
+    writer = TunnelWriter(rc, 'gw01', str(tmp_path / 'state.json'))
+    receiver = tunneld.Receiver(writer, {'ffpi': fastd.sockpath})
+    sockpath = str(tmp_path / 'tunneld.sock')
+    async def scenario():
+        # Der erste Abgleich schreibt den vollständigen Stand
+        await until(lambda: rc.pipelines)
+        tunnels = sorted(writer.state['tunnels'].items())
+        assert len(receiver.by_key) == len(tunnels)
+        (tid1, key1), (tid2, key2), (tid3, key3) = tunnels[:3]
+        send(sockpath,
+             'disestablish ffpi {}'.format(key1).encode(),
+             'disestablish ffpi {}'.format(key2).encode(),
+             b'\xff\xfe kaputt',
+             b'establish',
+             # Mehrere Ereignisse eines Tunnels: das letzte gilt
+             'establish ffpi {}'.format(key2).encode(),
+             'disestablish ffpi {}'.format(key3).encode(),
+             'establish ffpi {}'.format(key3).encode())
+        await until(lambda: len(rc.pipelines) == 2)
+        await asyncio.sleep(0.2)
+        assert len(rc.pipelines) == 2
+        pipeline = rc.pipelines[1]
+        assert commands(pipeline, 'srem') == [(GATE_PREFIX + 'gw01', tid1)]
+        assert sorted(commands(pipeline, 'sadd')[0][1:]) == [tid2, tid3]
+        assert tid1 not in writer.state['tunnels']
+    run(receiver, sockpath, scenario)
+
+def test_lookup_and_early_sweep(tunneld, fastd, tmp_path, monkeypatch):
+    # Ohne Abgleich sind alle Schlüssel unbekannt
+    sweeps = []
+    async def no_sweep(instances, timeout):
+        sweeps.append(instances)
+        return None
+    monkeypatch.setattr(tunneld, 'collect_async', no_sweep)
+    rc = FakeCluster()
+    writer = TunnelWriter(rc, 'gw01', str(tmp_path / 'state.json'))
+    receiver = tunneld.Receiver(writer, {'ffpi': fastd.sockpath})
+    sockpath = str(tmp_path / 'tunneld.sock')
+    async def scenario():
+        await until(lambda: sweeps)
+        tunnels = await collect_async({'ffpi': fastd.sockpath})
+        tid, key = sorted(tunnels.items())[0]
+        send(sockpath, 'establish ffpi {}'.format(key).encode())
+        await until(lambda: rc.pipelines)
+        assert commands(rc.pipelines[0], 'sadd') == [(GATE_PREFIX + 'gw01', tid)]
+        assert receiver.by_key[key] == tid
+        assert len(sweeps) == 1
+        # Nicht gefunden: der Abgleich wird vorgezogen
+        send(sockpath, 'establish ffpi {}'.format('f' * 64).encode())
+        await until(lambda: len(sweeps) == 2)
+        assert len(rc.pipelines) == 1
+    run(receiver, sockpath, scenario)
+
+def test_retry_and_final_flush(tunneld, tmp_path, monkeypatch):
+    async def no_sweep(instances, timeout):
+        return None
+    monkeypatch.setattr(tunneld, 'collect_async', no_sweep)
+    # Erneuter Versuch nach sweep/10
+    tunneld.cfg['sweep'] = 0.5
+    rc = FakeCluster()
+    rc.errors.append(OSError("Connection refused"))
+    writer = TunnelWriter(rc, 'gw01', str(tmp_path / 'state.json'))
+    writer.state = {'tunnels': {'020000000001': 'a' * 64, '020000000002': 'b' * 64}}
+    receiver = tunneld.Receiver(writer, {})
+    sockpath = str(tmp_path / 'tunneld.sock')
+    async def scenario():
+        send(sockpath, 'disestablish ffpi {}'.format('a' * 64).encode())
+        await until(lambda: rc.pipelines)
+        assert not rc.errors
+        assert commands(rc.pipelines[0], 'srem') == [(GATE_PREFIX + 'gw01', '020000000001')]
+        # Beim Beenden noch gesammelte Ereignisse werden geschrieben
+        tunneld.cfg['batch'] = 60
+        send(sockpath, 'disestablish ffpi {}'.format('b' * 64).encode())
+        await until(lambda: receiver.pending)
+    run(receiver, sockpath, scenario)
+    assert len(rc.pipelines) == 2
+    assert commands(rc.pipelines[1], 'srem') == [(GATE_PREFIX + 'gw01', '020000000002')]
+    assert writer.state['tunnels'] == {}
+    assert not os.path.exists(str(tmp_path / 'tunneld.sock'))
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""
+ffpi.tunnels: TunnelWriter gegen eine nachgebildete Cluster-Pipeline
+und einen lokalen redis-server
+"""
+
+import os
+
+import pytest
+
+from ffpi import tunnels
+from ffpi.tunnels import TunnelWriter, collect, KEY_PREFIX, GATE_PREFIX, SEEN_KEY
+
+from fixtures import FakeCluster, FakeFastd, RedisServer
+
+TUNNELS = {'020000000001': 'a' * 64, '020000000002': 'b' * 64}
+
+def test_save_creates_state_directory(tmp_path):
+    statefile = str(tmp_path / 'cache' / 'ffpi' / 'fastd2redis.json')
+    writer = TunnelWriter(FakeCluster(), 'gw01', statefile)
+    writer.write(TUNNELS, now=1000)
+    assert os.path.exists(statefile)
+    # Der gespeicherte Stand wird beim nächsten Lauf verwendet
+    assert TunnelWriter(FakeCluster(), 'gw01', statefile).state['tunnels'] == TUNNELS
+
+def test_unchanged_tunnels_only_refresh_last_seen(tmp_path):
+    rc = FakeCluster()
+    writer = TunnelWriter(rc, 'gw01', str(tmp_path / 'state.json'))
+    assert writer.write(TUNNELS, now=1000) == (2, 0)
+    assert writer.write(dict(TUNNELS, **{'020000000003': 'c' * 64}), now=1060) == (1, 2)
+    hsets = [c for c in rc.pipelines[-1] if c[0] == 'hset']
+    assert sorted(len(args) for name, args, kwargs in hsets) == [1, 3, 3]
+    # Ein Lauf, eine Pipeline
+    assert len(rc.pipelines) == 2
+
+def test_collect_default_instance(tmp_path, monkeypatch):
+    # Ohne /etc/fastd/*/fastd.conf wird die Instanz ffpi abgefragt
+    server = FakeFastd(str(tmp_path / 'fastd.sock'), peers=20).start()
+    monkeypatch.setattr(tunnels, 'discover', lambda: {})
+    monkeypatch.setattr(tunnels, 'instance_socket', lambda instance: server.sockpath)
+    try:
+        found = collect()
+    finally:
+        server.stop()
+    assert found
+    assert all(len(tid) == 12 and len(key) == 64 for tid, key in found.items())
+
+def test_collect_nothing_queried(tmp_path):
+    # Kein Ergebnis ist kein leerer Schnappschuß, der alle Tunnel löscht
+    assert collect({}) is None
+    assert collect({'ffpi': str(tmp_path / 'missing.sock')}) is None
+
+@pytest.fixture
+def cluster(tmp_path):
+    reason = RedisServer.available()
+    if reason:
+        pytest.skip(reason)
+    from redis.cluster import RedisCluster, ClusterNode
+    server = RedisServer(str(tmp_path / 'redis')).start()
+    rc = RedisCluster(startup_nodes=[ClusterNode('127.0.0.1', server.port)], decode_responses=True)
+    yield rc
+    rc.close()
+    server.stop()
+
+def test_write_against_redis_server(cluster, tmp_path):
+    writer = TunnelWriter(cluster, 'gw01', str(tmp_path / 'state.json'))
+    assert writer.write(TUNNELS, now=1000) == (2, 0)
+    assert cluster.hget(KEY_PREFIX + '020000000001', 'key') == 'a' * 64
+    assert cluster.smembers(GATE_PREFIX + 'gw01') == set(TUNNELS)
+    assert writer.write({'020000000001': 'a' * 64}, now=1060) == (0, 1)
+    assert cluster.smembers(GATE_PREFIX + 'gw01') == {'020000000001'}
+    assert cluster.zscore(SEEN_KEY, '020000000001') == 1060
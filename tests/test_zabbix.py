@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""
+ffpi.zabbix: Schlüssel, ZBXD-Rahmen und Textzeilen über einen
+Unix-Socket, beantwortet von Announcer.lookup() aus alfred-announce.py
+"""
+
+import socket
+import struct
+
+import pytest
+
+from conftest import load_script
+from ffpi.zabbix import AgentServer, parse_key, ZBX_HEADER, ZBX_NOTSUPPORTED
+
+announce = load_script('alfred-announce.py', 'alfred_announce')
+
+@pytest.mark.parametrize('key,expected', [
+    ('agent.ping', ('agent.ping', [])),
+    ('statistics.peers[ffpi]', ('statistics.peers', ['ffpi'])),
+    ('statistics.traffic[,rx.bytes]', ('statistics.traffic', ['', 'rx.bytes'])),
+    ('name[a,"b c",]\n', ('name', ['a', 'b c', ''])),
+])
+def test_parse_key(key, expected):
+    assert parse_key(key) == expected
+
+def test_parse_key_invalid():
+    with pytest.raises(ValueError):
+        parse_key('name[a,b')
+
+@pytest.fixture(scope='module')
+def agent(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp('zabbix')
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setitem(announce.cfg, 'statics', str(tmp_path / 'statics.json'))
+        mp.setitem(announce.cfg, 'redis', None)
+        announcer = announce.Announcer(announce.item, announce.site_item, [announce.Site('ffpi', 'lo')])
+    announcer.cache.value.update({
+        'statistics.leases@ffpi': 17,
+        'statistics.traffic@ffpi': {'rx': {'bytes': 1234}, 'tx': {'bytes': 5678}},
+        'vpn': True,
+    })
+    server = AgentServer(announcer.lookup, sockpath=str(tmp_path / 'run' / 'zabbix.sock'))
+    server.start()
+    yield server
+    server.stop()
+
+def request(sockpath, data):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5)
+        sock.connect(sockpath)
+        sock.sendall(data)
+        sock.shutdown(socket.SHUT_WR)
+        reply = b''
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return reply
+            reply += chunk
+
+def framed(key):
+    data = key.encode('utf-8')
+    return ZBX_HEADER + struct.pack('<Q', len(data)) + data
+
+@pytest.mark.parametrize('key,value', [
+    ('agent.ping', b'1'),
+    ('vpn', b'1'),
+    # Nur eine Site: der Sitecode darf fehlen
+    ('statistics.leases', b'17'),
+    ('statistics.leases[ffpi]', b'17'),
+    ('statistics.traffic[ffpi,rx.bytes]', b'1234'),
+    ('statistics.traffic[,tx]', b'{"bytes":5678}'),
+])
+def test_text_lines(agent, key, value):
+    assert request(agent.sockpath, key.encode('utf-8') + b'\n') == value + b'\n'
+
+def test_text_not_supported(agent):
+    # Ohne \0 und Fehlermeldung, sonst landet beides im Wert von ffpi-get
+    for key in (b'unknown.item\n', b'statistics.traffic[ffpi,rx.packets]\n', b'broken[\n'):
+        assert request(agent.sockpath, key) == ZBX_NOTSUPPORTED.encode('ascii') + b'\n'
+
+def test_framed(agent):
+    reply = request(agent.sockpath, framed('statistics.traffic[ffpi,rx.bytes]'))
+    assert reply == ZBX_HEADER + struct.pack('<Q', 4) + b'1234'
+    reply = request(agent.sockpath, framed('unknown.item'))
+    assert reply[:len(ZBX_HEADER)] == ZBX_HEADER
+    length, = struct.unpack('<Q', reply[len(ZBX_HEADER):len(ZBX_HEADER) + 8])
+    body = reply[len(ZBX_HEADER) + 8:]
+    assert len(body) == length
+    assert body.startswith(ZBX_NOTSUPPORTED.encode('ascii') + b'\0')
+
+def test_framed_key_too_long(agent):
+    data = ZBX_HEADER + struct.pack('<Q', 1 << 20)
+    assert request(agent.sockpath, data) == b''
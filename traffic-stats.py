@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Verkehrsstatistik der Netzwerkinterfaces (Ersatz für vnstat/vnstati.sh)
+
+Bei jedem Aufruf werden die Zähler aus /sys/class/net/*/statistics
+gelesen und in die Statistikdateien (siehe ffpi.trafficdb)
+eingetragen. Anschließend werden die Grafiken (SVG) nur für die
+Interfaces neu erzeugt, bei denen sich seit der letzten Ausgabe etwas
+geändert hat; index.html nur dann, wenn überhaupt etwas neu erzeugt
+wurde.
+
+Aufruf z.B. stündlich über cron.hourly/statistics. Häufigere Aufrufe
+verbessern nur die Zuordnung zu den Stunden.
+
+Änderungsprotokoll
+==================
+
+Version  Datum       Änderung(en)                                           von
+-------- ----------- ------------------------------------------------------ ----
+0.1      2026-10-17  Erste Version, ersetzt vnstati.sh
+0.2      2026-10-17  Unbrauchbare Statistikdateien beiseite legen
+0.3      2026-10-17  Keine veralteten Tage in der Top-10, Vergleich mit der
+                     letzten Ausgabe in ganzen Sekunden
+
+"""
+
+import os
+import sys
+import time
+import socket
+import getopt
+import datetime
+from html import escape
+
+from ffpi.util import write_atomic
+from ffpi.trafficdb import TrafficDB, DATADIR, read_counters, interfaces
+
+__author__ = "Thomas Hooge"
+__copyright__ = "Public Domain"
+__version__ = "0.3"
+__email__ = "thomas@hoogi.de"
+__status__ = "Development"
+
+cfg = {
+    'datadir': DATADIR,
+    'target': '/var/www/html/',
+    'interfaces': None,
+}
+
+VIEWS = (
+    # Name, Ring, Anzahl, Titel, Beschriftung der Periode
+    ('hourly', 'hourly', 24, 'traffic per hour',
+     lambda p: datetime.datetime.fromtimestamp(p * 3600).strftime('%H')),
+    ('daily', 'daily', 30, 'traffic per day',
+     lambda p: datetime.date.fromordinal(p).strftime('%d')),
+    ('monthly', 'monthly', 12, 'traffic per month',
+     lambda p: datetime.date(p // 12, p % 12 + 1, 1).strftime('%b')),
+)
+
+def human(n):
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+        if n < 1024 or unit == 'TiB':
+            return "{:.1f} {}".format(n, unit) if unit != 'B' else "{} B".format(n)
+        n /= 1024.0
+
+def svg_chart(title, series, label, width=500, height=200):
+    """
+    Balkendiagramm rx/tx nebeneinander je Periode
+    """
+    top, bottom, left = 24, 20, 70
+    plot_h = height - top - bottom
+    plot_w = width - left - 10
+    peak = max([max(rx, tx) for p, rx, tx in series] + [1])
+    step = plot_w / max(len(series), 1)
+    bar = max(step / 2 - 1, 1)
+    out = ['<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="{}" '
+           'font-family="sans-serif" font-size="10">'.format(width, height),
+           '<rect width="100%" height="100%" fill="#fff"/>',
+           '<text x="{}" y="14" font-size="12">{}</text>'.format(left, escape(title))]
+    for frac in (0, 0.5, 1):
+        y = top + plot_h * (1 - frac)
+        out.append('<line x1="{}" y1="{:.1f}" x2="{}" y2="{:.1f}" stroke="#ccc"/>'.format(left, y, width - 10, y))
+        out.append('<text x="{}" y="{:.1f}" text-anchor="end">{}</text>'.format(left - 4, y + 3, human(int(peak * frac))))
+    for n, (period, rx, tx) in enumerate(series):
+        x = left + n * step
+        for offset, value, color in ((0, rx, '#3a7'), (bar, tx, '#37c')):
+            h = plot_h * value / peak
+            out.append('<rect x="{:.1f}" y="{:.1f}" width="{:.1f}" height="{:.1f}" fill="{}"/>'.format(
+                x + offset, top + plot_h - h, bar, h, color))
+        out.append('<text x="{:.1f}" y="{}" text-anchor="middle">{}</text>'.format(
+            x + step / 2, height - 6, escape(label(period))))
+    out.append('</svg>')
+    return '\n'.join(out)
+
+def summary_html(iface, db, now):
+    today = db.series('daily', 1, now)[0]
+    month = db.series('monthly', 1, now)[0]
+    rows = [('today', today[1], today[2]), ('this month', month[1], month[2]),
+            ('total', db.total[0], db.total[1])]
+    html = ['<table>', '<tr><th>{}</th><th>rx</th><th>tx</th></tr>'.format(escape(iface))]
+    for name, rx, tx in rows:
+        html.append('<tr><td>{}</td><td>{}</td><td>{}</td></tr>'.format(name, human(rx), human(tx)))
+    html.append('<tr><th colspan="3">top 10 days</th></tr>')
+    for day, rx, tx in db.top(10, now):
+        html.append('<tr><td>{}</td><td>{}</td><td>{}</td></tr>'.format(
+            datetime.date.fromordinal(day).isoformat(), human(rx), human(tx)))
+    html.append('</table>')
+    return '\n'.join(html)
+
+def render_interface(iface, db, target, now):
+    for view, ring, count, title, label in VIEWS:
+        svg = svg_chart("{} - {}".format(iface, title), db.series(ring, count, now), label)
+        write_atomic(os.path.join(target, '{}_{}.svg'.format(iface, view)), svg)
+
+def render_index(dbs, target, now):
+    html = ['<!DOCTYPE html>', '<html lang="en">', '<head>',
+            '<meta charset="utf-8">',
+            '<title>{} - Network Traffic</title>'.format(escape(socket.gethostname())),
+            '</head>', '<body style="white-space: nowrap">']
+    for iface, db in sorted(dbs.items()):
+        html.append('<div style="display:inline-block;vertical-align: top">')
+        html.append(summary_html(iface, db, now))
+        for view, ring, count, title, label in VIEWS:
+            html.append('<br><img src="{}_{}.svg" alt="{}">'.format(escape(iface), view, title))
+        html.append('</div>')
+    html.append('</body></html>')
+    write_atomic(os.path.join(target, 'index.html'), '\n'.join(html))
+
+def stamp_file(target, iface):
+    return os.path.join(target, '{}_hourly.svg'.format(iface))
+
+def run(sample=True, render=True, now=None):
+    if now is None:
+        now = time.time()
+    names = cfg['interfaces'] or interfaces()
+    dbs = {}
+    for iface in names:
+        db = TrafficDB(os.path.join(cfg['datadir'], iface + '.db'))
+        if db.rotated:
+            print("{}: damaged statistics moved to {}".format(iface, db.rotated), file=sys.stderr)
+        if sample:
+            try:
+                db.sample(*read_counters(iface), now=now)
+            except OSError as err:
+                # Interface (vorübergehend) nicht vorhanden
+                print("{}: {}".format(iface, err), file=sys.stderr)
+            else:
+                db.save()
+        dbs[iface] = db
+    if not render:
+        return
+    changed = False
+    for iface, db in dbs.items():
+        stamp = stamp_file(cfg['target'], iface)
+        try:
+            rendered = int(os.stat(stamp).st_mtime)
+        except OSError:
+            rendered = None
+        if rendered != db.last_change:
+            render_interface(iface, db, cfg['target'], now)
+            # Die Grafik trägt den Zeitpunkt der letzten Änderung (ganze
+            # Sekunden wie last_change), nicht den der Ausgabe
+            os.utime(stamp, (db.last_change, db.last_change))
+            changed = True
+    if changed or not os.path.exists(os.path.join(cfg['target'], 'index.html')):
+        render_index(dbs, cfg['target'], now)
+
+def usage():
+    print("Traffic statistics")
+    print("Version {}".format(__version__))
+    print()
+    print("Options")
+    print(" -h               show this help")
+    print(" -s               only sample, do not render")
+    print(" -r               only render, do not sample")
+    print(" -i <interface>   interface, may be repeated (default: all but lo)")
+    print(" -d <dir>         data directory (default {})".format(cfg['datadir']))
+    print(" -o <dir>         output directory (default {})".format(cfg['target']))
+    print()
+
+if __name__ == '__main__':
+    sample = True
+    render = True
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hsri:d:o:",
+            ["help", "sample-only", "render-only", "interface=", "datadir=", "output="])
+    except getopt.GetoptError as err:
+        print(str(err))
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(1)
+        elif opt in ("-s", "--sample-only"):
+            render = False
+        elif opt in ("-r", "--render-only"):
+            sample = False
+        elif opt in ("-i", "--interface"):
+            cfg['interfaces'] = (cfg['interfaces'] or []) + [arg]
+        elif opt in ("-d", "--datadir"):
+            cfg['datadir'] = arg
+        elif opt in ("-o", "--output"):
+            cfg['target'] = arg
+    run(sample, render)